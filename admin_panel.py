@@ -1,11 +1,21 @@
 import streamlit as st
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import RealDictCursor, execute_values
 import pandas as pd
+import numpy as np
 from datetime import datetime, date, time, timedelta
+import io
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, perf_counter
 from dotenv import load_dotenv
 
+import cache
+import clock
+import snapshot
+
 # Загружаем переменные из .env файла (для локальной разработки)
 load_dotenv()
 
@@ -18,8 +28,47 @@ st.set_page_config(
 
 # --- КОНФИГУРАЦИЯ ИЗ ПЕРЕМЕННЫХ ОКРУЖЕНИЯ ---
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
+# Необязательная реплика для тяжёлых чтений: список смен, статистика, экспорт
+READ_DATABASE_URL = os.environ.get('READ_DATABASE_URL', '')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
 
+# Размер пула соединений с БД и число потоков для параллельной загрузки панелей
+DB_POOL_SIZE = int(os.environ.get('ADMIN_DB_POOL_SIZE', '10'))
+PANEL_WORKERS = int(os.environ.get('ADMIN_PANEL_WORKERS', '6'))
+
+# Сколько секунд после записи через админку читаем с основной БД, а не с реплики
+READ_AFTER_WRITE_SECONDS = float(os.environ.get('ADMIN_READ_AFTER_WRITE_SECONDS', '30'))
+
+# Сколько страниц списка смен держим в LRU-кэше
+PAGE_CACHE_SIZE = int(os.environ.get('ADMIN_PAGE_CACHE_SIZE', '32'))
+# Сколько секунд страница живёт в кэше: смены, начатые и завершённые ботом,
+# кэш не сбрасывают и появляются в списке не позже чем через это время
+PAGE_CACHE_TTL = float(os.environ.get('ADMIN_PAGE_CACHE_TTL', '30'))
+
+# Статистика и экспорт считаются по колоночному снимку смен (snapshot.py),
+# который фоновый поток обновляет раз в ADMIN_SNAPSHOT_INTERVAL секунд; 0 - по БД
+SNAPSHOT_ENABLED = os.environ.get('ADMIN_SNAPSHOT', '1') != '0'
+SNAPSHOT_INTERVAL = float(os.environ.get('ADMIN_SNAPSHOT_INTERVAL', '60'))
+
+# Варианты размера страницы в списке смен
+PAGE_SIZE_OPTIONS = [20, 50, 100, 500, 1000, 5000]
+
+# Колонки таблицы, которые можно менять (галочки открытия и выбора)
+SHIFTS_TABLE_EDITABLE = ['open', 'selected']
+
+# Колонки таблицы смен: форматирование выполняется один раз на всю колонку
+SHIFTS_TABLE_COLUMNS = {
+    'open': st.column_config.CheckboxColumn("👁️", help="Открыть смену", width="small"),
+    'selected': st.column_config.CheckboxColumn("✔", help="Выбрать для массовых действий", width="small"),
+    'id': st.column_config.NumberColumn("ID", format="#%d"),
+    'driver_id': st.column_config.NumberColumn("👤 Водитель", format="%d"),
+    'start_time': st.column_config.DatetimeColumn("📅 Начало", format="DD.MM.YYYY HH:mm"),
+    'duration_text': st.column_config.TextColumn("⏱ Длительность"),
+    'cash': st.column_config.NumberColumn("💰 Касса", format="%d руб"),
+    'hourly_rate': st.column_config.NumberColumn("📊 Средний час", format="%d руб/ч"),
+    'status': st.column_config.TextColumn("Статус"),
+}
+
 # Проверка что переменные установлены
 if not DATABASE_URL:
     st.error("❌ Ошибка: не установлена переменная DATABASE_URL")
@@ -49,109 +98,468 @@ def check_auth():
         st.stop()
 
 # --- Функции работы с БД ---
+@st.cache_resource
+def get_connection_pool():
+    """Общий пул соединений; семафор заставляет ждать свободное соединение вместо ошибки"""
+    return ThreadedConnectionPool(0, DB_POOL_SIZE, DATABASE_URL), threading.BoundedSemaphore(DB_POOL_SIZE)
+
+# Пул берём в основном потоке скрипта: фоновые потоки обращаются к этой
+# переменной, а не к st.cache_resource (у них нет контекста Streamlit)
+CONNECTION_POOL, CONNECTION_SLOTS = get_connection_pool()
+
 def get_connection():
-    """Создаёт подключение к БД"""
-    return psycopg2.connect(DATABASE_URL)
+    """Берёт подключение к БД из пула (вернуть через release_connection)"""
+    CONNECTION_SLOTS.acquire()
+    try:
+        return CONNECTION_POOL.getconn()
+    except Exception:
+        CONNECTION_SLOTS.release()
+        raise
 
-def search_shifts(driver_id=None, date_filter=None, min_cash=None, max_cash=None):
-    """Поиск смен по фильтрам"""
-    conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    query = "SELECT * FROM shifts WHERE 1=1"
-    params = []
+def return_to_pool(pool, conn):
+    """Откатывает незавершённую транзакцию и возвращает подключение в пул.
     
-    if driver_id:
-        query += " AND driver_id = %s"
-        params.append(driver_id)
-    
-    if date_filter:
-        query += " AND DATE(start_time) = %s"
-        params.append(date_filter)
-    
-    if min_cash:
-        query += " AND cash >= %s"
-        params.append(min_cash)
-    
-    if max_cash:
-        query += " AND cash <= %s"
-        params.append(max_cash)
+    Сломанное подключение (rollback не прошёл) пул закрывает - слот не теряется,
+    а исходная ошибка запроса не подменяется ошибкой отката.
+    """
+    close = bool(conn.closed)
+    if not close:
+        try:
+            conn.rollback()
+        except Exception as e:
+            print(f"⚠️ Подключение к БД сломано, закрываем его: {e}")
+            close = True
+    pool.putconn(conn, close=close)
+
+def release_connection(conn):
+    """Возвращает подключение в пул, откатывая незавершённую транзакцию"""
+    try:
+        return_to_pool(CONNECTION_POOL, conn)
+    finally:
+        CONNECTION_SLOTS.release()
+
+@st.cache_resource
+def get_read_connection_pool():
+    """Пул соединений с репликой (None без READ_DATABASE_URL) и ID выданных из него соединений"""
+    if not READ_DATABASE_URL:
+        return None, None, set()
+    return ThreadedConnectionPool(0, DB_POOL_SIZE, READ_DATABASE_URL), threading.BoundedSemaphore(DB_POOL_SIZE), set()
+
+READ_POOL, READ_SLOTS, READ_BORROWED = get_read_connection_pool()
+
+@st.cache_resource
+def get_write_marker():
+    """Момент последней записи через админку (общий для всех сессий)"""
+    return {'at': None}
+
+WRITE_MARKER = get_write_marker()
+
+def reads_use_replica():
+    """Читаем с реплики, если она есть и через админку недавно ничего не записывали"""
+    if READ_POOL is None:
+        return False
+    last_write = WRITE_MARKER['at']
+    return last_write is None or perf_counter() - last_write >= READ_AFTER_WRITE_SECONDS
+
+def get_read_connection():
+    """Подключение для чтения (вернуть через release_read_connection): реплика или основная БД"""
+    if not reads_use_replica():
+        return get_connection()
+    READ_SLOTS.acquire()
+    try:
+        conn = READ_POOL.getconn()
+    except Exception as e:
+        READ_SLOTS.release()
+        print(f"⚠️ Реплика недоступна, читаем с основной БД: {e}")
+        return get_connection()
+    READ_BORROWED.add(id(conn))
+    return conn
+
+def release_read_connection(conn):
+    """Возвращает подключение в пул, из которого его взяли"""
+    if id(conn) not in READ_BORROWED:
+        release_connection(conn)
+        return
+    READ_BORROWED.discard(id(conn))
+    try:
+        return_to_pool(READ_POOL, conn)
+    finally:
+        READ_SLOTS.release()
+
+@st.cache_resource
+def get_panel_executor():
+    """Пул потоков для параллельных запросов панелей"""
+    return ThreadPoolExecutor(max_workers=PANEL_WORKERS, thread_name_prefix="admin-panel")
+
+PANEL_EXECUTOR = get_panel_executor()
+
+def _timed_call(loader):
+    started = perf_counter()
+    result = loader()
+    return result, perf_counter() - started
+
+def load_panels(loaders):
+    """Выполняет независимые запросы параллельно.
     
-    query += " ORDER BY start_time DESC LIMIT 100"
+    loaders - словарь {имя панели: функция без аргументов}.
+    Возвращает (results, timings), время в секундах; timings['всего'] - общее время.
+    """
+    started = perf_counter()
+    futures = {name: PANEL_EXECUTOR.submit(_timed_call, loader) for name, loader in loaders.items()}
+    
+    results, timings = {}, {}
+    for name, future in futures.items():
+        results[name], timings[name] = future.result()
+    timings['всего'] = perf_counter() - started
+    return results, timings
+
+def show_panel_timings(timings):
+    """Отладочный разбор времени загрузки по панелям"""
+    with st.expander("⏱ Время загрузки панелей"):
+        st.dataframe(
+            pd.DataFrame(
+                [(name, seconds * 1000) for name, seconds in timings.items()],
+                columns=['Панель', 'мс']
+            ),
+            column_config={'мс': st.column_config.NumberColumn(format="%.1f")},
+            hide_index=True
+        )
+
+# --- Кэш страниц списка смен ---
+class PageCache:
+    """LRU-кэш страниц списка смен с ограниченным сроком жизни и подсчётом попаданий"""
+    
+    def __init__(self, max_size=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._pages = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        # Поколение растёт при каждой очистке: страницы, загруженные
+        # в фоне до записи, не должны попасть в кэш после неё
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+    
+    def get(self, key):
+        with self._lock:
+            if key in self._pages:
+                expires_at, value = self._pages[key]
+                if expires_at > monotonic():
+                    self._pages.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._pages[key]
+            self.misses += 1
+            return None
+    
+    def generation(self):
+        """Текущее поколение: берётся до загрузки страницы и передаётся в put"""
+        with self._lock:
+            return self._generation
+    
+    def put(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._pages[key] = (monotonic() + self.ttl, value)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_size:
+                self._pages.popitem(last=False)
+    
+    def start_prefetch(self, key):
+        """Помечает страницу как загружаемую; возвращает поколение или None если загружать не нужно"""
+        with self._lock:
+            if key in self._pending:
+                return None
+            if key in self._pages and self._pages[key][0] > monotonic():
+                return None
+            self._pending.add(key)
+            return self._generation
+    
+    def finish_prefetch(self, key, loaded=False):
+        with self._lock:
+            self._pending.discard(key)
+            if loaded:
+                self.prefetched += 1
+    
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._generation += 1
+    
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self._pages),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'prefetched': self.prefetched
+            }
+
+@st.cache_resource
+def get_page_cache():
+    """Общий для всех сессий кэш страниц"""
+    return PageCache()
+
+@st.cache_resource
+def get_prefetch_executor():
+    """Пул потоков для фоновой подгрузки соседних страниц"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="page-prefetch")
+
+PAGE_CACHE = get_page_cache()
+PREFETCH_EXECUTOR = get_prefetch_executor()
+
+# --- Снимок смен для аналитики ---
+def refresh_snapshot(worker):
+    """Обновляет снимок с реплики (или основной БД); ошибки запоминает для показа"""
+    with worker['lock']:
+        conn = get_read_connection()
+        try:
+            worker['last'] = snapshot.refresh(conn, snapshot.SNAPSHOT_DIR)
+            worker['error'] = None
+        except Exception as e:
+            worker['error'] = str(e)
+            print(f"⚠️ Не удалось обновить снимок смен: {e}")
+        finally:
+            release_read_connection(conn)
+
+@st.cache_resource
+def get_snapshot_worker():
+    """Фоновый поток обновления снимка (один на процесс админки)"""
+    worker = {'last': None, 'error': None, 'lock': threading.Lock(), 'wake': threading.Event()}
+    if not SNAPSHOT_ENABLED:
+        return worker
+    
+    def loop():
+        while True:
+            refresh_snapshot(worker)
+            # Запись через админку будит поток раньше срока
+            worker['wake'].wait(SNAPSHOT_INTERVAL)
+            worker['wake'].clear()
+    
+    threading.Thread(target=loop, daemon=True, name="admin-snapshot").start()
+    return worker
+
+SNAPSHOT_WORKER = get_snapshot_worker()
+
+def get_snapshot():
+    """Текущий снимок (None - выключен или ещё не создан: считаем по БД)"""
+    if not SNAPSHOT_ENABLED:
+        return None
+    try:
+        return snapshot.load(snapshot.SNAPSHOT_DIR)
+    except Exception as e:
+        print(f"⚠️ Снимок смен не читается: {e}")
+        return None
+
+def show_snapshot_freshness(snap, key):
+    """Насколько свежие данные снимка и кнопка внеочередного обновления"""
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        if snap is None:
+            st.caption("📸 Снимок смен не готов - данные из БД")
+        else:
+            st.caption(f"📸 Данные снимка на {snap.synced_at:%d.%m.%Y %H:%M:%S} "
+                       f"({snap.age_seconds():.0f} с назад), смен: {len(snap)}")
+        if SNAPSHOT_WORKER['error']:
+            st.caption(f"⚠️ Последнее обновление снимка не удалось: {SNAPSHOT_WORKER['error']}")
+    with col2:
+        if SNAPSHOT_ENABLED and st.button("🔄 Обновить снимок", key=key):
+            refresh_snapshot(SNAPSHOT_WORKER)
+            st.rerun()
+
+def invalidate_page_cache(driver_ids=()):
+    """Сбрасывает кэш страниц после любой записи через админку.
     
-    cur.execute(query, params)
-    shifts = cur.fetchall()
+    driver_ids - водители, чьи смены изменились: их итоги, карта по часам и отчеты в общем
+    кэше бота тоже сбрасываются.
+    """
+    # Следующие чтения - с основной БД, пока реплика не догонит запись
+    WRITE_MARKER['at'] = perf_counter()
+    PAGE_CACHE.clear()
+    SNAPSHOT_WORKER['wake'].set()
+    if driver_ids:
+        cache.get_cache().delete(*[key for driver_id in set(driver_ids)
+                                   for key in (cache.summary_key(driver_id), cache.heatmap_key(driver_id),
+                                               cache.reports_key(driver_id))])
+
+def page_cache_key(filters, offset, limit):
+    return (filters['driver_id'], filters['start_date'], filters['end_date'], offset, limit)
+
+def load_shifts_page(filters, page, page_size):
+    """Возвращает страницу смен из кэша или из БД"""
+    key = page_cache_key(filters, page * page_size, page_size)
+    
+    result = PAGE_CACHE.get(key)
+    if result is None:
+        # Поколение до запроса: если запись успеет сбросить кэш, страница не сохранится
+        generation = PAGE_CACHE.generation()
+        result = get_shifts_page(
+            offset=page * page_size,
+            limit=page_size,
+            driver_id=filters['driver_id'],
+            start_date=filters['start_date'],
+            end_date=filters['end_date']
+        )
+        PAGE_CACHE.put(key, result, generation=generation)
+    return result
+
+def _prefetch_page(cache, key, generation, filters, offset, limit):
+    """Загружает страницу в фоне (без обращений к st.*)"""
+    loaded = False
+    try:
+        result = get_shifts_page(
+            offset=offset,
+            limit=limit,
+            driver_id=filters['driver_id'],
+            start_date=filters['start_date'],
+            end_date=filters['end_date']
+        )
+        cache.put(key, result, generation=generation)
+        loaded = True
+    except Exception as e:
+        print(f"⚠️ Ошибка фоновой загрузки страницы {key}: {e}")
+    finally:
+        cache.finish_prefetch(key, loaded)
+
+def prefetch_adjacent_pages(filters, page, page_size, total_pages):
+    """Запускает фоновую загрузку следующей и предыдущей страниц"""
+    for neighbour in (page + 1, page - 1):
+        if not 0 <= neighbour < total_pages:
+            continue
+        key = page_cache_key(filters, neighbour * page_size, page_size)
+        generation = PAGE_CACHE.start_prefetch(key)
+        if generation is None:
+            continue
+        PREFETCH_EXECUTOR.submit(_prefetch_page, PAGE_CACHE, key, generation, dict(filters),
+                        neighbour * page_size, page_size)
+
+def show_cache_debug_sidebar():
+    """Отладочная информация о кэше страниц в боковой панели"""
+    if not st.sidebar.checkbox("🐞 Отладка", key="debug_sidebar"):
+        return
     
-    cur.close()
-    conn.close()
-    return shifts
+    stats = PAGE_CACHE.stats()
+    st.sidebar.subheader("Кэш страниц")
+    st.sidebar.metric("Попадания", f"{stats['hit_rate']:.0%}")
+    st.sidebar.write(f"Hits: {stats['hits']} / Misses: {stats['misses']}")
+    st.sidebar.write(f"Загружено в фоне: {stats['prefetched']}")
+    st.sidebar.write(f"Страниц в кэше: {stats['size']} из {PAGE_CACHE_SIZE}")
+    if READ_POOL is not None:
+        st.sidebar.write(f"Чтения: {'реплика' if reads_use_replica() else 'основная БД (после записи)'}")
+    if st.sidebar.button("Очистить кэш", key="clear_page_cache"):
+        invalidate_page_cache()
+        st.rerun()
+
+def search_shifts(driver_id=None, date_filter=None, min_cash=None, max_cash=None):
+    """Поиск смен по фильтрам"""
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        query = "SELECT * FROM shifts WHERE 1=1"
+        params = []
+        
+        if driver_id:
+            query += " AND driver_id = %s"
+            params.append(driver_id)
+        
+        if date_filter:
+            query += " AND DATE(start_time) = %s"
+            params.append(date_filter)
+        
+        if min_cash:
+            query += " AND cash >= %s"
+            params.append(min_cash)
+        
+        if max_cash:
+            query += " AND cash <= %s"
+            params.append(max_cash)
+        
+        query += " ORDER BY start_time DESC LIMIT 100"
+        
+        cur.execute(query, params)
+        shifts = cur.fetchall()
+        
+        cur.close()
+        return shifts
+    finally:
+        release_read_connection(conn)
 
 def get_shift_by_id(shift_id):
     """Получить смену по ID"""
     conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    cur.execute("""
-        SELECT 
-            id,
-            driver_id,
-            start_time,
-            end_time,
-            duration_text,
-            duration_seconds,
-            cash,
-            hourly_rate,
-            is_active,
-            is_paused,
-            pause_start_time,
-            pause_duration_seconds,
-            awaiting_cash_input,
-            created_at
-        FROM shifts 
-        WHERE id = %s
-    """, (shift_id,))
-    
-    shift = cur.fetchone()
-    
-    cur.close()
-    conn.close()
-    return shift
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        cur.execute("""
+            SELECT 
+                id,
+                driver_id,
+                start_time,
+                end_time,
+                duration_text,
+                duration_seconds,
+                cash,
+                hourly_rate,
+                is_active,
+                is_paused,
+                pause_start_time,
+                pause_duration_seconds,
+                awaiting_cash_input,
+                created_at
+            FROM shifts 
+            WHERE id = %s
+        """, (shift_id,))
+        
+        shift = cur.fetchone()
+        
+        cur.close()
+        return shift
+    finally:
+        release_connection(conn)
 
 def get_edit_history(shift_id):
     """Получить историю изменений смены"""
-    conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    cur.execute("""
-        SELECT 
-            id,
-            shift_id,
-            editor_id,
-            reason,
-            edited_at AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as edited_at,
-            old_start_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as old_start_time,
-            new_start_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as new_start_time,
-            old_end_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as old_end_time,
-            new_end_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as new_end_time,
-            old_cash,
-            new_cash
-        FROM shift_edits 
-        WHERE shift_id = %s 
-        ORDER BY edited_at DESC
-    """, (shift_id,))
-    
-    history = cur.fetchall()
-    
-    cur.close()
-    conn.close()
-    return history
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        cur.execute("""
+            SELECT 
+                id,
+                shift_id,
+                editor_id,
+                reason,
+                edited_at AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as edited_at,
+                old_start_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as old_start_time,
+                new_start_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as new_start_time,
+                old_end_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as old_end_time,
+                new_end_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow' as new_end_time,
+                old_cash,
+                new_cash
+            FROM shift_edits 
+            WHERE shift_id = %s 
+            ORDER BY edited_at DESC
+        """, (shift_id,))
+        
+        history = cur.fetchall()
+        
+        cur.close()
+        return history
+    finally:
+        release_read_connection(conn)
 
 def save_shift_edit(shift_id, editor_id, reason, old_start, new_start, old_end, new_end, old_cash, new_cash):
     """Сохраняет изменения смены"""
     conn = get_connection()
-    cur = conn.cursor()
-    
     try:
+        cur = conn.cursor()
+        
         # 1. Сохраняем в историю изменений
         cur.execute('''
             INSERT INTO shift_edits 
@@ -197,7 +605,7 @@ def save_shift_edit(shift_id, editor_id, reason, old_start, new_start, old_end,
                 duration_seconds = %s,
                 hourly_rate = %s
             WHERE id = %s
-            RETURNING id
+            RETURNING id, driver_id
         ''', (
             new_start, new_end, new_cash,
             duration_str, total_seconds, hourly_rate,
@@ -208,117 +616,200 @@ def save_shift_edit(shift_id, editor_id, reason, old_start, new_start, old_end,
         
         conn.commit()
         cur.close()
-        conn.close()
-        
-        if updated_id:
-            return True, None
-        else:
-            return False, "Смена не найдена"
-            
     except Exception as e:
-        conn.rollback()
-        cur.close()
-        conn.close()
         return False, str(e)
+    finally:
+        # Незавершённую транзакцию откатывает (или сломанное подключение закрывает) release_connection
+        release_connection(conn)
+    
+    invalidate_page_cache([updated_id[1]] if updated_id else ())
+    
+    if updated_id:
+        return True, None
+    else:
+        return False, "Смена не найдена"
 
-def get_all_shifts_paginated(offset=0, limit=20, driver_id=None, start_date=None, end_date=None):
-    """Получает смены с пагинацией и фильтрами"""
-    conn = get_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    query = """
-        SELECT 
-            id,
-            driver_id,
-            start_time,
-            end_time,
-            duration_text,
-            cash,
-            hourly_rate,
-            is_active,
-            is_paused,
-            created_at
-        FROM shifts 
-        WHERE 1=1
-    """
+def build_filter_clause(driver_id=None, start_date=None, end_date=None):
+    """Собирает WHERE для фильтров списка смен"""
+    clause = "WHERE 1=1"
     params = []
     
     if driver_id:
-        query += " AND driver_id = %s"
+        clause += " AND driver_id = %s"
         params.append(driver_id)
     
     if start_date:
-        query += " AND DATE(start_time) >= %s"  # Без конвертации
+        clause += " AND DATE(start_time) >= %s"  # Без конвертации
         params.append(start_date)
     
     if end_date:
-        query += " AND DATE(start_time) <= %s"  # Без конвертации
+        clause += " AND DATE(start_time) <= %s"  # Без конвертации
         params.append(end_date)
     
-    query += " ORDER BY start_time DESC LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
-    
-    cur.execute(query, params)
-    shifts = cur.fetchall()
-    
-    # Получаем общее количество для пагинации
-    count_query = "SELECT COUNT(*) as total FROM shifts WHERE 1=1"
-    count_params = []
-    
-    if driver_id:
-        count_query += " AND driver_id = %s"
-        count_params.append(driver_id)
-    
-    if start_date:
-        count_query += " AND DATE(start_time) >= %s"
-        count_params.append(start_date)
-    
-    if end_date:
-        count_query += " AND DATE(start_time) <= %s"
-        count_params.append(end_date)
-    
-    cur.execute(count_query, count_params)
-    total = cur.fetchone()['total']
-    
-    cur.close()
-    conn.close()
-    
+    return clause, params
+
+def get_shifts_page(offset=0, limit=20, driver_id=None, start_date=None, end_date=None):
+    """Получает одну страницу смен с фильтрами"""
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        clause, params = build_filter_clause(driver_id, start_date, end_date)
+        cur.execute(f"""
+            SELECT 
+                id,
+                driver_id,
+                start_time,
+                end_time,
+                duration_text,
+                cash,
+                hourly_rate,
+                is_active,
+                is_paused,
+                created_at
+            FROM shifts 
+            {clause}
+            ORDER BY start_time DESC LIMIT %s OFFSET %s
+        """, params + [limit, offset])
+        shifts = cur.fetchall()
+        
+        cur.close()
+        return shifts
+    finally:
+        release_read_connection(conn)
+
+def get_filter_stats(driver_id=None, start_date=None, end_date=None):
+    """Количество смен и сумма кассы по фильтрам"""
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        clause, params = build_filter_clause(driver_id, start_date, end_date)
+        cur.execute(f"SELECT COUNT(*) as total, SUM(cash) as total_cash FROM shifts {clause}", params)
+        stats = cur.fetchone()
+        
+        cur.close()
+        return stats
+    finally:
+        release_read_connection(conn)
+
+def get_all_shifts_paginated(offset=0, limit=20, driver_id=None, start_date=None, end_date=None):
+    """Получает смены с пагинацией и фильтрами"""
+    shifts = get_shifts_page(offset, limit, driver_id, start_date, end_date)
+    total = get_filter_stats(driver_id, start_date, end_date)['total']
     return shifts, total
 
 def delete_shift(shift_id):
-    """Удаляет смену и связанные записи"""
-    conn = get_connection()
-    cur = conn.cursor()
+    """Удаляет смену, в том числе активную (история изменений удаляется каскадно)"""
+    deleted_ids, error = bulk_delete_shifts([shift_id], include_active=True)
+    
+    if error:
+        return False, error
+    if deleted_ids:
+        print(f"✅ Смена #{shift_id} удалена")
+        return True, None
+    return False, "Смена не найдена"
+
+def bulk_delete_shifts(shift_ids, include_active=False):
+    """Удаляет несколько смен одним запросом.
     
+    История изменений удаляется вместе со сменами (триггер shifts_delete_edits
+    или ON DELETE CASCADE на несекционированной таблице). Активные смены
+    удаляются только с include_active (удаление одной смены со страницы смены).
+    Возвращает (deleted_ids, error).
+    """
+    conn = get_connection()
     try:
-        # Сначала удаляем историю изменений
-        cur.execute("DELETE FROM shift_edits WHERE shift_id = %s", (shift_id,))
+        cur = conn.cursor()
         
-        # Затем удаляем саму смену
-        cur.execute("DELETE FROM shifts WHERE id = %s RETURNING id", (shift_id,))
+        cur.execute('''
+            DELETE FROM shifts
+            WHERE id = ANY(%s) AND (%s OR is_active IS NOT TRUE)
+            RETURNING id, driver_id
+        ''', (list(shift_ids), include_active))
         
-        deleted_id = cur.fetchone()
+        deleted = cur.fetchall()
+        deleted_ids = [row[0] for row in deleted]
         
         conn.commit()
         cur.close()
-        conn.close()
-        
-        if deleted_id:
-            print(f"✅ Смена #{shift_id} удалена")
-            return True, None
-        else:
-            return False, "Смена не найдена"
-            
     except Exception as e:
-        conn.rollback()
+        return [], str(e)
+    finally:
+        release_connection(conn)
+    
+    invalidate_page_cache([row[1] for row in deleted])
+    
+    return deleted_ids, None
+
+def bulk_update_shifts(shift_ids, editor_id, reason, time_offset=None, new_cash=None):
+    """Массово меняет завершённые смены одной транзакцией.
+    
+    time_offset (timedelta) сдвигает начало и конец смены, new_cash задаёт кассу.
+    Средний час пересчитывается в SQL, история пишется одним execute_values.
+    Возвращает (updated_ids, error).
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        
+        cur.execute('''
+            WITH old AS (
+                SELECT id, start_time, end_time, cash, hourly_rate,
+                       COALESCE(duration_seconds,
+                                EXTRACT(EPOCH FROM end_time - start_time)::INTEGER) AS seconds
+                FROM shifts
+                WHERE id = ANY(%s) AND is_active IS NOT TRUE
+                FOR UPDATE
+            ), changed AS (
+                SELECT id,
+                       start_time + %s AS start_time,
+                       end_time + %s AS end_time,
+                       COALESCE(%s::INTEGER, cash) AS cash,
+                       seconds
+                FROM old
+            )
+            UPDATE shifts s
+            SET start_time = c.start_time,
+                end_time = c.end_time,
+                cash = c.cash,
+                hourly_rate = CASE
+                    WHEN c.seconds > 0 THEN FLOOR(c.cash / (c.seconds / 3600.0))::INTEGER
+                    ELSE 0
+                END
+            FROM old o
+            JOIN changed c ON c.id = o.id
+            WHERE s.id = o.id
+            RETURNING s.id, o.start_time, s.start_time, o.end_time, s.end_time,
+                      o.cash, s.cash, o.hourly_rate, s.hourly_rate, s.driver_id
+        ''', (list(shift_ids), time_offset or timedelta(0), time_offset or timedelta(0), new_cash))
+        
+        changes = cur.fetchall()
+        
+        execute_values(cur, '''
+            INSERT INTO shift_edits
+            (shift_id, editor_id, reason, edited_at,
+             old_start_time, new_start_time, old_end_time, new_end_time,
+             old_cash, new_cash, old_hourly_rate, new_hourly_rate)
+            VALUES %s
+        ''', [(row[0], editor_id, reason) + tuple(row[1:9]) for row in changes],
+            template="(%s, %s, %s, NOW(), %s, %s, %s, %s, %s, %s, %s, %s)")
+        
+        conn.commit()
         cur.close()
-        conn.close()
-        return False, str(e)
+    except Exception as e:
+        return [], str(e)
+    finally:
+        release_connection(conn)
+    
+    invalidate_page_cache([row[9] for row in changes])
+    
+    return [row[0] for row in changes], None
 
 def save_manual_shift(driver_id, start_time, end_time, cash, duration_str, hourly_rate):
     """Сохраняет смену, созданную вручную"""
+    conn = get_connection()
     try:
-        conn = get_connection()
         cur = conn.cursor()
         
         # Рассчитываем секунды
@@ -348,16 +839,172 @@ def save_manual_shift(driver_id, start_time, end_time, cash, duration_str, hourl
         
         conn.commit()
         cur.close()
-        conn.close()
-        
-        print(f"✅ Смена #{shift_id} создана вручную для водителя {driver_id}")
-        return True
-        
     except Exception as e:
         print(f"❌ Ошибка при сохранении ручной смены: {e}")
         import traceback
         traceback.print_exc()
         return False
+    finally:
+        release_connection(conn)
+    
+    invalidate_page_cache([driver_id])
+    
+    print(f"✅ Смена #{shift_id} создана вручную для водителя {driver_id}")
+    return True
+
+# --- Массовый импорт смен ---
+IMPORT_REQUIRED_COLUMNS = ['driver_id', 'start_time', 'end_time', 'cash']
+
+def read_import_file(uploaded_file):
+    """Читает загруженный CSV или Parquet файл в DataFrame"""
+    if uploaded_file.name.lower().endswith('.parquet'):
+        return pd.read_parquet(uploaded_file)
+    return pd.read_csv(uploaded_file, sep=None, engine='python', encoding='utf-8-sig')
+
+def format_duration_column(seconds):
+    """Векторный аналог форматирования длительности в '2 ч 15 мин'"""
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    hours_str = hours.astype(str) + " ч"
+    minutes_str = minutes.astype(str) + " мин"
+    return pd.Series(
+        np.select(
+            [(hours > 0) & (minutes > 0), hours > 0],
+            [hours_str + " " + minutes_str, hours_str],
+            default=minutes_str
+        ),
+        index=seconds.index
+    )
+
+def validate_import_frame(df):
+    """Проверяет импортируемые смены и считает производные колонки.
+    
+    Возвращает (valid, errors): valid - готовые к загрузке строки,
+    errors - отчёт вида (row_number, error) по отклонённым строкам.
+    """
+    missing = [col for col in IMPORT_REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"В файле нет колонок: {', '.join(missing)}")
+    
+    data = pd.DataFrame(index=df.index)
+    # Номер строки как в исходном файле (первая строка - заголовок)
+    data['row_number'] = df.index + 2
+    data['driver_id'] = pd.to_numeric(df['driver_id'], errors='coerce')
+    data['start_time'] = pd.to_datetime(df['start_time'], errors='coerce', dayfirst=True, format='mixed')
+    data['end_time'] = pd.to_datetime(df['end_time'], errors='coerce', dayfirst=True, format='mixed')
+    data['cash'] = pd.to_numeric(df['cash'], errors='coerce')
+    
+    duration = data['end_time'] - data['start_time']
+    known = data['driver_id'].notna() & data['start_time'].notna()
+    
+    checks = [
+        (data['driver_id'].isna() | (data['driver_id'] <= 0) | (data['driver_id'] % 1 != 0),
+         "некорректный driver_id"),
+        (data['start_time'].isna(), "некорректное время начала"),
+        (data['end_time'].isna(), "некорректное время окончания"),
+        (data['end_time'] <= data['start_time'], "окончание не позже начала"),
+        ((duration > pd.Timedelta(0)) & (duration < pd.Timedelta(seconds=1)), "смена короче секунды"),
+        # Первая из одинаковых смен загружается, повторы отклоняются
+        (known & data.duplicated(['driver_id', 'start_time']), "смена повторяется в файле"),
+        (data['cash'].isna(), "некорректная касса"),
+        (data['cash'] < 0, "отрицательная касса"),
+        (data['cash'] % 1 != 0, "касса должна быть целым числом"),
+    ]
+    
+    errors = pd.concat(
+        [data.loc[mask, ['row_number']].assign(error=message) for mask, message in checks],
+        ignore_index=True
+    )
+    # groupby сортирует по номеру строки; reset_index даёт таблицу и когда ошибок нет
+    errors = errors.groupby('row_number')['error'].agg('; '.join).reset_index()
+    
+    valid = data[~data['row_number'].isin(errors['row_number'])].copy()
+    valid['driver_id'] = valid['driver_id'].astype('int64')
+    valid['cash'] = valid['cash'].astype('int64')
+    valid['duration_seconds'] = (valid['end_time'] - valid['start_time']).dt.total_seconds().astype('int64')
+    valid['hourly_rate'] = (valid['cash'] / (valid['duration_seconds'] / 3600)).astype('int64')
+    valid['duration_text'] = format_duration_column(valid['duration_seconds'])
+    
+    return valid, errors
+
+def import_shifts(valid, reason, editor_id=0):
+    """Загружает смены через COPY во временную таблицу и переносит их
+    в shifts и shift_edits одной транзакцией.
+    
+    Смены, которые уже есть в БД (тот же водитель и время начала), пропускаются.
+    Возвращает (imported, skipped_rows, error).
+    """
+    columns = ['row_number', 'driver_id', 'start_time', 'end_time',
+               'duration_text', 'duration_seconds', 'cash', 'hourly_rate']
+    buffer = io.StringIO()
+    valid[columns].to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S')
+    buffer.seek(0)
+    
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        
+        cur.execute('''
+            CREATE TEMP TABLE shifts_import (
+                row_number INTEGER,
+                driver_id BIGINT,
+                start_time TIMESTAMP,
+                end_time TIMESTAMP,
+                duration_text VARCHAR(50),
+                duration_seconds INTEGER,
+                cash INTEGER,
+                hourly_rate INTEGER
+            ) ON COMMIT DROP
+        ''')
+        cur.copy_expert(
+            f"COPY shifts_import ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        
+        # Смены, которые уже загружены раньше
+        cur.execute('''
+            SELECT i.row_number
+            FROM shifts_import i
+            WHERE EXISTS (
+                SELECT 1 FROM shifts s
+                WHERE s.driver_id = i.driver_id AND s.start_time = i.start_time
+            )
+            ORDER BY i.row_number
+        ''')
+        skipped_rows = [row[0] for row in cur.fetchall()]
+        
+        cur.execute('''
+            WITH inserted AS (
+                INSERT INTO shifts
+                (driver_id, start_time, end_time, duration_text,
+                 duration_seconds, cash, hourly_rate, is_active, created_at)
+                SELECT driver_id, start_time, end_time, duration_text,
+                       duration_seconds, cash, hourly_rate, FALSE, NOW()
+                FROM shifts_import i
+                WHERE i.row_number <> ALL(%s)
+                ORDER BY i.row_number
+                RETURNING id, start_time, end_time, cash, hourly_rate
+            )
+            INSERT INTO shift_edits
+            (shift_id, editor_id, edited_at, reason,
+             new_start_time, new_end_time, new_cash, new_hourly_rate)
+            SELECT id, %s, NOW(), %s, start_time, end_time, cash, hourly_rate
+            FROM inserted
+        ''', (skipped_rows, editor_id, reason))
+        
+        imported = cur.rowcount
+        
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        return 0, [], str(e)
+    finally:
+        release_connection(conn)
+    
+    invalidate_page_cache(valid['driver_id'].unique().tolist())
+    
+    print(f"✅ Импортировано {imported} смен, пропущено {len(skipped_rows)}")
+    return imported, skipped_rows, None
 
 # --- Вспомогательные функции ---
 def parse_datetime(dt_value):
@@ -378,11 +1025,28 @@ def parse_datetime(dt_value):
             except ValueError:
                 continue
         # Если ни один формат не подошел, возвращаем текущее время
-        return datetime.now()
+        return clock.now()
     elif isinstance(dt_value, date):
         return datetime.combine(dt_value, time())
     else:
-        return datetime.now()
+        return clock.now()
+
+def build_shifts_table(shifts):
+    """Готовит DataFrame для таблицы смен (все колонки считаются векторно)"""
+    df = pd.DataFrame(shifts)
+    
+    is_active = df['is_active'].fillna(False).astype(bool)
+    is_paused = df['is_paused'].fillna(False).astype(bool)
+    df['status'] = np.select(
+        [is_active & is_paused, is_active],
+        ['⏸ На паузе', '🟢 Активна'],
+        default='✅ Завершена'
+    )
+    df['duration_text'] = df['duration_text'].fillna('—')
+    df['hourly_rate'] = df['hourly_rate'].fillna(0)
+    df['open'] = False
+    df['selected'] = False
+    return df
 
 # --- Основной интерфейс ---
 def main():
@@ -390,11 +1054,7 @@ def main():
     
     # Проверка связи с БД
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1")
-        cur.close()
-        conn.close()
+        run_stats_query("SELECT 1", True)
         st.success("✅ Подключение к БД установлено")
     except Exception as e:
         st.error(f"❌ Ошибка подключения к БД: {e}")
@@ -402,6 +1062,7 @@ def main():
     
     st.title("🚕 Админ-панель Такси-бота")
     st.markdown("---")
+    show_cache_debug_sidebar()
     
     # Инициализация состояний
     if 'page' not in st.session_state:
@@ -416,6 +1077,14 @@ def main():
         st.session_state.show_stats = False
     if 'show_export' not in st.session_state:
         st.session_state.show_export = False
+    if 'show_import' not in st.session_state:
+        st.session_state.show_import = False
+    if 'show_archive' not in st.session_state:
+        st.session_state.show_archive = False
+    if 'page_size' not in st.session_state:
+        st.session_state.page_size = PAGE_SIZE_OPTIONS[0]
+    if 'table_version' not in st.session_state:
+        st.session_state.table_version = 0
     
     # ===== РЕЖИМЫ РАБОТЫ =====
     # Проверяем, какой режим активен
@@ -435,7 +1104,17 @@ def main():
         show_export_data()
         return
     
-    # 4. Режим деталей смены
+    # 4. Режим импорта
+    if st.session_state.show_import:
+        show_import_form()
+        return
+    
+    # 5. Режим архива
+    if st.session_state.show_archive:
+        show_archive()
+        return
+    
+    # 6. Режим деталей смены
     if st.session_state.selected_shift_id:
         show_shift_detail(st.session_state.selected_shift_id)
         return
@@ -458,14 +1137,14 @@ def main():
     with col2:
         filter_start_date = st.date_input(
             "Дата с",
-            value=st.session_state.filters.get('start_date') or (datetime.now().date() - timedelta(days=30)),
+            value=st.session_state.filters.get('start_date') or (clock.now().date() - timedelta(days=30)),
             key="filter_start_input"
         )
     
     with col3:
         filter_end_date = st.date_input(
             "Дата по",
-            value=st.session_state.filters.get('end_date') or datetime.now().date(),
+            value=st.session_state.filters.get('end_date') or clock.now().date(),
             key="filter_end_input"
         )
     
@@ -487,36 +1166,21 @@ def main():
             st.session_state.page = 0
             st.rerun()
     
+    # Быстрая статистика и страница списка не зависят друг от друга - грузим параллельно
+    # (в потоках нет доступа к st.session_state, поэтому значения берём заранее)
+    filters = dict(st.session_state.filters)
+    page = st.session_state.page
+    page_size = st.session_state.page_size
+    panels, timings = load_panels({
+        'статистика': lambda: get_filter_stats(**filters),
+        'список': lambda: load_shifts_page(filters, page, page_size)
+    })
+    stats = panels['статистика']
+    shifts = panels['список']
+    total = stats['total'] if stats else 0
+    
     with col3:
-        # Быстрая статистика
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        stats_query = """
-            SELECT COUNT(*) as total, SUM(cash) as total_cash 
-            FROM shifts 
-            WHERE 1=1
-        """
-        stats_params = []
-        
-        if st.session_state.filters['driver_id']:
-            stats_query += " AND driver_id = %s"
-            stats_params.append(st.session_state.filters['driver_id'])
-        
-        if st.session_state.filters['start_date']:
-            stats_query += " AND DATE(start_time) >= %s"  # Убрал конвертацию
-            stats_params.append(st.session_state.filters['start_date'])
-        
-        if st.session_state.filters['end_date']:
-            stats_query += " AND DATE(start_time) <= %s"  # Убрал конвертацию
-            stats_params.append(st.session_state.filters['end_date'])
-        
-        cur.execute(stats_query, stats_params)
-        stats = cur.fetchone()
-        cur.close()
-        conn.close()
-        
-        st.metric("Найдено смен", stats[0] if stats else 0)
+        st.metric("Найдено смен", total)
     
     st.markdown("---")
     
@@ -529,62 +1193,46 @@ def main():
             st.session_state.show_add_shift = True
             st.rerun()
     
-    # Получаем смены для текущей страницы
-    shifts, total = get_all_shifts_paginated(
-        offset=st.session_state.page * 20,
-        limit=20,
-        driver_id=st.session_state.filters['driver_id'],
-        start_date=st.session_state.filters['start_date'],
-        end_date=st.session_state.filters['end_date']
+    page_size = st.selectbox(
+        "Смен на странице",
+        PAGE_SIZE_OPTIONS,
+        index=PAGE_SIZE_OPTIONS.index(st.session_state.page_size),
+        key="page_size_input"
     )
+    if page_size != st.session_state.page_size:
+        st.session_state.page_size = page_size
+        st.session_state.page = 0
+        st.rerun()
     
     if shifts:
-        # Создаем DataFrame
-        df = pd.DataFrame(shifts)
-        
-        # Форматируем даты (теперь они уже в MSK из БД)
-        df['start_time'] = pd.to_datetime(df['start_time']).dt.strftime('%d.%m.%Y %H:%M')
-        df['end_time'] = pd.to_datetime(df['end_time']).dt.strftime('%d.%m.%Y %H:%M')
-        df['created_at'] = pd.to_datetime(df['created_at']).dt.strftime('%d.%m.%Y %H:%M')
-        
-        # Добавляем колонку статуса
-        df['status'] = df.apply(
-            lambda row: '🟢 Активна' if row['is_active'] else ('⏸ На паузе' if row['is_paused'] else '✅ Завершена'),
-            axis=1
+        df = build_shifts_table(shifts)
+        
+        # Одна таблица вместо виджетов на каждую строку; выбор строки - галочка 👁️
+        edited = st.data_editor(
+            df,
+            column_config=SHIFTS_TABLE_COLUMNS,
+            column_order=list(SHIFTS_TABLE_COLUMNS),
+            disabled=[col for col in df.columns if col not in SHIFTS_TABLE_EDITABLE],
+            hide_index=True,
+            use_container_width=True,
+            key=f"shifts_table_{st.session_state.table_version}"
         )
         
-        # Показываем таблицу с возможностью выбора
-        for _, shift in df.iterrows():
-            col1, col2, col3, col4, col5, col6, col7 = st.columns([1, 2, 2, 2, 2, 2, 1])
-            
-            with col1:
-                st.markdown(f"**#{shift['id']}**")
-            
-            with col2:
-                st.markdown(f"👤 {shift['driver_id']}")
-            
-            with col3:
-                st.markdown(f"📅 {shift['start_time']}")
-            
-            with col4:
-                st.markdown(f"⏱ {shift['duration_text'] or '—'}")
-            
-            with col5:
-                st.markdown(f"💰 {shift['cash']:,} руб")
-            
-            with col6:
-                st.markdown(f"📊 {shift['hourly_rate'] or 0:,} руб/ч")
-            
-            with col7:
-                if st.button("👁️", key=f"view_{shift['id']}"):
-                    st.session_state.selected_shift_id = shift['id']
-                    st.rerun()
-            
-            st.divider()
+        opened = edited.loc[edited['open'], 'id']
+        if not opened.empty:
+            st.session_state.selected_shift_id = int(opened.iloc[0])
+            # Новый ключ таблицы, чтобы при возврате галочка была снята
+            st.session_state.table_version += 1
+            st.rerun()
+        
+        selected_ids = [int(shift_id) for shift_id in edited.loc[edited['selected'], 'id']]
+        if selected_ids:
+            show_bulk_actions(selected_ids)
         
         # ===== ПАГИНАЦИЯ =====
         st.markdown("---")
-        total_pages = (total + 19) // 20
+        total_pages = (total + page_size - 1) // page_size
+        prefetch_adjacent_pages(st.session_state.filters, st.session_state.page, page_size, total_pages)
         
         if total_pages > 1:
             st.write(f"Страница {st.session_state.page + 1} из {total_pages} (всего {total} смен)")
@@ -625,11 +1273,13 @@ def main():
     else:
         st.info("🚫 Смены не найдены")
     
+    show_panel_timings(timings)
+    
     # ===== БЫСТРЫЕ ДЕЙСТВИЯ =====
     st.markdown("---")
     st.subheader("⚡ Быстрые действия")
     
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
         if st.button("🔄 Обновить страницу"):
@@ -644,6 +1294,82 @@ def main():
         if st.button("📤 Экспорт данных"):
             st.session_state.show_export = True
             st.rerun()
+    
+    with col4:
+        if st.button("📥 Импорт смен"):
+            st.session_state.show_import = True
+            st.rerun()
+    
+    with col5:
+        if st.button("🗄 Архив"):
+            st.session_state.show_archive = True
+            st.rerun()
+
+def show_bulk_actions(shift_ids):
+    """Массовое редактирование и удаление выбранных смен"""
+    st.markdown(f"**Выбрано смен: {len(shift_ids)}** (активные смены не изменяются)")
+    
+    tab_edit, tab_delete = st.tabs(["✏️ Изменить выбранные", "🗑️ Удалить выбранные"])
+    
+    with tab_edit:
+        col1, col2 = st.columns(2)
+        with col1:
+            offset_minutes = st.number_input(
+                "Сдвинуть время на (мин, можно отрицательное)",
+                value=0,
+                step=5,
+                key="bulk_offset_minutes"
+            )
+        with col2:
+            change_cash = st.checkbox("Установить кассу", key="bulk_change_cash")
+            new_cash = st.number_input(
+                "Новая касса (руб)",
+                min_value=0,
+                value=0,
+                disabled=not change_cash,
+                key="bulk_new_cash"
+            )
+        
+        reason = st.text_input("Причина изменения", key="bulk_reason")
+        
+        if st.button("💾 Применить к выбранным", type="primary", key="bulk_apply"):
+            if reason.strip() == "":
+                st.error("Укажите причину изменения")
+            elif offset_minutes == 0 and not change_cash:
+                st.error("Нечего менять: задайте сдвиг времени или кассу")
+            else:
+                updated_ids, error = bulk_update_shifts(
+                    shift_ids,
+                    editor_id=0,
+                    reason=reason,
+                    time_offset=timedelta(minutes=offset_minutes),
+                    new_cash=new_cash if change_cash else None
+                )
+                if error:
+                    st.error(f"❌ Ошибка при сохранении, изменения отменены: {error}")
+                else:
+                    st.success(f"✅ Изменено смен: {len(updated_ids)}")
+                    st.session_state.table_version += 1
+                    st.rerun()
+    
+    with tab_delete:
+        st.warning("⚠️ Внимание! Это действие необратимо.")
+        confirm_text = st.text_input(
+            f"Введите 'УДАЛИТЬ {len(shift_ids)}' для подтверждения:",
+            key="bulk_confirm_delete"
+        )
+        
+        if st.button("🗑️ Удалить выбранные", type="primary", key="bulk_delete"):
+            if confirm_text != f"УДАЛИТЬ {len(shift_ids)}":
+                st.error("Неправильный текст подтверждения")
+            else:
+                deleted_ids, error = bulk_delete_shifts(shift_ids)
+                if error:
+                    st.error(f"❌ Ошибка при удалении: {error}")
+                else:
+                    st.success(f"✅ Удалено смен: {len(deleted_ids)}")
+                    st.session_state.table_version += 1
+                    st.rerun()
 
 def show_shift_detail(shift_id):
     """Показывает детальную информацию о смене"""
@@ -712,6 +1438,55 @@ def show_shift_detail(shift_id):
     with tab3:
         show_delete_form(shift)
 
+# Запросы страницы общей статистики: (SQL, вернуть одно значение или все строки)
+GENERAL_STATS_QUERIES = {
+    'total_shifts': ("SELECT COUNT(*) FROM shifts", True),
+    'active_shifts': ("SELECT COUNT(*) FROM shifts WHERE is_active = TRUE", True),
+    'total_cash': ("SELECT SUM(cash) FROM shifts", True),
+    'avg_hourly': ("SELECT AVG(hourly_rate) FROM shifts WHERE hourly_rate > 0", True),
+    'daily': ("""
+        SELECT DATE(start_time) as date, COUNT(*) as count, SUM(cash) as cash
+        FROM shifts 
+        WHERE start_time >= NOW() - INTERVAL '7 days'
+        GROUP BY DATE(start_time)
+        ORDER BY date DESC
+    """, False),
+    'drivers': ("""
+        SELECT driver_id, COUNT(*) as shifts, SUM(cash) as total_cash
+        FROM shifts 
+        GROUP BY driver_id
+        ORDER BY total_cash DESC
+        LIMIT 5
+    """, False),
+}
+
+def run_stats_query(query, single_value):
+    """Выполняет один запрос статистики на отдельном соединении из пула"""
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor()
+        
+        cur.execute(query)
+        result = cur.fetchone()[0] if single_value else cur.fetchall()
+        
+        cur.close()
+        return result
+    finally:
+        release_read_connection(conn)
+
+def load_general_stats(snap=None):
+    """Общая статистика по снимку или, без него, всеми панелями из БД параллельно;
+    возвращает (stats, timings)"""
+    if snap is not None:
+        started = perf_counter()
+        stats = snapshot.general_stats(snap, clock.now())
+        elapsed = perf_counter() - started
+        return stats, {'снимок': elapsed, 'всего': elapsed}
+    return load_panels({
+        name: (lambda query=query, single_value=single_value: run_stats_query(query, single_value))
+        for name, (query, single_value) in GENERAL_STATS_QUERIES.items()
+    })
+
 def show_general_stats():
     """Показывает общую статистику"""
     st.subheader("📊 Общая статистика")
@@ -722,46 +1497,28 @@ def show_general_stats():
     
     st.markdown("---")
 
-    conn = get_connection()
-    cur = conn.cursor()
+    snap = get_snapshot()
+    show_snapshot_freshness(snap, key="refresh_snapshot_stats")
+    stats, timings = load_general_stats(snap)
     
     # Основные метрики
     col1, col2, col3, col4 = st.columns(4)
     
-    cur.execute("SELECT COUNT(*) FROM shifts")
-    total_shifts = cur.fetchone()[0]
-    
-    cur.execute("SELECT COUNT(*) FROM shifts WHERE is_active = TRUE")
-    active_shifts = cur.fetchone()[0]
-    
-    cur.execute("SELECT SUM(cash) FROM shifts")
-    total_cash = cur.fetchone()[0] or 0
-    
-    cur.execute("SELECT AVG(hourly_rate) FROM shifts WHERE hourly_rate > 0")
-    avg_hourly = cur.fetchone()[0] or 0
-    
     with col1:
-        st.metric("Всего смен", total_shifts)
+        st.metric("Всего смен", stats['total_shifts'])
     with col2:
-        st.metric("Активных смен", active_shifts)  # ⚠️ УБРАЛ ЗАПЯТУЮ И КНОПКУ
+        st.metric("Активных смен", stats['active_shifts'])  # ⚠️ УБРАЛ ЗАПЯТУЮ И КНОПКУ
     with col3:
-        st.metric("Общая касса", f"{total_cash:,} руб")
+        st.metric("Общая касса", f"{stats['total_cash'] or 0:,} руб")
     with col4:
-        st.metric("Средний час", f"{avg_hourly:.0f} руб/ч")
+        st.metric("Средний час", f"{stats['avg_hourly'] or 0:.0f} руб/ч")
     
     # Дополнительная статистика
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("📈 По дням (последние 7 дней)")
-        cur.execute("""
-            SELECT DATE(start_time) as date, COUNT(*) as count, SUM(cash) as cash
-            FROM shifts 
-            WHERE start_time >= NOW() - INTERVAL '7 days'
-            GROUP BY DATE(start_time)
-            ORDER BY date DESC
-        """)
-        daily_stats = cur.fetchall()
+        daily_stats = stats['daily']
         
         if daily_stats:
             df_daily = pd.DataFrame(daily_stats, columns=['date', 'count', 'cash'])
@@ -771,14 +1528,7 @@ def show_general_stats():
     
     with col2:
         st.subheader("👤 По водителям (топ 5)")
-        cur.execute("""
-            SELECT driver_id, COUNT(*) as shifts, SUM(cash) as total_cash
-            FROM shifts 
-            GROUP BY driver_id
-            ORDER BY total_cash DESC
-            LIMIT 5
-        """)
-        driver_stats = cur.fetchall()
+        driver_stats = stats['drivers']
         
         if driver_stats:
             df_drivers = pd.DataFrame(driver_stats, columns=['driver_id', 'shifts', 'total_cash'])
@@ -786,8 +1536,7 @@ def show_general_stats():
         else:
             st.info("Нет данных по водителям")
     
-    cur.close()
-    conn.close()
+    show_panel_timings(timings)
 
 # Эти функции нужно будет реализовать:
 def show_edit_form(shift):
@@ -984,67 +1733,239 @@ def show_export_data():
     with col2:
         export_start = st.date_input(
             "Дата с",
-            value=datetime.now().date() - timedelta(days=30),
+            value=clock.now().date() - timedelta(days=30),
             key="export_start"
         )
     
     with col3:
         export_end = st.date_input(
             "Дата по",
-            value=datetime.now().date(),
+            value=clock.now().date(),
             key="export_end"
         )
     
+    snap = get_snapshot()
+    show_snapshot_freshness(snap, key="refresh_snapshot_export")
+    
     if st.button("📊 Сформировать отчет", type="primary"):
         with st.spinner("Формирование отчета..."):
-            # Используем существующую функцию поиска
-            shifts = search_shifts(
-                driver_id=export_driver if export_driver > 0 else None,
-                date_filter=None,  # Используем диапазон дат через SQL
-                min_cash=None,
-                max_cash=None
-            )
-            
-            if shifts:
+            if snap is not None:
+                # Весь период по снимку, без запросов к БД
+                mask = snapshot.filter_mask(snap, export_driver, export_start, export_end)
+                df = snap.frame(mask).sort_values('start_time', ascending=False)
+                df.insert(4, 'duration_text', format_duration_column(df['duration_seconds']))
+                df['start_time'] = df['start_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+                df['end_time'] = df['end_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                # Используем существующую функцию поиска
+                shifts = search_shifts(
+                    driver_id=export_driver if export_driver > 0 else None,
+                    date_filter=None,  # Используем диапазон дат через SQL
+                    min_cash=None,
+                    max_cash=None
+                )
                 df = pd.DataFrame(shifts)
                 
-                # Форматируем даты
-                df['start_time'] = pd.to_datetime(df['start_time']).dt.strftime('%Y-%m-%d %H:%M:%S')
-                df['end_time'] = pd.to_datetime(df['end_time']).dt.strftime('%Y-%m-%d %H:%M:%S')
-                df['created_at'] = pd.to_datetime(df['created_at']).dt.strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Фильтруем по дате
-                if export_start:
-                    df = df[pd.to_datetime(df['start_time']) >= pd.Timestamp(export_start)]
-                if export_end:
-                    df = df[pd.to_datetime(df['start_time']) <= pd.Timestamp(export_end + timedelta(days=1))]
-                
                 if not df.empty:
-                    csv = df.to_csv(index=False, encoding='utf-8-sig')
-                    
-                    # Имя файла
-                    filename = f"taxi_shifts_{export_start}_{export_end}"
-                    if export_driver > 0:
-                        filename += f"_driver_{export_driver}"
-                    filename += ".csv"
+                    # Форматируем даты
+                    df['start_time'] = pd.to_datetime(df['start_time']).dt.strftime('%Y-%m-%d %H:%M:%S')
+                    df['end_time'] = pd.to_datetime(df['end_time']).dt.strftime('%Y-%m-%d %H:%M:%S')
+                    df['created_at'] = pd.to_datetime(df['created_at']).dt.strftime('%Y-%m-%d %H:%M:%S')
                     
-                    st.success(f"✅ Отчет готов: {len(df)} записей")
-                    
-                    st.download_button(
-                        label="⬇️ Скачать CSV",
-                        data=csv,
-                        file_name=filename,
-                        mime="text/csv",
-                        key="download_csv"
-                    )
-                    
-                    # Предпросмотр
-                    st.subheader("Предпросмотр данных:")
-                    st.dataframe(df.head(10))
-                else:
-                    st.warning("Нет данных для выбранного диапазона")
+                    # Фильтруем по дате
+                    if export_start:
+                        df = df[pd.to_datetime(df['start_time']) >= pd.Timestamp(export_start)]
+                    if export_end:
+                        df = df[pd.to_datetime(df['start_time']) <= pd.Timestamp(export_end + timedelta(days=1))]
+            
+            if not df.empty:
+                csv = df.to_csv(index=False, encoding='utf-8-sig')
+                
+                # Имя файла
+                filename = f"taxi_shifts_{export_start}_{export_end}"
+                if export_driver > 0:
+                    filename += f"_driver_{export_driver}"
+                filename += ".csv"
+                
+                st.success(f"✅ Отчет готов: {len(df)} записей")
+                
+                st.download_button(
+                    label="⬇️ Скачать CSV",
+                    data=csv,
+                    file_name=filename,
+                    mime="text/csv",
+                    key="download_csv"
+                )
+                
+                # Предпросмотр
+                st.subheader("Предпросмотр данных:")
+                st.dataframe(df.head(10))
             else:
-                st.warning("Нет данных для экспорта")
+                st.warning("Нет данных для выбранного диапазона")
+
+# --- Архив старых месяцев (partitions.py) ---
+def get_archives():
+    """Выгруженные в архив месяцы, новые сверху"""
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT to_regclass('shift_archives') IS NOT NULL AS present")
+        if not cur.fetchone()['present']:
+            return []
+        cur.execute("SELECT * FROM shift_archives ORDER BY month DESC")
+        archives = cur.fetchall()
+        cur.close()
+        return archives
+    finally:
+        release_read_connection(conn)
+
+@st.cache_data(max_entries=24, show_spinner=False)
+def read_archive_file(path, modified):
+    """Читает CSV.gz архива; modified (mtime) - часть ключа кэша"""
+    return pd.read_csv(path, compression='gzip')
+
+def load_archive(path):
+    frame = read_archive_file(path, os.path.getmtime(path))
+    for column in ('start_time', 'end_time', 'created_at', 'pause_start_time', 'edited_at'):
+        if column in frame.columns:
+            frame[column] = pd.to_datetime(frame[column])
+    return frame
+
+def show_archive():
+    """Смены из архива: выбранные месяцы читаются из файлов по запросу"""
+    st.subheader("🗄 Архив смен")
+    
+    if st.button("← Назад к списку", key="back_from_archive"):
+        st.session_state.show_archive = False
+        st.rerun()
+    
+    archives = get_archives()
+    if not archives:
+        st.info("Архив пуст: старые месяцы выгружаются при SHIFTS_RETENTION_MONTHS > 0")
+        return
+    
+    summary = pd.DataFrame(archives)[['month', 'shifts_count', 'edits_count', 'total_cash', 'archived_at']]
+    st.dataframe(summary, hide_index=True, column_config={
+        'month': st.column_config.DateColumn("Месяц", format="MM.YYYY"),
+        'shifts_count': st.column_config.NumberColumn("Смен"),
+        'edits_count': st.column_config.NumberColumn("Правок"),
+        'total_cash': st.column_config.NumberColumn("Касса", format="%d руб"),
+        'archived_at': st.column_config.DatetimeColumn("Выгружен", format="DD.MM.YYYY HH:mm"),
+    })
+    
+    by_month = {archive['month'].strftime('%m.%Y'): archive for archive in archives}
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        labels = st.multiselect("Месяцы", list(by_month), key="archive_months")
+    with col2:
+        archive_driver = st.number_input("ID водителя (0 = все)", min_value=0, value=0, key="archive_driver")
+    with col3:
+        with_edits = st.checkbox("История правок", key="archive_edits")
+    
+    if not labels or not st.button("🔍 Показать", type="primary", key="archive_load"):
+        return
+    
+    months = sorted(by_month[label]['month'] for label in labels)
+    shifts, edits = [], []
+    for month in months:
+        archive = by_month[month.strftime('%m.%Y')]
+        try:
+            shifts.append(load_archive(archive['shifts_file']))
+            if with_edits:
+                edits.append(load_archive(archive['edits_file']))
+        except OSError as e:
+            st.error(f"❌ Файл архива за {month:%m.%Y} недоступен: {e}")
+    if not shifts:
+        return
+    
+    df = pd.concat(shifts, ignore_index=True)
+    if archive_driver > 0:
+        df = df[df['driver_id'] == archive_driver]
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Смен", len(df))
+    with col2:
+        st.metric("Касса", f"{int(df['cash'].sum()):,} руб")
+    st.dataframe(df, hide_index=True)
+    st.download_button(
+        label="⬇️ Скачать CSV",
+        data=df.to_csv(index=False, encoding='utf-8-sig'),
+        file_name=f"taxi_shifts_archive_{months[0]:%Y_%m}_{months[-1]:%Y_%m}.csv",
+        mime="text/csv",
+        key="archive_download"
+    )
+    
+    if with_edits and edits:
+        st.subheader("📝 История правок")
+        edits_df = pd.concat(edits, ignore_index=True)
+        st.dataframe(edits_df[edits_df['shift_id'].isin(df['id'])], hide_index=True)
+
+def show_import_form():
+    """Форма массового импорта смен из файла"""
+    st.title("📥 Импорт смен из файла")
+    
+    if st.button("← Назад к списку", key="back_from_import"):
+        st.session_state.show_import = False
+        st.rerun()
+    
+    st.markdown("---")
+    st.markdown(
+        "Файл CSV или Parquet с колонками `driver_id`, `start_time`, `end_time`, `cash`.  \n"
+        "Время в формате `2024-05-01 08:00` или `01.05.2024 08:00`. "
+        "Длительность и средний час рассчитываются автоматически."
+    )
+    
+    uploaded_file = st.file_uploader("Файл со сменами", type=['csv', 'parquet'], key="import_file")
+    if uploaded_file is None:
+        return
+    
+    try:
+        raw = read_import_file(uploaded_file)
+        valid, errors = validate_import_frame(raw)
+    except Exception as e:
+        st.error(f"❌ Не удалось прочитать файл: {e}")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Строк в файле", len(raw))
+    with col2:
+        st.metric("Готово к загрузке", len(valid))
+    with col3:
+        st.metric("С ошибками", len(errors))
+    
+    if not errors.empty:
+        st.subheader("⚠️ Строки с ошибками")
+        st.dataframe(errors, hide_index=True, use_container_width=True)
+        st.download_button(
+            label="⬇️ Скачать отчёт об ошибках",
+            data=errors.to_csv(index=False, encoding='utf-8-sig'),
+            file_name=f"import_errors_{uploaded_file.name}.csv",
+            mime="text/csv",
+            key="download_import_errors"
+        )
+    
+    if valid.empty:
+        st.warning("Нет строк для импорта")
+        return
+    
+    st.subheader("Предпросмотр:")
+    st.dataframe(valid.head(20), hide_index=True, use_container_width=True)
+    
+    if st.button(f"💾 Импортировать {len(valid)} смен", type="primary", key="run_import"):
+        with st.spinner("Импорт..."):
+            imported, skipped_rows, error = import_shifts(
+                valid, reason=f"Импорт из файла {uploaded_file.name}"
+            )
+        
+        if error:
+            st.error(f"❌ Ошибка при импорте, ничего не сохранено: {error}")
+            return
+        
+        st.success(f"✅ Импортировано смен: {imported}")
+        if skipped_rows:
+            st.warning(f"Пропущены уже существующие смены (строки): {', '.join(map(str, skipped_rows))}")
 
 def show_add_shift_form():
     """Форма для ручного добавления смены"""
@@ -1070,12 +1991,12 @@ def show_add_shift_form():
         st.markdown("**Время начала:**")
         col_start1, col_start2 = st.columns(2)
         with col_start1:
-            start_date = st.date_input("Дата начала", value=datetime.now().date(), key="add_start_date")
+            start_date = st.date_input("Дата начала", value=clock.now().date(), key="add_start_date")
         with col_start2:
             # Используем текстовое поле для времени
             start_time_str = st.text_input(
                 "ЧЧ:ММ",
-                value=datetime.now().strftime("%H:%M"),
+                value=clock.now().strftime("%H:%M"),
                 key="add_start_time",
                 max_chars=5,
                 help="Формат: ЧЧ:ММ"
@@ -1110,12 +2031,12 @@ def show_add_shift_form():
         st.markdown("**Время окончания:**")
         col_end1, col_end2 = st.columns(2)
         with col_end1:
-            end_date = st.date_input("Дата окончания", value=datetime.now().date(), key="add_end_date")
+            end_date = st.date_input("Дата окончания", value=clock.now().date(), key="add_end_date")
         with col_end2:
             # Используем текстовое поле для времени
             end_time_str = st.text_input(
                 "ЧЧ:ММ",
-                value=(datetime.now() + timedelta(hours=1)).strftime("%H:%M"),
+                value=(clock.now() + timedelta(hours=1)).strftime("%H:%M"),
                 key="add_end_time",
                 max_chars=5,
                 help="Формат: ЧЧ:ММ"
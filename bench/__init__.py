@@ -0,0 +1 @@
+"""Бенчмарки бота и админки (запускаются вручную против локального PostgreSQL)"""
@@ -0,0 +1,233 @@
+"""Общие помощники бенчмарков: подсчёт обращений к БД, перцентили, базовые файлы"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# Метрики, у которых рост значения - это ухудшение
+LOWER_IS_BETTER = ('latency', 'per_update', 'seconds', '_ms')
+
+
+def require_bench_database():
+    """Бенчмарки пишут и удаляют данные, поэтому работают только с отдельной БД"""
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if not url:
+        raise SystemExit(
+            "❌ Не задана BENCH_DATABASE_URL (локальный PostgreSQL или sqlite:///файл для бенчмарков).\n"
+            "Рабочую DATABASE_URL бенчмарки не используют."
+        )
+    os.environ['DATABASE_URL'] = url
+    os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+    return url
+
+
+# --- Подсчёт обращений к БД ---
+class DbCounters:
+    """Счётчики подключений, запросов и коммитов (потокобезопасные)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.queries = 0
+            self.commits = 0
+            self.captured = None
+
+    def record_query(self, text):
+        with self._lock:
+            self.queries += 1
+            if self.captured is not None:
+                self.captured.append(text)
+
+    def add(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'queries': self.queries,
+                'commits': self.commits,
+                'round_trips': self.connects + self.queries + self.commits
+            }
+
+
+DB_COUNTERS = DbCounters()
+_cursor_classes = {}
+
+
+@contextmanager
+def capture_queries():
+    """Собирает тексты всех выполненных запросов (с подставленными параметрами)"""
+    captured = []
+    with DB_COUNTERS._lock:
+        DB_COUNTERS.captured = captured
+    try:
+        yield captured
+    finally:
+        with DB_COUNTERS._lock:
+            DB_COUNTERS.captured = None
+
+
+def _counting_cursor_class(base):
+    """Подкласс курсора base, который считает execute/executemany/copy"""
+    cls = _cursor_classes.get(base)
+    if cls is not None:
+        return cls
+
+    def execute(self, query, vars=None):
+        if DB_COUNTERS.captured is not None:
+            DB_COUNTERS.record_query(self.mogrify(query, vars).decode('utf-8'))
+        else:
+            DB_COUNTERS.add('queries')
+        return base.execute(self, query, vars)
+
+    def executemany(self, query, vars_list):
+        DB_COUNTERS.add('queries')
+        return base.executemany(self, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        DB_COUNTERS.add('queries')
+        return base.copy_expert(self, sql, file, size)
+
+    cls = type('Counting' + base.__name__, (base,), {
+        'execute': execute,
+        'executemany': executemany,
+        'copy_expert': copy_expert,
+    })
+    _cursor_classes[base] = cls
+    return cls
+
+
+class CountingConnectionMixin:
+    """Соединение, курсоры которого считают запросы"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _counting_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        DB_COUNTERS.add('commits')
+        return super().commit()
+
+
+_connection_classes = {}
+
+
+def _counting_connection_class(base):
+    """Подкласс соединения base (например, metrics.InstrumentedConnection) со счётчиками"""
+    cls = _connection_classes.get(base)
+    if cls is None:
+        cls = _connection_classes[base] = type('Counting' + base.__name__, (CountingConnectionMixin, base), {})
+    return cls
+
+
+CountingConnection = _counting_connection_class(psycopg2.extensions.connection)
+_original_connect = psycopg2.connect
+
+
+def _counting_connect(*args, **kwargs):
+    DB_COUNTERS.add('connects')
+    base = kwargs.get('connection_factory') or psycopg2.extensions.connection
+    kwargs['connection_factory'] = _counting_connection_class(base)
+    return _original_connect(*args, **kwargs)
+
+
+def install_db_counters():
+    """Подменяет psycopg2.connect, чтобы считать обращения к БД (вызывать до импорта bot)"""
+    psycopg2.connect = _counting_connect
+
+
+# --- Статистика ---
+def percentile(sorted_values, fraction):
+    """Перцентиль по уже отсортированному списку (линейная интерполяция)"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/max/mean в миллисекундах"""
+    values = sorted(seconds)
+    if not values:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0, 'mean_ms': 0.0}
+    return {
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'max_ms': values[-1] * 1000,
+        'mean_ms': sum(values) / len(values) * 1000
+    }
+
+
+# --- Базовые файлы ---
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name, report):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = baseline_path(name)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"💾 Базовые результаты сохранены в {path}")
+
+
+def load_baseline(name):
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _flatten(report, prefix=''):
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_with_baseline(report, baseline, threshold=0.2, keys=None):
+    """Сравнивает числовые метрики с базой; возвращает список регрессий.
+
+    Регрессия - ухудшение больше чем на threshold (доля) для метрик из keys
+    (по умолчанию - все, имя которых похоже на задержку или расход на запрос).
+    """
+    current = _flatten(report)
+    previous = _flatten(baseline)
+    regressions = []
+
+    for name, value in sorted(current.items()):
+        if name not in previous:
+            continue
+        old = previous[name]
+        change = (value - old) / old if old else 0.0
+        marker = ''
+        tracked = name in keys if keys else any(part in name for part in LOWER_IS_BETTER)
+        higher_is_better = 'throughput' in name
+        if (tracked or higher_is_better) and old:
+            worse = change < -threshold if higher_is_better else change > threshold
+            if worse:
+                marker = '  ⚠️ регрессия'
+                regressions.append(name)
+        print(f"   {name}: {old:.2f} → {value:.2f} ({change:+.0%}){marker}")
+
+    return regressions
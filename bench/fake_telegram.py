@@ -0,0 +1,218 @@
+"""Локальная замена Telegram Bot API для тестов и бенчмарков.
+
+Принимает запросы вида /bot<token>/<method>, записывает отправленные
+сообщения и умеет имитировать медленный Telegram и ответы 429 с retry_after.
+Бот направляется на сервер переменной окружения TELEGRAM_API_URL:
+
+    python -m bench.fake_telegram --port 8081 --latency 0.05 --chat-rate 1
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot{0}/{1} python bot.py
+
+Статистика доступна по GET /_stats, сброс - POST /_reset.
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+ERROR_REPLY_MARKERS = ('⚠️ Произошла ошибка', '❌ Ошибка')
+
+
+class FakeTelegramServer:
+    """Фейковый Bot API в отдельном потоке.
+
+    latency/jitter - задержка ответа в секундах;
+    chat_rate - сколько сообщений в секунду пропускать в один чат (0 - без лимита);
+    global_rate - общий лимит сообщений в секунду (0 - без лимита);
+    retry_after - значение retry_after в ответах 429.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 chat_rate=0, global_rate=0, retry_after=1, keep_messages=10000):
+        self.latency = latency
+        self.jitter = jitter
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self._keep_messages = keep_messages
+        self.reset()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_url(self):
+        """Шаблон для telebot.apihelper.API_URL / TELEGRAM_API_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.messages = deque(maxlen=self._keep_messages)
+            self.calls = defaultdict(int)
+            self.rate_limited = 0
+            self.error_replies = 0
+            self.first_call_at = None
+            self.last_call_at = None
+            self._sent_by_chat = defaultdict(deque)
+            self._sent_all = deque()
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.calls.values())
+            window = (self.last_call_at - self.first_call_at) if self.first_call_at else 0.0
+            sent = total - self.rate_limited
+            return {
+                'calls': total,
+                'by_method': dict(self.calls),
+                'messages_sent': sent,
+                'rate_limited': self.rate_limited,
+                'error_replies': self.error_replies,
+                'messages_per_s': sent / window if window > 0 else 0.0
+            }
+
+    def _over_limit(self, timestamps, rate, now):
+        """Скользящее окно в 1 секунду"""
+        if not rate:
+            return False
+        while timestamps and now - timestamps[0] >= 1.0:
+            timestamps.popleft()
+        return len(timestamps) >= rate
+
+    def handle_call(self, method_name, params):
+        """Обрабатывает вызов метода; возвращает (HTTP-код, JSON-ответ)"""
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        chat_id = params.get('chat_id')
+        now = time.monotonic()
+        with self._lock:
+            self.calls[method_name] += 1
+            if self.first_call_at is None:
+                self.first_call_at = now
+            self.last_call_at = now
+
+            if method_name == 'sendMessage':
+                by_chat = self._sent_by_chat[chat_id]
+                if (self._over_limit(by_chat, self.chat_rate, now)
+                        or self._over_limit(self._sent_all, self.global_rate, now)):
+                    self.rate_limited += 1
+                    return 429, {
+                        'ok': False,
+                        'error_code': 429,
+                        'description': f"Too Many Requests: retry after {self.retry_after}",
+                        'parameters': {'retry_after': self.retry_after}
+                    }
+                by_chat.append(now)
+                self._sent_all.append(now)
+
+                text = params.get('text', '')
+                if text.startswith(ERROR_REPLY_MARKERS):
+                    self.error_replies += 1
+                message_id = next(self._message_ids)
+                self.messages.append({'chat_id': chat_id, 'text': text, 'message_id': message_id})
+            else:
+                message_id = next(self._message_ids)
+
+        if method_name == 'sendMessage':
+            return 200, {'ok': True, 'result': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(chat_id or 0), 'type': 'private'},
+                'text': params.get('text', '')
+            }}
+        if method_name == 'getMe':
+            return 200, {'ok': True, 'result': {
+                'id': 123456, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'
+            }}
+        # setWebhook, deleteWebhook и прочее - просто успех
+        return 200, {'ok': True, 'result': True}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _params(self):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    raw = self.rfile.read(length).decode('utf-8')
+                    if 'json' in (self.headers.get('Content-Type') or ''):
+                        params.update(json.loads(raw))
+                    else:
+                        params.update(dict(parse_qsl(raw)))
+                return url.path, params
+
+            def _dispatch(self):
+                path, params = self._params()
+                if path == '/_stats':
+                    return self._send(200, server.stats())
+                if path == '/_reset':
+                    server.reset()
+                    return self._send(200, {'ok': True})
+
+                parts = path.strip('/').split('/')
+                if len(parts) != 2 or not parts[0].startswith('bot'):
+                    return self._send(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+                status, payload = server.handle_call(parts[1], params)
+                self._send(status, payload)
+
+            do_GET = _dispatch
+            do_POST = _dispatch
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный фейковый Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, с")
+    parser.add_argument('--jitter', type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument('--chat-rate', type=int, default=0, help="лимит сообщений/с на чат (0 - нет)")
+    parser.add_argument('--global-rate', type=int, default=0, help="общий лимит сообщений/с (0 - нет)")
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    server = FakeTelegramServer(
+        args.host, args.port, latency=args.latency, jitter=args.jitter,
+        chat_rate=args.chat_rate, global_rate=args.global_rate, retry_after=args.retry_after
+    ).start()
+    print(f"🤖 Фейковый Bot API запущен: TELEGRAM_API_URL={server.api_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Бенчмарк SQL-запросов бота и админки на больших таблицах.
+
+Замеряет время функций, которые читают shifts (отчёт водителя по дням,
+страницы и поиск в админке, общая статистика), перехватывает их SQL и
+записывает EXPLAIN (ANALYZE, BUFFERS) для каждого запроса. При сравнении
+с базой регрессией считается и рост задержки, и смена плана - например,
+переход с индекса на последовательное сканирование shifts.
+
+Данные готовит bench/seed_fleet.py:
+
+    BENCH_DATABASE_URL=postgresql://localhost/taxi_bench \\
+        python -m bench.seed_fleet --size 100k
+    python -m bench.query_bench --baseline queries_100k --save-baseline
+    python -m bench.query_bench --baseline queries_100k --compare
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import date, timedelta
+
+from bench.common import (
+    capture_queries, compare_with_baseline, install_db_counters, latency_summary,
+    load_baseline, require_bench_database, save_baseline
+)
+from bench.seed_fleet import SEED_DRIVER_BASE
+
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+
+def build_cases(bot_module, admin_module, driver_id):
+    """Имя -> функция без аргументов; покрывает все читающие shifts запросы"""
+    week_ago = date.today() - timedelta(days=7)
+    yesterday = date.today() - timedelta(days=1)
+    return {
+        'bot_grouped_by_date': lambda: bot_module.get_user_shifts_grouped_by_date(driver_id),
+        'admin_page_first': lambda: admin_module.get_all_shifts_paginated(0, 20),
+        'admin_page_deep': lambda: admin_module.get_all_shifts_paginated(10_000, 20),
+        'admin_page_driver': lambda: admin_module.get_all_shifts_paginated(0, 20, driver_id=driver_id),
+        'admin_page_week': lambda: admin_module.get_all_shifts_paginated(0, 20, start_date=week_ago),
+        'admin_search_driver': lambda: admin_module.search_shifts(driver_id=driver_id),
+        'admin_search_date': lambda: admin_module.search_shifts(date_filter=yesterday),
+        'admin_search_cash': lambda: admin_module.search_shifts(min_cash=9000),
+        'admin_general_stats': lambda: admin_module.load_general_stats(),
+    }
+
+
+def plan_nodes(node, found=None):
+    """Плоский список узлов плана вида 'Index Scan on shifts (idx_shifts_driver_id)'"""
+    found = [] if found is None else found
+    label = node['Node Type']
+    if node.get('Relation Name'):
+        label += f" on {node['Relation Name']}"
+    if node.get('Index Name'):
+        label += f" ({node['Index Name']})"
+    found.append(label)
+    for child in node.get('Plans', []):
+        plan_nodes(child, found)
+    return found
+
+
+def explain(conn, sql):
+    """EXPLAIN (ANALYZE, BUFFERS) одного запроса; только для чтения"""
+    cur = conn.cursor()
+    cur.execute(EXPLAIN_PREFIX + sql)
+    result = cur.fetchone()[0]
+    cur.close()
+    conn.rollback()
+    result = json.loads(result) if isinstance(result, str) else result
+    root = result[0]
+    nodes = plan_nodes(root['Plan'])
+    return {
+        'sql': ' '.join(sql.split()),
+        'plan_nodes': nodes,
+        'seq_scans': sorted({node.split(' on ', 1)[1] for node in nodes if node.startswith('Seq Scan on')}),
+        'execution_ms': root.get('Execution Time', 0.0),
+        'planning_ms': root.get('Planning Time', 0.0),
+        'shared_hit_blocks': root['Plan'].get('Shared Hit Blocks', 0),
+        'shared_read_blocks': root['Plan'].get('Shared Read Blocks', 0),
+        'plan': root['Plan'],
+    }
+
+
+def is_read_query(sql):
+    words = sql.split(None, 1)
+    return bool(words) and words[0].upper() == 'SELECT'
+
+
+def run_benchmark(args):
+    url = require_bench_database()
+    install_db_counters()
+
+    import psycopg2
+    import bot as bot_module
+    import admin_panel as admin_module
+
+    conn = psycopg2.connect(url)
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM shifts")
+    table_rows = cur.fetchone()[0]
+    cur.execute("SELECT driver_id FROM shifts WHERE driver_id = %s LIMIT 1", (SEED_DRIVER_BASE,))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute("SELECT driver_id FROM shifts LIMIT 1")
+        row = cur.fetchone()
+    cur.close()
+    if row is None:
+        raise SystemExit("❌ Таблица shifts пуста - сначала запустите python -m bench.seed_fleet")
+    driver_id = row[0]
+
+    print(f"🔎 Смен в таблице: {table_rows:,}, водитель для запросов: {driver_id}")
+    report = {'table_rows': table_rows, 'repeat': args.repeat, 'queries': {}}
+
+    for name, call in build_cases(bot_module, admin_module, driver_id).items():
+        if args.only and name not in args.only:
+            continue
+        with capture_queries() as captured:
+            call()
+        durations = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            call()
+            durations.append(time.perf_counter() - started)
+
+        statements = [explain(conn, sql) for sql in captured if is_read_query(sql)]
+        report['queries'][name] = {
+            'latency': latency_summary(durations),
+            'statements': statements,
+        }
+        seq = sorted({rel for s in statements for rel in s['seq_scans']})
+        print(f"   {name}: p50 {report['queries'][name]['latency']['p50_ms']:.1f} мс, "
+              f"запросов {len(statements)}"
+              + (f", Seq Scan: {', '.join(seq)}" if seq else ""))
+
+    conn.close()
+    return report
+
+
+def print_plans(report):
+    for name, result in report['queries'].items():
+        print(f"\n📋 {name}")
+        for statement in result['statements']:
+            print(f"   {statement['sql'][:160]}")
+            print(f"   ⏱ {statement['execution_ms']:.2f} мс, буферы: hit {statement['shared_hit_blocks']}, "
+                  f"read {statement['shared_read_blocks']}")
+            for node in statement['plan_nodes']:
+                print(f"      - {node}")
+
+
+def compare_plans(report, baseline):
+    """Ищет смены планов: новое Seq Scan или другой набор узлов; возвращает регрессии"""
+    regressions = []
+    for name, result in report['queries'].items():
+        previous = baseline.get('queries', {}).get(name)
+        if not previous:
+            continue
+        for index, statement in enumerate(result['statements']):
+            if index >= len(previous['statements']):
+                break
+            old = previous['statements'][index]
+            new_seq = sorted(set(statement['seq_scans']) - set(old['seq_scans']))
+            if new_seq:
+                print(f"   ⚠️ {name}[{index}]: появилось последовательное сканирование {', '.join(new_seq)}")
+                print(f"      было: {', '.join(old['plan_nodes'])}")
+                print(f"      стало: {', '.join(statement['plan_nodes'])}")
+                regressions.append(f"{name}[{index}].seq_scan")
+            elif statement['plan_nodes'] != old['plan_nodes']:
+                print(f"   ℹ️ {name}[{index}]: план изменился: {', '.join(statement['plan_nodes'])}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк SQL-запросов на больших таблицах")
+    parser.add_argument('--repeat', type=int, default=5, help="замеров на функцию")
+    parser.add_argument('--only', nargs='*', help="только эти функции")
+    parser.add_argument('--plans', action='store_true', help="напечатать планы запросов")
+    parser.add_argument('--baseline', default='queries', help="имя базового файла в bench/baselines")
+    parser.add_argument('--save-baseline', action='store_true', help="сохранить результат как базовый")
+    parser.add_argument('--compare', action='store_true', help="сравнить с базовым результатом")
+    parser.add_argument('--threshold', type=float, default=0.5, help="допустимое ухудшение задержки (доля)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    if args.plans:
+        print_plans(report)
+
+    exit_code = 0
+    if args.compare:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"⚠️ Базовый файл '{args.baseline}' не найден")
+        else:
+            print("\n📈 Сравнение с базой:")
+            timing = {name: result['latency'] for name, result in report['queries'].items()}
+            old_timing = {name: result['latency'] for name, result in baseline['queries'].items()}
+            regressions = compare_with_baseline(timing, old_timing, args.threshold)
+            regressions += compare_plans(report, baseline)
+            if regressions:
+                exit_code = 1
+    if args.save_baseline:
+        save_baseline(args.baseline, report)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
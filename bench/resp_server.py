@@ -0,0 +1,132 @@
+"""Локальная замена Redis для тестов и бенчмарков общего кэша.
+
+Понимает ровно то, чем пользуется cache.RedisCache: PING, GET, SET (EX/PX),
+DEL, SELECT, FLUSHALL, DBSIZE. Данные в памяти, одна база.
+
+    python -m bench.resp_server --port 6380
+    CACHE_URL=redis://127.0.0.1:6380/0 python -m bench.webhook_bench ...
+
+Из кода: server, url = start_server() - сервер на свободном порту в фоновом потоке.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None and item[0] is not None and item[0] <= time.monotonic():
+                del self.data[key]
+                return None
+            return item[1] if item is not None else None
+
+    def set(self, key, value, ttl_ms=None):
+        expires = time.monotonic() + ttl_ms / 1000 if ttl_ms else None
+        with self.lock:
+            self.data[key] = (expires, value)
+
+    def delete(self, keys):
+        with self.lock:
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Инлайн-команда (например, из telnet)
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].upper()
+            if name == b'PING':
+                reply = b"+PONG\r\n"
+            elif name == b'GET':
+                reply = _bulk(store.get(args[1]))
+            elif name == b'SET':
+                ttl_ms = None
+                options = [arg.upper() for arg in args[3:]]
+                if b'PX' in options:
+                    ttl_ms = int(args[3 + options.index(b'PX') + 1])
+                elif b'EX' in options:
+                    ttl_ms = int(args[3 + options.index(b'EX') + 1]) * 1000
+                store.set(args[1], args[2], ttl_ms)
+                reply = b"+OK\r\n"
+            elif name == b'DEL':
+                reply = b":%d\r\n" % store.delete(args[1:])
+            elif name in (b'SELECT', b'AUTH'):
+                reply = b"+OK\r\n"
+            elif name == b'FLUSHALL':
+                with store.lock:
+                    store.data.clear()
+                reply = b"+OK\r\n"
+            elif name == b'DBSIZE':
+                with store.lock:
+                    reply = b":%d\r\n" % len(store.data)
+            else:
+                reply = b"-ERR unknown command '%s'\r\n" % name
+            self.wfile.write(reply)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, RespHandler)
+        self.store = Store()
+
+
+def start_server(host='127.0.0.1', port=0):
+    """Запускает сервер в фоновом потоке; возвращает (server, url для CACHE_URL)"""
+    server = RespServer((host, port))
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name='resp-server')
+    thread.start()
+    host, port = server.server_address
+    return server, f"redis://{host}:{port}/0"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальная замена Redis для общего кэша")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6380)
+    args = parser.parse_args(argv)
+
+    server = RespServer((args.host, args.port))
+    print(f"🗄 Кэш-сервер: redis://{args.host}:{args.port}/0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
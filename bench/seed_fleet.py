@@ -0,0 +1,166 @@
+"""Генератор синтетических историй смен автопарка для бенчмарков запросов.
+
+Смены генерируются векторно (NumPy) пачками и загружаются через COPY:
+утренние и вечерние пики начала смен, паузы, касса по ставке водителя.
+Синтетические водители получают ID из отдельного диапазона, поэтому
+их смены можно удалить, не трогая остальные данные.
+
+    BENCH_DATABASE_URL=postgresql://localhost/taxi_bench \\
+        python -m bench.seed_fleet --size 100k
+
+    python -m bench.seed_fleet --size 10M --days 730
+    python -m bench.seed_fleet --drop
+"""
+import argparse
+import io
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from bench.common import require_bench_database
+
+# Диапазон ID синтетического автопарка (ниже диапазона webhook-бенчмарка)
+SEED_DRIVER_BASE = 6_000_000_000
+SEED_DRIVER_END = 7_000_000_000
+
+SIZES = {'1k': 1_000, '100k': 100_000, '10M': 10_000_000}
+CHUNK_SIZE = 500_000
+MOSCOW_UTC_OFFSET_HOURS = 3
+
+SEED_COLUMNS = ['driver_id', 'start_time', 'end_time', 'duration_text', 'duration_seconds',
+                'cash', 'hourly_rate', 'is_active', 'pause_duration_seconds', 'created_at']
+
+
+def format_duration(seconds):
+    """'2 ч 15 мин' для массива секунд (как в боте и админке)"""
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    hours_str = pd.Series(hours).astype(str) + " ч"
+    minutes_str = pd.Series(minutes).astype(str) + " мин"
+    return np.select(
+        [(hours > 0) & (minutes > 0), hours > 0],
+        [hours_str + " " + minutes_str, hours_str],
+        default=minutes_str
+    )
+
+
+def generate_chunk(rng, count, drivers, days, today):
+    """Одна пачка смен в виде DataFrame с колонками SEED_COLUMNS"""
+    driver_index = rng.integers(0, drivers, count)
+    # Ставка водителя стабильна: выводим её из индекса, а не храним таблицу
+    driver_rate = 550 + (driver_index * 7919 % 301)
+
+    day_offset = rng.integers(0, days, count)
+    evening = rng.random(count) < 0.4
+    start_hour = np.where(evening, rng.normal(17.0, 2.0, count), rng.normal(7.5, 1.5, count)) % 24
+    start_seconds = (start_hour * 3600).astype(np.int64)
+
+    total_seconds = (np.clip(rng.normal(9.0, 2.5, count), 2.0, 14.0) * 3600).astype(np.int64)
+    has_pause = rng.random(count) < 0.7
+    pause_seconds = np.where(has_pause, rng.exponential(1200, count), 0).astype(np.int64)
+    pause_seconds = np.minimum(pause_seconds, total_seconds // 3)
+    duration_seconds = total_seconds - pause_seconds
+
+    rate = driver_rate * rng.lognormal(0.0, 0.15, count) * np.where(evening, 1.15, 1.0)
+    cash = np.round(rate * duration_seconds / 3600).astype(np.int64)
+    hourly_rate = (cash / (duration_seconds / 3600)).astype(np.int64)
+
+    # В БД время хранится в UTC, пики - по Москве
+    day_start = np.datetime64(today, 's') - day_offset.astype('timedelta64[D]')
+    start_time = (day_start + start_seconds.astype('timedelta64[s]')
+                  - np.timedelta64(MOSCOW_UTC_OFFSET_HOURS, 'h'))
+    end_time = start_time + total_seconds.astype('timedelta64[s]')
+
+    return pd.DataFrame({
+        'driver_id': SEED_DRIVER_BASE + driver_index,
+        'start_time': start_time,
+        'end_time': end_time,
+        'duration_text': format_duration(duration_seconds),
+        'duration_seconds': duration_seconds,
+        'cash': cash,
+        'hourly_rate': hourly_rate,
+        'is_active': False,
+        'pause_duration_seconds': pause_seconds,
+        'created_at': end_time,
+    })
+
+
+def drop_seeded(conn):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM shifts WHERE driver_id >= %s AND driver_id < %s",
+                (SEED_DRIVER_BASE, SEED_DRIVER_END))
+    deleted = cur.rowcount
+    conn.commit()
+    cur.close()
+    return deleted
+
+
+def seed(conn, shifts, drivers, days, seed_value=42):
+    """Загружает shifts синтетических смен пачками по CHUNK_SIZE"""
+    today = np.datetime64('today', 'D') + np.timedelta64(1, 'D')
+    cur = conn.cursor()
+    loaded = 0
+    started = time.perf_counter()
+
+    for chunk_number, chunk_start in enumerate(range(0, shifts, CHUNK_SIZE)):
+        count = min(CHUNK_SIZE, shifts - chunk_start)
+        rng = np.random.default_rng([seed_value, chunk_number])
+        frame = generate_chunk(rng, count, drivers, days, today)
+
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S')
+        buffer.seek(0)
+        cur.copy_expert(
+            f"COPY shifts ({', '.join(SEED_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        conn.commit()
+
+        loaded += count
+        elapsed = time.perf_counter() - started
+        print(f"   📥 {loaded:,} / {shifts:,} смен ({loaded / elapsed:,.0f} строк/с)")
+
+    print("🔧 ANALYZE shifts...")
+    cur.execute("ANALYZE shifts")
+    conn.commit()
+    cur.close()
+    return loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетический автопарк для бенчмарков запросов")
+    parser.add_argument('--size', choices=sorted(SIZES), default='100k', help="число смен")
+    parser.add_argument('--shifts', type=int, default=0, help="точное число смен (вместо --size)")
+    parser.add_argument('--drivers', type=int, default=0, help="водителей (по умолчанию смен / 200)")
+    parser.add_argument('--days', type=int, default=365, help="глубина истории в днях")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--append', action='store_true', help="не удалять ранее сгенерированные смены")
+    parser.add_argument('--drop', action='store_true', help="только удалить сгенерированные смены")
+    args = parser.parse_args(argv)
+
+    url = require_bench_database()
+    # Импорт бота создаёт схему БД (init_database)
+    import bot  # noqa: F401
+
+    conn = psycopg2.connect(url)
+    if args.drop or not args.append:
+        print(f"🗑 Удалено старых синтетических смен: {drop_seeded(conn)}")
+    if args.drop:
+        conn.close()
+        return 0
+
+    shifts = args.shifts or SIZES[args.size]
+    drivers = args.drivers or max(1, shifts // 200)
+    print(f"🚕 Генерируем {shifts:,} смен для {drivers:,} водителей за {args.days} дней...")
+    started = time.perf_counter()
+    seed(conn, shifts, drivers, args.days, args.seed)
+    conn.close()
+    print(f"✅ Готово за {time.perf_counter() - started:.1f} с")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
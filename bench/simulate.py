@@ -0,0 +1,262 @@
+"""Детерминированная симуляция автопарка на виртуальных часах.
+
+Синтетические водители проходят через обработчики бота дни смен: начало,
+паузы (в том числе дольше часа - с напоминаниями), завершение и ввод кассы.
+Время берётся из clock.SimulatedClock, который сдвигается прямо к следующему
+событию, поэтому дни смен проходят за секунды. Напоминания о паузах
+проверяются раз в виртуальную минуту, как в фоновом потоке бота.
+
+После прогона симуляция сверяет результат с ожидаемым: длительность без
+пауз, накопленные паузы и касса в БД, число отправленных напоминаний.
+
+    BENCH_DATABASE_URL=postgresql://localhost/taxi_bench \\
+        python -m bench.simulate --drivers 500 --days 3
+
+Со встроенным хранилищем - BENCH_DATABASE_URL=sqlite:///sim.sqlite3
+(счётчики обращений к БД считают только PostgreSQL).
+"""
+import argparse
+import heapq
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+import clock
+from bench.common import DB_COUNTERS, install_db_counters, require_bench_database
+from bench.webhook_bench import OutboundRecorder, make_update
+
+# Диапазон ID водителей симуляции (ниже синтетического автопарка seed_fleet)
+SIM_DRIVER_BASE = 5_000_000_000
+SIM_DRIVER_END = 6_000_000_000
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+REMINDER_PREFIX = '⏰ Напоминание'
+
+# Длительности пауз в минутах и их веса: часть пауз дольше часа
+PAUSE_MINUTES = [5, 15, 30, 45, 75, 100, 130]
+PAUSE_WEIGHTS = [20, 25, 20, 15, 10, 6, 4]
+
+
+class ReminderRecorder(OutboundRecorder):
+    """Ответы Bot API + подсчёт напоминаний о паузе по чатам"""
+
+    def reset(self):
+        super().reset()
+        self.reminders = {}
+
+    def __call__(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        text = str((params or {}).get('text', ''))
+        if text.startswith(REMINDER_PREFIX):
+            chat_id = int(params['chat_id'])
+            with self._lock:
+                self.reminders[chat_id] = self.reminders.get(chat_id, 0) + 1
+        return super().__call__(method, url, params, files, timeout, proxies)
+
+
+def expected_reminders(pause_minutes):
+    """Сколько напоминаний даст пауза: проверки идут на целых минутах, события - на :30 секунде,
+    поэтому последняя проверка в паузе видит pause_minutes - 1 минут"""
+    seen = pause_minutes - 1
+    if seen < 60:
+        return 0
+    return 1 + (seen - 60) // 30
+
+
+def plan_driver_day(rng, day_start, not_before):
+    """События одной смены: [(момент, текст)], ожидаемые работа/паузы/касса/напоминания.
+
+    Смена не начинается раньше not_before - конца предыдущей смены водителя.
+    """
+    if rng.random() < 0.6:
+        start_minute = int(rng.gauss(7 * 60, 60))
+    else:
+        start_minute = int(rng.gauss(16 * 60, 90))
+    start_minute = max(0, min(start_minute, 20 * 60))
+    moment = max(day_start + timedelta(minutes=start_minute, seconds=30), not_before)
+
+    events = [(moment, '🟢 Начать смену')]
+    work_minutes = rng.randint(4 * 60, 11 * 60)
+    pauses = [rng.choices(PAUSE_MINUTES, PAUSE_WEIGHTS)[0] for _ in range(rng.randint(0, 2))]
+
+    # Рабочее время делим паузами на отрезки
+    cuts = sorted(rng.sample(range(30, work_minutes - 30), len(pauses)))
+    worked = 0
+    for cut, pause in zip(cuts, pauses):
+        moment += timedelta(minutes=cut - worked)
+        worked = cut
+        events.append((moment, '⏸ Пауза/продолжить'))
+        moment += timedelta(minutes=pause)
+        events.append((moment, '▶ Продолжить'))
+    moment += timedelta(minutes=work_minutes - worked)
+    events.append((moment, '✅ Завершить смену'))
+
+    cash = int(work_minutes / 60 * rng.randint(450, 900))
+    events.append((moment + timedelta(minutes=1), str(cash)))
+
+    expected = {
+        'duration_seconds': work_minutes * 60,
+        'pause_duration_seconds': sum(pauses) * 60,
+        'cash': cash,
+        'reminders': sum(expected_reminders(p) for p in pauses),
+    }
+    return events, expected
+
+
+def cleanup_sim_drivers(bot_module):
+    bot_module.db.delete_driver_data(SIM_DRIVER_BASE, SIM_DRIVER_END)
+    for user_id in [uid for uid in bot_module.user_states if SIM_DRIVER_BASE <= uid < SIM_DRIVER_END]:
+        bot_module.user_states.pop(user_id, None)
+
+
+def verify(bot_module, expected_shifts, expected_reminder_counts, recorder):
+    """Сверяет смены в БД и напоминания с ожидаемыми; возвращает список расхождений"""
+    actual = {driver_id: bot_module.db.get_driver_shifts(driver_id) for driver_id in expected_shifts}
+
+    problems = []
+    for driver_id, shifts in expected_shifts.items():
+        got = actual.get(driver_id, [])
+        if len(got) != len(shifts):
+            problems.append(f"{driver_id}: смен {len(got)} вместо {len(shifts)}")
+            continue
+        for index, (want, have) in enumerate(zip(shifts, got)):
+            for key in ('duration_seconds', 'pause_duration_seconds', 'cash'):
+                # Длительности сравниваем с точностью до секунды
+                if abs((have[key] or 0) - want[key]) > 1:
+                    problems.append(f"{driver_id}[{index}] {key}: {have[key]} вместо {want[key]}")
+            if have['is_active']:
+                problems.append(f"{driver_id}[{index}]: смена осталась активной")
+        sent = recorder.reminders.get(driver_id, 0)
+        if sent != expected_reminder_counts[driver_id]:
+            problems.append(f"{driver_id}: напоминаний {sent} вместо {expected_reminder_counts[driver_id]}")
+    return problems
+
+
+def run_simulation(args):
+    require_bench_database()
+    install_db_counters()
+    # Напоминания проверяет сама симуляция, по виртуальным часам
+    os.environ['PAUSE_REMINDER_THREAD'] = '0'
+
+    start = MOSCOW_TZ.localize(datetime.combine(datetime(2026, 1, 5).date(), datetime.min.time()))
+    sim_clock = clock.SimulatedClock(start)
+    clock.set_clock(sim_clock)
+
+    import telebot
+    recorder = ReminderRecorder()
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = recorder
+
+    import bot as bot_module
+    bot_module.bot.threaded = False
+    cleanup_sim_drivers(bot_module)
+
+    rng = random.Random(args.seed)
+    events = []
+    sequence = itertools.count()
+    expected_shifts = {}
+    expected_reminder_counts = {}
+    for index in range(args.drivers):
+        driver_id = SIM_DRIVER_BASE + index
+        expected_shifts[driver_id] = []
+        expected_reminder_counts[driver_id] = 0
+        not_before = start
+        for day in range(args.days):
+            day_events, expected = plan_driver_day(rng, start + timedelta(days=day), not_before)
+            not_before = day_events[-1][0] + timedelta(minutes=30)
+            for moment, text in day_events:
+                heapq.heappush(events, (moment, next(sequence), driver_id, text))
+            expected_shifts[driver_id].append(expected)
+            expected_reminder_counts[driver_id] += expected['reminders']
+
+    update_ids = itertools.count(1)
+    paused = set()
+    next_tick = start + timedelta(minutes=1)
+    updates = 0
+    reminder_checks = 0
+
+    DB_COUNTERS.reset()
+    recorder.reset()
+    started = time.perf_counter()
+
+    while events:
+        moment, _, driver_id, text = heapq.heappop(events)
+
+        # Проверки пауз раз в виртуальную минуту; пока никто не на паузе - пропускаем
+        if paused:
+            while next_tick <= moment:
+                sim_clock.advance_to(next_tick)
+                bot_module.check_paused_shifts()
+                reminder_checks += 1
+                next_tick += timedelta(minutes=1)
+        else:
+            missed = max(0, int((moment - next_tick).total_seconds() // 60) + 1)
+            next_tick += timedelta(minutes=missed)
+
+        sim_clock.advance_to(moment)
+        update = telebot.types.Update.de_json(make_update(next(update_ids), driver_id, text))
+        bot_module.bot.process_new_updates([update])
+        updates += 1
+
+        if text == '⏸ Пауза/продолжить':
+            paused.add(driver_id)
+        elif text == '▶ Продолжить':
+            paused.discard(driver_id)
+
+    elapsed = time.perf_counter() - started
+    virtual_seconds = (sim_clock.now(pytz.UTC) - start).total_seconds()
+    db = DB_COUNTERS.snapshot()
+
+    problems = verify(bot_module, expected_shifts, expected_reminder_counts, recorder)
+    report = {
+        'drivers': args.drivers,
+        'days': args.days,
+        'updates': updates,
+        'reminder_checks': reminder_checks,
+        'reminders_sent': sum(recorder.reminders.values()),
+        'reminders_expected': sum(expected_reminder_counts.values()),
+        'shifts_checked': sum(len(s) for s in expected_shifts.values()),
+        'problems': len(problems),
+        'seconds': round(elapsed, 3),
+        'virtual_hours': round(virtual_seconds / 3600, 1),
+        'speedup': virtual_seconds / elapsed if elapsed else 0.0,
+        'throughput_updates_per_s': updates / elapsed if elapsed else 0.0,
+        'db_per_update': {key: value / updates for key, value in db.items()} if updates else {},
+    }
+
+    if not args.keep_data:
+        cleanup_sim_drivers(bot_module)
+    return report, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Симуляция автопарка на виртуальных часах")
+    parser.add_argument('--drivers', type=int, default=200)
+    parser.add_argument('--days', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep-data', action='store_true', help="не удалять смены симуляции")
+    args = parser.parse_args(argv)
+
+    report, problems = run_simulation(args)
+
+    print("\n🧪 Результаты симуляции")
+    print(f"   Водителей: {report['drivers']}, дней: {report['days']}, смен: {report['shifts_checked']}, "
+          f"апдейтов: {report['updates']}")
+    print(f"   Виртуально прошло {report['virtual_hours']} ч за {report['seconds']:.2f} с "
+          f"(ускорение x{report['speedup']:,.0f}), {report['throughput_updates_per_s']:.1f} апдейтов/с")
+    print(f"   Напоминаний: {report['reminders_sent']} (ожидалось {report['reminders_expected']}), "
+          f"проверок пауз: {report['reminder_checks']}")
+    print(f"   БД на апдейт: {report['db_per_update'].get('round_trips', 0):.2f} обращений")
+    if problems:
+        print(f"❌ Расхождений: {len(problems)}")
+        for problem in problems[:20]:
+            print(f"   - {problem}")
+        return 1
+    print("✅ Все смены и напоминания совпали с ожидаемыми")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""Нагрузочный бенчмарк webhook бота.
+
+Прогоняет реалистичные потоки апдейтов Telegram от N синтетических водителей
+через Flask-маршрут webhook() против локального PostgreSQL и считает
+пропускную способность, задержки p50/p95/p99 и обращения к БД на апдейт.
+
+Запуск (из корня репозитория):
+
+    BENCH_DATABASE_URL=postgresql://localhost/taxi_bench \\
+        python -m bench.webhook_bench --drivers 50 --shifts 3 --save-baseline
+
+    python -m bench.webhook_bench --drivers 50 --shifts 3 --compare
+
+Исходящие запросы к Telegram не уходят в сеть: по умолчанию ответы Bot API
+подставляются прямо в процессе, а с --fake-api бот ходит по HTTP в локальный
+фейковый Bot API (bench/fake_telegram.py), который может тормозить и отвечать
+429 - так видно поведение обработчиков при медленном Telegram:
+
+    python -m bench.webhook_bench --fake-api --api-latency 0.2 --api-chat-rate 1
+
+Обработчики выполняются синхронно (bot.threaded = False), чтобы задержка
+включала всю обработку апдейта.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.common import (
+    DB_COUNTERS, compare_with_baseline, install_db_counters, latency_summary,
+    load_baseline, require_bench_database, save_baseline
+)
+from bench.fake_telegram import ERROR_REPLY_MARKERS, FakeTelegramServer
+
+# Синтетические водители получают ID из отдельного диапазона, чтобы их можно было удалить
+BENCH_DRIVER_BASE = 7_000_000_000
+
+
+class FakeTelegramResponse:
+    """Минимальный ответ Bot API для telebot.apihelper"""
+
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+
+class OutboundRecorder:
+    """Подставляет ответы Bot API и считает исходящие сообщения"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.started = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            window = time.monotonic() - self.started
+            return {
+                'calls': self.calls,
+                'messages_sent': self.calls,
+                'rate_limited': 0,
+                'error_replies': self.errors,
+                'messages_per_s': self.calls / window if window > 0 else 0.0
+            }
+
+    def __call__(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        params = params or {}
+        text = str(params.get('text', ''))
+        with self._lock:
+            self.calls += 1
+            if text.startswith(ERROR_REPLY_MARKERS):
+                self.errors += 1
+            message_id = next(self._message_ids)
+
+        return FakeTelegramResponse({
+            'ok': True,
+            'result': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'text': text
+            }
+        })
+
+
+def driver_stream(shifts, rng):
+    """Сценарий одного водителя: смены с паузой, ввод кассы, отчёты и планы"""
+    texts = ['/start', '🚗 Смена']
+    for _ in range(shifts):
+        texts += [
+            '🟢 Начать смену',
+            '⏸ Пауза/продолжить',
+            '▶ Продолжить',
+            '✅ Завершить смену',
+            str(rng.randint(500, 9000)),
+            '📊 Мои смены',
+            '🎯 План',
+            '📅 План на месяц',
+            '◀️ Назад к планам',
+            '🔄 План на неделю',
+            '◀️ Назад к планам',
+            '◀️ Назад',
+            '🚗 Смена',
+        ]
+    return texts
+
+
+def make_update(update_id, driver_id, text):
+    return json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': driver_id, 'type': 'private'},
+            'from': {'id': driver_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text
+        }
+    })
+
+
+def cleanup_bench_drivers(bot_module):
+    """Удаляет данные синтетических водителей"""
+    bot_module.db.delete_driver_data(BENCH_DRIVER_BASE, 2 ** 63 - 1)
+    for user_id in [uid for uid in bot_module.user_states if uid >= BENCH_DRIVER_BASE]:
+        bot_module.user_states.pop(user_id, None)
+
+
+def run_benchmark(args):
+    require_bench_database()
+    install_db_counters()
+
+    import telebot
+    if args.fake_api:
+        outbound = FakeTelegramServer(
+            latency=args.api_latency,
+            chat_rate=args.api_chat_rate,
+            global_rate=args.api_global_rate
+        ).start()
+        os.environ['TELEGRAM_API_URL'] = outbound.api_url
+    else:
+        outbound = OutboundRecorder()
+        telebot.apihelper.CUSTOM_REQUEST_SENDER = outbound
+
+    import bot as bot_module
+    bot_module.bot.threaded = False
+    cleanup_bench_drivers(bot_module)
+
+    rng = random.Random(args.seed)
+    streams = {
+        BENCH_DRIVER_BASE + i: driver_stream(args.shifts, rng)
+        for i in range(args.drivers)
+    }
+    update_ids = itertools.count(1)
+    update_ids_lock = threading.Lock()
+    latencies = []
+    failed = []
+    latencies_lock = threading.Lock()
+
+    def replay(driver_id, texts):
+        client = bot_module.app.test_client()
+        own = []
+        own_failed = 0
+        for text in texts:
+            with update_ids_lock:
+                update_id = next(update_ids)
+            body = make_update(update_id, driver_id, text)
+            started = time.perf_counter()
+            response = client.post('/', data=body, content_type='application/json')
+            own.append(time.perf_counter() - started)
+            # 500 - исключение в обработчике (например, 429 от Telegram вне try)
+            if response.status_code != 200:
+                own_failed += 1
+        with latencies_lock:
+            latencies.extend(own)
+            failed.append(own_failed)
+
+    DB_COUNTERS.reset()
+    outbound.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency or args.drivers) as executor:
+        for future in [executor.submit(replay, d, t) for d, t in streams.items()]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    db = DB_COUNTERS.snapshot()
+    telegram = outbound.stats()
+    updates = len(latencies)
+    report = {
+        'drivers': args.drivers,
+        'shifts_per_driver': args.shifts,
+        'updates': updates,
+        'failed_updates': sum(failed),
+        'seconds': round(elapsed, 3),
+        'throughput_updates_per_s': updates / elapsed if elapsed else 0.0,
+        'latency': latency_summary(latencies),
+        'db': db,
+        'db_per_update': {key: value / updates for key, value in db.items()} if updates else {},
+        'telegram': {
+            'calls': telegram['calls'],
+            'calls_per_update': telegram['calls'] / updates if updates else 0.0,
+            'messages_per_s': telegram['messages_per_s'],
+            'rate_limited': telegram['rate_limited'],
+            'error_replies': telegram['error_replies']
+        }
+    }
+
+    if not args.keep_data:
+        cleanup_bench_drivers(bot_module)
+    if args.fake_api:
+        outbound.stop()
+    return report
+
+
+def print_report(report):
+    latency = report['latency']
+    print("\n📊 Результаты webhook-бенчмарка")
+    print(f"   Водителей: {report['drivers']}, апдейтов: {report['updates']} "
+          f"(с ошибкой: {report['failed_updates']}), время: {report['seconds']:.2f} с")
+    print(f"   Пропускная способность: {report['throughput_updates_per_s']:.1f} апдейтов/с")
+    print(f"   Задержка: p50 {latency['p50_ms']:.1f} мс | p95 {latency['p95_ms']:.1f} мс | "
+          f"p99 {latency['p99_ms']:.1f} мс | max {latency['max_ms']:.1f} мс")
+    per_update = report['db_per_update']
+    print(f"   БД на апдейт: {per_update.get('round_trips', 0):.2f} обращений "
+          f"({per_update.get('connects', 0):.2f} подключений, {per_update.get('queries', 0):.2f} запросов, "
+          f"{per_update.get('commits', 0):.2f} коммитов)")
+    telegram = report['telegram']
+    print(f"   Telegram: {telegram['calls_per_update']:.2f} вызовов на апдейт, "
+          f"{telegram['messages_per_s']:.1f} сообщений/с, 429: {telegram['rate_limited']}, "
+          f"ответов с ошибкой: {telegram['error_replies']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк webhook бота")
+    parser.add_argument('--drivers', type=int, default=20, help="число синтетических водителей")
+    parser.add_argument('--shifts', type=int, default=2, help="смен на водителя")
+    parser.add_argument('--concurrency', type=int, default=0, help="потоков (по умолчанию = водителей)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default='webhook', help="имя базового файла в bench/baselines")
+    parser.add_argument('--save-baseline', action='store_true', help="сохранить результат как базовый")
+    parser.add_argument('--compare', action='store_true', help="сравнить с базовым результатом")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое ухудшение (доля)")
+    parser.add_argument('--fake-api', action='store_true', help="ходить в локальный фейковый Bot API по HTTP")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="задержка фейкового Bot API, с")
+    parser.add_argument('--api-chat-rate', type=int, default=0, help="лимит сообщений/с на чат (429)")
+    parser.add_argument('--api-global-rate', type=int, default=0, help="общий лимит сообщений/с (429)")
+    parser.add_argument('--keep-data', action='store_true', help="не удалять данные синтетических водителей")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    exit_code = 0
+    if args.compare:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"⚠️ Базовый файл '{args.baseline}' не найден")
+        else:
+            print("\n📈 Сравнение с базой:")
+            if compare_with_baseline(report, baseline, args.threshold):
+                exit_code = 1
+    if args.save_baseline:
+        save_baseline(args.baseline, report)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,172 +1,58 @@
 import telebot
-import datetime
 import time
-import traceback
 import os
 import pytz
 import random
-import psycopg2
 import threading
-from psycopg2.extras import RealDictCursor
 from telebot import types
 from datetime import datetime, timedelta
 
+import numpy as np
+
+import cache
+import clock
+import cluster
+import heatmap
+import leader
+import maintenance
+import metrics
+import profiling
+from log_setup import configure_logging
+from storage import get_storage
+
+logger = configure_logging()
+
 
 # --- Инициализация БД ---
+# Хранилище выбирается по DATABASE_URL: PostgreSQL или встроенный SQLite (sqlite:///файл).
+# READ_DATABASE_URL - необязательная реплика для отчётов и планов; после своей записи
+# водитель READ_AFTER_WRITE_SECONDS секунд читает с основной БД
+db = get_storage(
+    os.environ['DATABASE_URL'],
+    os.environ.get('READ_DATABASE_URL'),
+    float(os.environ.get('READ_AFTER_WRITE_SECONDS', '30'))
+)
+
 def init_database():
     """Создаёт таблицы если их нет"""
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    # Создаем базовую таблицу (без новых полей для обратной совместимости)
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS shifts (
-            id SERIAL PRIMARY KEY,
-            driver_id BIGINT NOT NULL,
-            start_time TIMESTAMP NOT NULL,
-            end_time TIMESTAMP NOT NULL,
-            duration_text VARCHAR(50),
-            duration_seconds INTEGER,
-            cash INTEGER NOT NULL CHECK (cash >= 0),
-            hourly_rate INTEGER CHECK (hourly_rate >= 0),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # СОЗДАЕМ ТАБЛИЦУ ДЛЯ АДМИНКИ (ДОБАВЬ ЭТОТ БЛОК)
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS shift_edits (
-            id SERIAL PRIMARY KEY,
-            shift_id INTEGER NOT NULL REFERENCES shifts(id) ON DELETE CASCADE,
-            editor_id BIGINT NOT NULL,
-            edited_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            reason TEXT,
-            old_start_time TIMESTAMP,
-            new_start_time TIMESTAMP,
-            old_end_time TIMESTAMP,
-            new_end_time TIMESTAMP,
-            old_cash INTEGER,
-            new_cash INTEGER,
-            old_hourly_rate INTEGER,
-            new_hourly_rate INTEGER
-        )
-    ''')
-    
-        # Создаем таблицу месячных планов
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS monthly_plans (
-            id SERIAL PRIMARY KEY,
-            driver_id BIGINT NOT NULL,
-            target_amount INTEGER NOT NULL CHECK (target_amount >= 0),
-            year INTEGER NOT NULL,
-            month INTEGER NOT NULL CHECK (month >= 1 AND month <= 12),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(driver_id, year, month)
-        )
-    ''')
-    #     # Создаем таблицу недельных планов
-    # cur.execute('''
-    #     CREATE TABLE IF NOT EXISTS weekly_plans (
-    #         id SERIAL PRIMARY KEY,
-    #         driver_id BIGINT NOT NULL,
-    #         target_amount INTEGER NOT NULL CHECK (target_amount >= 0),
-    #         week_year INTEGER NOT NULL,  # Год недели по ISO
-    #         week_number INTEGER NOT NULL CHECK (week_number >= 1 AND week_number <= 53),
-    #         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    #         UNIQUE(driver_id, week_year, week_number)
-    #     )
-    # ''')
-
-    conn.commit()
-    print("✅ База данных инициализирована (базовая структура)")
-    
-    # Теперь добавляем новые поля если их нет
-    print("🔧 Проверяем наличие новых полей...")
-    
-    # Список полей для добавления
-    new_columns = [
-        ('is_active', 'BOOLEAN DEFAULT FALSE'),
-        ('is_paused', 'BOOLEAN DEFAULT FALSE'),
-        ('pause_start_time', 'TIMESTAMP'),
-        ('pause_duration_seconds', 'INTEGER DEFAULT 0'),
-        ('awaiting_cash_input', 'BOOLEAN DEFAULT FALSE')
-    ]
-    
-    for column_name, column_type in new_columns:
-        try:
-            cur.execute(f'''
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name='shifts' AND column_name='{column_name}'
-            ''')
-            
-            if not cur.fetchone():
-                print(f"   Добавляем поле {column_name}...")
-                cur.execute(f'ALTER TABLE shifts ADD COLUMN {column_name} {column_type}')
-                conn.commit()
-                print(f"   ✅ Поле {column_name} добавлено")
-            else:
-                print(f"   ✅ Поле {column_name} уже существует")
-                
-        except Exception as e:
-            print(f"   ⚠️ Ошибка при добавлении поля {column_name}: {e}")
-            conn.rollback()
-    
-    # Создаем индексы (после добавления всех полей)
-    print("🔧 Создаем индексы...")
-    
-    try:
-        cur.execute('''
-            CREATE INDEX IF NOT EXISTS idx_shifts_driver_id 
-            ON shifts(driver_id)
-        ''')
-        print("   ✅ Индекс idx_shifts_driver_id создан")
-    except Exception as e:
-        print(f"   ⚠️ Ошибка при создании idx_shifts_driver_id: {e}")
-    
-    try:
-        # Проверяем есть ли уже поле is_active перед созданием индекса
-        cur.execute('''
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='shifts' AND column_name='is_active'
-        ''')
-        
-        if cur.fetchone():
-            cur.execute('''
-                CREATE INDEX IF NOT EXISTS idx_shifts_active 
-                ON shifts(driver_id, is_active) 
-                WHERE is_active = TRUE
-            ''')
-            print("   ✅ Индекс idx_shifts_active создан")
-        else:
-            print("   ⏭️ Поле is_active отсутствует, индекс не создан")
-    except Exception as e:
-        print(f"   ⚠️ Ошибка при создании idx_shifts_active: {e}")
-    
-    # ДОБАВЛЯЕМ ИНДЕКС ДЛЯ shift_edits (ВАЖНО!)
-    try:
-        cur.execute('''
-            CREATE INDEX IF NOT EXISTS idx_shift_edits_shift_id 
-            ON shift_edits(shift_id)
-        ''')
-        print("   ✅ Индекс idx_shift_edits_shift_id создан")
-    except Exception as e:
-        print(f"   ⚠️ Ошибка при создании idx_shift_edits_shift_id: {e}")
-    
-    cur.close()
-    conn.close()
-    print("🎉 Инициализация БД завершена!")
+    db.init_schema()
+    logger.info("🎉 Инициализация БД завершена!")
 
 init_database()
 
 # --- Константы и утилиты ---
+# Адрес Bot API можно переопределить (локальный сервер для тестов и бенчмарков),
+# формат: http://127.0.0.1:8081/bot{0}/{1}
+if os.environ.get('TELEGRAM_API_URL'):
+    telebot.apihelper.API_URL = os.environ['TELEGRAM_API_URL']
+
 bot = telebot.TeleBot(os.environ['BOT_TOKEN'])
+bot.send_message = metrics.track_telegram('sendMessage', bot.send_message)
 
 MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 def get_moscow_time():
     """Возвращает текущее время по Москве (UTC+3)"""
-    utc_now = datetime.datetime.now(pytz.UTC)
+    utc_now = clock.now(pytz.UTC)
     return utc_now.astimezone(MOSCOW_TZ)
 
 def format_seconds_to_words(seconds):
@@ -232,124 +118,120 @@ def ensure_timezone_naive(dt):
 # --- Состояния пользователей ---
 user_states = {}
 
-# --- Напоминания о паузах ---
-def start_pause_reminder_checker():
-    """Запускает фоновый поток для проверки пауз"""
-    def checker_loop():
+# --- Фоновые задачи: напоминания о паузах и обслуживание ---
+# Выполняет только ведущая реплика (leader.py); сразу после избрания и затем раз в
+# MAINTENANCE_INTERVAL_MINUTES она же обслуживает БД (maintenance.py)
+MAINTENANCE_INTERVAL_MINUTES = int(os.environ.get('MAINTENANCE_INTERVAL_MINUTES', '10'))
+
+def start_background_jobs(election):
+    """Запускает фоновый поток задач ведущей реплики"""
+    def jobs_loop():
+        minutes = 0
+        next_maintenance = 0
         while True:
-            time.sleep(60)  # Проверяем каждую минуту
-            check_paused_shifts()
+            clock.sleep(60)  # Проверяем каждую минуту
+            minutes += 1
+            if not election.is_leader:
+                next_maintenance = minutes  # Новый ведущий начинает с обслуживания
+                continue
+            with metrics.handler_context('pause_reminders'):
+                check_paused_shifts()
+            if minutes >= next_maintenance:
+                with metrics.handler_context('maintenance'):
+                    cleanup_old_states()
+                next_maintenance = minutes + MAINTENANCE_INTERVAL_MINUTES
     
-    thread = threading.Thread(target=checker_loop, daemon=True)
+    thread = threading.Thread(target=jobs_loop, daemon=True, name='background-jobs')
     thread.start()
-    print("✅ Запущен проверщик напоминаний о паузах")
+    logger.info("✅ Запущен поток фоновых задач")
+    return thread
+
+def send_pause_reminder(user_id, shift, minutes, text):
+    """Отмечает напоминание в БД и отправляет его. Отметка до отправки: другая
+    реплика, ставшая ведущей, не повторит уже отправленное напоминание"""
+    previous = shift['last_pause_reminder_minutes']
+    if not db.claim_pause_reminder(user_id, shift['pause_start_time'], previous, minutes):
+        return False
+    try:
+        bot.send_message(user_id, text)
+    except Exception:
+        # Не отправилось - возвращаем отметку, чтобы повторить на следующей проверке
+        db.claim_pause_reminder(user_id, shift['pause_start_time'], minutes, previous)
+        raise
+    return True
 
 def check_paused_shifts():
     """Проверяет смены на паузе и отправляет напоминания"""
     current_time = get_moscow_time()
     
-    for user_id, state in list(user_states.items()):  # Используем list для копирования
+    try:
+        # Паузы короче часа напоминаний не требуют
+        paused = db.paused_shifts(ensure_timezone_naive(current_time - timedelta(minutes=60)))
+    except Exception as e:
+        logger.warning("⚠️ Ошибка при получении смен на паузе: %s", e, exc_info=True)
+        return
+    
+    for shift in paused:
+        user_id = shift['driver_id']
         try:
-            if (state.get('is_working') and 
-                state.get('is_paused') and 
-                state.get('pause_start_time')):
-                
-                pause_duration = current_time - state['pause_start_time']
-                total_minutes = int(pause_duration.total_seconds() // 60)
+            pause_duration = current_time - ensure_timezone_aware(shift['pause_start_time'])
+            total_minutes = int(pause_duration.total_seconds() // 60)
+            
+            # Проверяем, не отправляли ли уже напоминание
+            last_reminder = shift['last_pause_reminder_minutes']
+            
+            # Напоминание через 1 час (60 минут)
+            if total_minutes >= 60 and last_reminder < 60:
+                if send_pause_reminder(
+                    user_id, shift, 60,
+                    f"⏰ Напоминание: смена на паузе уже 1 час\n"
+                    f"Не забудь продолжить работу!"
+                ):
+                    logger.info("⏰ Напоминание отправлено пользователю %s (1 час)", user_id)
+            
+            # Напоминание каждые 30 минут после первого часа
+            elif total_minutes >= 90 and (total_minutes - last_reminder) >= 30:
+                hours = total_minutes // 60
+                minutes = total_minutes % 60
                 
-                # Проверяем, не отправляли ли уже напоминание
-                last_reminder = state.get('last_pause_reminder_minutes', 0)
+                time_str = f"{hours} ч" if minutes == 0 else f"{hours} ч {minutes} мин"
                 
-                # Напоминание через 1 час (60 минут)
-                if total_minutes >= 60 and last_reminder < 60:
-                    bot.send_message(
-                        user_id,
-                        f"⏰ Напоминание: смена на паузе уже 1 час\n"
-                        f"Не забудь продолжить работу!"
-                    )
-                    state['last_pause_reminder_minutes'] = 60
-                    print(f"⏰ Напоминание отправлено пользователю {user_id} (1 час)")
+                if send_pause_reminder(
+                    user_id, shift, total_minutes,
+                    f"⏰ Напоминание: смена на паузе уже {time_str}\n"
+                    f"Продолжить или завершить смену?"
+                ):
+                    logger.info("⏰ Напоминание отправлено пользователю %s (%s)", user_id, time_str)
                 
-                # Напоминание каждые 30 минут после первого часа
-                elif total_minutes >= 90 and (total_minutes - last_reminder) >= 30:
-                    hours = total_minutes // 60
-                    minutes = total_minutes % 60
-                    
-                    time_str = f"{hours} ч" if minutes == 0 else f"{hours} ч {minutes} мин"
-                    
-                    bot.send_message(
-                        user_id,
-                        f"⏰ Напоминание: смена на паузе уже {time_str}\n"
-                        f"Продолжить или завершить смену?"
-                    )
-                    state['last_pause_reminder_minutes'] = total_minutes
-                    print(f"⏰ Напоминание отправлено пользователю {user_id} ({time_str})")
-                    
         except Exception as e:
-            print(f"⚠️ Ошибка при проверке паузы для {user_id}: {e}")
+            logger.warning("⚠️ Ошибка при проверке паузы для %s: %s", user_id, e, exc_info=True)
 
 def get_active_shift(user_id):
     """Получает активную смену пользователя из БД"""
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Сначала проверяем есть ли поле is_active в таблице
-        cur.execute('''
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='shifts' AND column_name='is_active'
-        ''')
-        
-        has_is_active = cur.fetchone()
-        
-        if not has_is_active:
-            print(f"⚠️ Поле is_active отсутствует в таблице для пользователя {user_id}")
-            cur.close()
-            conn.close()
-            return None
-        
-        # Проверяем есть ли активные смены у пользователя
-        cur.execute('''
-            SELECT * FROM shifts 
-            WHERE driver_id = %s 
-              AND is_active = TRUE 
-            ORDER BY start_time DESC 
-            LIMIT 1
-        ''', (user_id,))
-        
-        shift = cur.fetchone()
-        cur.close()
-        conn.close()
+        shift = db.get_active_shift(user_id)
         
         if shift:
-            print(f"✅ Найдена активная смена в БД для пользователя {user_id}")
-            print(f"   ID смены: {shift['id']}")
-            print(f"   Начало: {shift['start_time']}")
-            print(f"   Пауза: {'Да' if shift['is_paused'] else 'Нет'}")
+            logger.debug("✅ Найдена активная смена в БД для пользователя %s: ID %s, начало %s, пауза %s",
+                         user_id, shift['id'], shift['start_time'], shift['is_paused'])
             return shift
         else:
-            print(f"📭 Нет активных смен в БД для пользователя {user_id}")
+            logger.debug("📭 Нет активных смен в БД для пользователя %s", user_id)
             return None
             
-    except psycopg2.Error as e:
-        print(f"❌ Ошибка PostgreSQL при получении активной смены: {e}")
-        return None
     except Exception as e:
-        print(f"❌ Неожиданная ошибка при получении активной смены: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка БД при получении активной смены: %s", e)
         return None
 
 def get_user_state(user_id):
     """Возвращает состояние пользователя, создаёт если нет. Восстанавливает из БД если есть активная смена."""
     # Если уже есть в памяти - возвращаем
     if user_id in user_states:
-        print(f"📦 Используем состояние из памяти для пользователя {user_id}")
+        logger.debug("📦 Используем состояние из памяти для пользователя %s", user_id)
         return user_states[user_id]
     
     # Проверяем БД на наличие активной смены
-    print(f"🔍 Проверяем БД на активные смены для пользователя {user_id}")
+    logger.debug("🔍 Проверяем БД на активные смены для пользователя %s", user_id)
     active_shift = get_active_shift(user_id)
     
     # ВАЖНО: Проверяем что active_shift не None и является словарем
@@ -367,14 +249,14 @@ def get_user_state(user_id):
             'plan_type': None,
             'current_plan_menu': None
         }
-        print(f"🆕 Создано новое состояние для пользователя {user_id}")
+        logger.debug("🆕 Создано новое состояние для пользователя %s", user_id)
         return user_states[user_id]
     
     # Восстанавливаем состояние из БД
     try:
         start_time = active_shift.get('start_time')
         if not start_time:
-            print(f"❌ Нет start_time в данных смены для пользователя {user_id}")
+            logger.error("❌ Нет start_time в данных смены для пользователя %s", user_id)
             # Создаем новое состояние при ошибке данных
             user_states[user_id] = {
                 'is_working': False,
@@ -391,7 +273,7 @@ def get_user_state(user_id):
             return user_states[user_id]
         
         if isinstance(start_time, str):
-            start_time = datetime.datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+            start_time = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
         
         # Приводим start_time к aware (с часовым поясом)
         if start_time.tzinfo is None:
@@ -400,77 +282,67 @@ def get_user_state(user_id):
             # Если уже имеет пояс, конвертируем в московский
             start_time = start_time.astimezone(MOSCOW_TZ)
         
+        # В состоянии время начала сдвинуто вперёд на все завершённые паузы (как при "Продолжить"),
+        # поэтому рабочее время - это конец (или начало текущей паузы) минус shift_start_time
+        total_pause_seconds = active_shift.get('pause_duration_seconds') or 0
+        
         user_states[user_id] = {
             'is_working': True,
-            'shift_start_time': start_time,
-            'is_paused': active_shift.get('is_paused', False),
-            'pause_start_time': active_shift.get('pause_start_time'),
-            'awaiting_cash_input': active_shift.get('awaiting_cash_input', False),
-            'pending_shift_data': None,  # Всегда None при восстановлении
+            'shift_start_time': start_time + timedelta(seconds=total_pause_seconds),
+            'is_paused': bool(active_shift.get('is_paused')),
+            'pause_start_time': None,
+            'awaiting_cash_input': bool(active_shift.get('awaiting_cash_input')),
+            'pending_shift_data': None,
             'shift_id': active_shift.get('id'),
             'awaiting_plan_input': False,
             'plan_type': None,
-            'current_plan_menu': None    # сохраняем ID смены для обновлений
+            'current_plan_menu': None
         }
+        state = user_states[user_id]
         
-        print(f"✅ Восстановлено состояние из БД для пользователя {user_id}")
-        print(f"   ID смены: {active_shift.get('id')}")
-        print(f"   Начало: {start_time.strftime('%d.%m.%Y %H:%M')}")
-        print(f"   Пауза: {'Да' if user_states[user_id]['is_paused'] else 'Нет'}")
-        print(f"   Ожидает кассу: {'Да' if user_states[user_id]['awaiting_cash_input'] else 'Нет'}")
-        
-        # --- ВАЖНОЕ ИСПРАВЛЕНИЕ: ---
-        # Если смена ожидает кассу, но у нас нет данных - сбрасываем флаг
-        if user_states[user_id]['awaiting_cash_input'] and not user_states[user_id].get('pending_shift_data'):
-            print(f"⚠️ Восстановлена смена в состоянии ожидания кассы без данных. Сбрасываем флаг.")
-            user_states[user_id]['awaiting_cash_input'] = False
+        if state['is_paused'] and active_shift.get('pause_start_time'):
+            pause_start = active_shift['pause_start_time']
+            if isinstance(pause_start, str):
+                pause_start = datetime.fromisoformat(pause_start.replace('Z', '+00:00'))
+            state['pause_start_time'] = ensure_timezone_aware(pause_start)
+            logger.debug("⏸ Смена на паузе с %s, накоплено пауз: %s сек", state['pause_start_time'],
+                         total_pause_seconds)
+        elif state['is_paused']:
+            logger.warning("⚠️ Смена на паузе без времени начала паузы. Снимаем паузу.")
+            state['is_paused'] = False
+        
+        # Смена ждёт кассу: данные для завершения восстанавливаем из БД (конец смены
+        # записан при нажатии "Завершить смену"), чтобы ввод кассы работал на любой реплике
+        if state['awaiting_cash_input']:
+            end_time = active_shift.get('end_time')
+            if end_time and end_time != active_shift.get('start_time'):
+                end_time = ensure_timezone_aware(end_time)
+                work_until = state['pause_start_time'] if state['is_paused'] else end_time
+                state['pending_shift_data'] = {
+                    'start_time': state['shift_start_time'],
+                    'end_time': end_time,
+                    'duration_str': format_duration(max(0, (work_until - state['shift_start_time']).total_seconds()))
+                }
+        
+        logger.info("✅ Восстановлено состояние из БД для пользователя %s: ID смены %s, начало %s, "
+                    "пауза %s, ожидает кассу %s",
+                    user_id, active_shift.get('id'), start_time, state['is_paused'],
+                    state['awaiting_cash_input'])
+        
+        # Если смена ожидает кассу, но данных нет - сбрасываем флаг
+        if state['awaiting_cash_input'] and not state.get('pending_shift_data'):
+            logger.warning("⚠️ Восстановлена смена в состоянии ожидания кассы без данных. Сбрасываем флаг.")
+            state['awaiting_cash_input'] = False
             
             # Обновляем в БД
             try:
-                conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                cur = conn.cursor()
-                cur.execute('''
-                    UPDATE shifts 
-                    SET awaiting_cash_input = FALSE
-                    WHERE driver_id = %s AND is_active = TRUE
-                ''', (user_id,))
-                conn.commit()
-                cur.close()
-                conn.close()
-                print(f"   ✅ Сброшен awaiting_cash_input в БД")
+                db.set_awaiting_cash(user_id, False)
+                logger.debug("✅ Сброшен awaiting_cash_input в БД")
             except Exception as e:
-                print(f"   ❌ Ошибка при обновлении БД: {e}")
-        
-        # Если смена на паузе, корректируем время начала
-        if user_states[user_id]['is_paused'] and active_shift.get('pause_start_time'):
-            pause_start = active_shift['pause_start_time']
-            if isinstance(pause_start, str):
-                pause_start = datetime.datetime.fromisoformat(pause_start.replace('Z', '+00:00'))
-            
-            # Приводим pause_start к aware
-            if pause_start.tzinfo is None:
-                pause_start = MOSCOW_TZ.localize(pause_start)
-            else:
-                pause_start = pause_start.astimezone(MOSCOW_TZ)
-            
-            user_states[user_id]['pause_start_time'] = pause_start
-            
-            # Учитываем уже накопленное время пауз
-            total_pause_seconds = active_shift.get('pause_duration_seconds', 0)
-            
-            # Добавляем текущую паузу
-            current_time = get_moscow_time()
-            current_pause = (current_time - pause_start).total_seconds()
-            total_pause_seconds += current_pause
-            
-            print(f"   ⏸ Смена на паузе. Накоплено пауз: {total_pause_seconds:.0f} сек")
-            
-            # Сдвигаем время начала на общее время пауз
-            user_states[user_id]['shift_start_time'] -= datetime.timedelta(seconds=total_pause_seconds)
-            print(f"   Скорректировано время начала с учетом пауз")
+                logger.exception("❌ Ошибка при обновлении БД: %s", e)
         
     except KeyError as e:
-        print(f"❌ Ошибка ключа в данных смены: {e}")
+        logger.exception("❌ Ошибка ключа в данных смены: %s", e)
         # Создаем новое состояние при ошибке данных
         user_states[user_id] = {
             'is_working': False,
@@ -482,9 +354,7 @@ def get_user_state(user_id):
             'shift_id': None
         }
     except Exception as e:
-        print(f"❌ Неожиданная ошибка при восстановлении состояния: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Неожиданная ошибка при восстановлении состояния: %s", e)
         # Создаем новое состояние при ошибке
         user_states[user_id] = {
             'is_working': False,
@@ -500,7 +370,7 @@ def get_user_state(user_id):
 
 # --- Работа с БД ---
 def save_shift_to_db(user_id, start_time, end_time, duration_str, cash, hourly_rate):
-    """Сохраняет смену в PostgreSQL"""
+    """Сохраняет смену в БД"""
     try:
         # Конвертируем времена в offset-naive для БД
         if start_time.tzinfo is not None:
@@ -510,126 +380,41 @@ def save_shift_to_db(user_id, start_time, end_time, duration_str, cash, hourly_r
         
         duration_seconds = int((end_time - start_time).total_seconds())
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        cur.execute('''
-            INSERT INTO shifts 
-            (driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (user_id, start_time, end_time, duration_str, duration_seconds, cash, hourly_rate))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        print(f"✅ Смена сохранена в БД для пользователя {user_id}")
+        db.add_shift(user_id, start_time, end_time, duration_str, duration_seconds, cash, hourly_rate)
+        logger.info("✅ Смена сохранена в БД для пользователя %s", user_id)
     except Exception as e:
-        print(f"❌ Ошибка при сохранении смены: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка при сохранении смены: %s", e)
 
 def get_user_shifts_grouped_by_date(user_id):
     """Возвращает смены пользователя сгруппированные по дате (текущий месяц)"""
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
     # Текущий месяц по московскому времени
-    now_moscow = datetime.datetime.now(MOSCOW_TZ)
+    now_moscow = get_moscow_time()
     month_start = now_moscow.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_end = (month_start + datetime.timedelta(days=32)).replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1)
     
-    cur.execute('''
-        SELECT 
-            DATE(start_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow') as shift_date,
-            COUNT(*) as shifts_count,
-            SUM(duration_seconds) as total_seconds,
-            SUM(cash) as total_cash,
-            CASE 
-                WHEN SUM(duration_seconds) > 0 
-                THEN (SUM(cash) / (SUM(duration_seconds) / 3600.0))::INTEGER
-                ELSE 0
-            END as avg_hourly_rate
-        FROM shifts 
-        WHERE driver_id = %s 
-          AND start_time >= %s
-          AND start_time < %s
-        GROUP BY DATE(start_time AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Moscow')
-        ORDER BY shift_date DESC
-    ''', (user_id, month_start, month_end))
-    
-    shifts = cur.fetchall()
-    cur.close()
-    conn.close()
-    return shifts
+    return db.shifts_grouped_by_date(user_id, month_start, month_end)
 
 def start_shift_in_db(user_id, start_time):
     """Создает новую активную смену в БД"""
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
     try:
-        # Сначала завершаем старые активные смены (на всякий случай)
-        cur.execute('''
-            UPDATE shifts 
-            SET is_active = FALSE 
-            WHERE driver_id = %s AND is_active = TRUE
-        ''', (user_id,))
-        
-        # Создаем новую смену
-        cur.execute('''
-            INSERT INTO shifts 
-            (driver_id, start_time, end_time, cash, hourly_rate, is_active)
-            VALUES (%s, %s, %s, 0, 0, TRUE)
-            RETURNING id
-        ''', (user_id, start_time, start_time))
-        
-        shift_id = cur.fetchone()[0]
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        print(f"✅ Смена #{shift_id} создана для пользователя {user_id}")
+        shift_id = db.start_shift(user_id, start_time)
+        logger.info("✅ Смена #%s создана для пользователя %s", shift_id, user_id)
         return shift_id
     except Exception as e:
-        print(f"❌ Ошибка при создании смены: {e}")
-        conn.rollback()
-        cur.close()
-        conn.close()
+        logger.exception("❌ Ошибка при создании смены: %s", e)
         return None
 
 def update_shift_pause(user_id, is_paused, pause_start_time=None):
     """Обновляет состояние паузы в активной смене"""
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        if is_paused:
-            cur.execute('''
-                UPDATE shifts 
-                SET is_paused = TRUE, 
-                    pause_start_time = %s
-                WHERE driver_id = %s 
-                  AND is_active = TRUE
-            ''', (pause_start_time, user_id))
-        else:
-            # Снимаем паузу и обновляем общее время пауз
-            cur.execute('''
-                UPDATE shifts 
-                SET is_paused = FALSE,
-                    pause_duration_seconds = pause_duration_seconds + 
-                        EXTRACT(EPOCH FROM (NOW() - pause_start_time))
-                WHERE driver_id = %s 
-                  AND is_active = TRUE
-            ''', (user_id,))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        # Время паузы храним по Москве без пояса - как pause_start_time
+        pause_start_time = ensure_timezone_naive(pause_start_time)
+        now_naive = ensure_timezone_naive(get_moscow_time())
         
-        print(f"✅ Пауза обновлена для пользователя {user_id}")
+        db.update_pause(user_id, is_paused, pause_start_time, now_naive)
+        logger.info("✅ Пауза обновлена для пользователя %s", user_id)
     except Exception as e:
-        print(f"❌ Ошибка при обновлении паузы: {e}")
+        logger.exception("❌ Ошибка при обновлении паузы: %s", e)
 
 def complete_shift_in_db(user_id, start_time, end_time, duration_str, cash, hourly_rate):
     """Завершает смену в БД"""
@@ -641,84 +426,24 @@ def complete_shift_in_db(user_id, start_time, end_time, duration_str, cash, hour
         # Считаем длительность
         duration_seconds = int((end_time_naive - start_time_naive).total_seconds())
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
         # Завершаем смену, обновляя start_time
-        cur.execute('''
-            UPDATE shifts 
-            SET start_time = %s,
-                end_time = %s,
-                duration_text = %s,
-                duration_seconds = %s,
-                cash = %s,
-                hourly_rate = %s,
-                is_active = FALSE,
-                is_paused = FALSE,
-                awaiting_cash_input = FALSE
-            WHERE driver_id = %s 
-              AND is_active = TRUE
-            RETURNING id
-        ''', (start_time_naive, end_time_naive, duration_str, duration_seconds, cash, hourly_rate, user_id))
-        
-        shift_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
+        shift_id = db.complete_shift(user_id, start_time_naive, end_time_naive, duration_str,
+                                     duration_seconds, cash, hourly_rate)
+        if shift_id is None:
+            logger.error("❌ Нет активной смены для завершения у пользователя %s", user_id)
+            return False
         
-        print(f"✅ Смена #{shift_id} завершена для пользователя {user_id}")
+        logger.info("✅ Смена #%s завершена для пользователя %s", shift_id, user_id)
         return True
         
     except Exception as e:
-        print(f"❌ Ошибка при завершении смены: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка при завершении смены: %s", e)
         return False
 
 def cleanup_old_states():
-    """Очищает зависшие состояния (например, смены в режиме ожидания кассы больше 24 часов)"""
-    try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        # Проверяем есть ли поле is_active в таблице
-        cur.execute('''
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='shifts' AND column_name='is_active'
-        ''')
-        
-        if not cur.fetchone():
-            print("⚠️ Поле is_active отсутствует, очистка не требуется")
-            cur.close()
-            conn.close()
-            return
-        
-        # Находим смены, которые ожидают ввода кассы больше 24 часов
-        cur.execute('''
-            UPDATE shifts 
-            SET is_active = FALSE,
-                awaiting_cash_input = FALSE,
-                end_time = start_time + INTERVAL '1 hour'
-            WHERE is_active = TRUE 
-              AND awaiting_cash_input = TRUE
-              AND created_at < NOW() - INTERVAL '24 hours'
-            RETURNING id, driver_id
-        ''')
-        
-        cleaned = cur.fetchall()
-        
-        if cleaned:
-            print(f"🔄 Очищено {len(cleaned)} зависших состояний: {cleaned}")
-        else:
-            print("✅ Нет зависших состояний для очистки")
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-    except Exception as e:
-        print(f"⚠️ Ошибка при очистке старых состояний: {e}")
+    """Очищает зависшие состояния (например, смены в режиме ожидания кассы больше 24 часов)
+    и ищет слишком долгие смены - пачками, см. maintenance.py"""
+    return maintenance.run(db, ensure_timezone_naive(get_moscow_time()))
 
 def get_monthly_plan(user_id, year=None, month=None):
     """Получить месячный план пользователя"""
@@ -728,20 +453,9 @@ def get_monthly_plan(user_id, year=None, month=None):
         month = now.month
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute('''
-            SELECT * FROM monthly_plans 
-            WHERE driver_id = %s AND year = %s AND month = %s
-        ''', (user_id, year, month))
-        
-        plan = cur.fetchone()
-        cur.close()
-        conn.close()
-        return plan
+        return db.get_monthly_plan(user_id, year, month)
     except Exception as e:
-        print(f"❌ Ошибка при получении плана: {e}")
+        logger.exception("❌ Ошибка при получении плана: %s", e)
         return None
 
 def save_monthly_plan(user_id, amount):
@@ -751,28 +465,11 @@ def save_monthly_plan(user_id, amount):
     month = now.month
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        # Используем INSERT ON CONFLICT для обновления при повторе
-        cur.execute('''
-            INSERT INTO monthly_plans (driver_id, target_amount, year, month)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (driver_id, year, month) 
-            DO UPDATE SET target_amount = EXCLUDED.target_amount,
-                         created_at = CURRENT_TIMESTAMP
-            RETURNING id
-        ''', (user_id, amount, year, month))
-        
-        plan_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        print(f"✅ Месячный план #{plan_id} сохранен для пользователя {user_id}: {amount} руб")
+        plan_id = db.save_monthly_plan(user_id, amount, year, month)
+        logger.info("✅ Месячный план #%s сохранен для пользователя %s: %s руб", plan_id, user_id, amount)
         return True
     except Exception as e:
-        print(f"❌ Ошибка при сохранении плана: {e}")
+        logger.exception("❌ Ошибка при сохранении плана: %s", e)
         return False
 
 def get_weekly_plan(user_id, week_year=None, week_number=None):
@@ -781,20 +478,9 @@ def get_weekly_plan(user_id, week_year=None, week_number=None):
         week_year, week_number = get_current_iso_week()
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute('''
-            SELECT * FROM weekly_plans 
-            WHERE driver_id = %s AND week_year = %s AND week_number = %s
-        ''', (user_id, week_year, week_number))
-        
-        plan = cur.fetchone()
-        cur.close()
-        conn.close()
-        return plan
+        return db.get_weekly_plan(user_id, week_year, week_number)
     except Exception as e:
-        print(f"❌ Ошибка при получении недельного плана: {e}")
+        logger.exception("❌ Ошибка при получении недельного плана: %s", e)
         return None
 
 def save_weekly_plan(user_id, amount):
@@ -802,31 +488,65 @@ def save_weekly_plan(user_id, amount):
     week_year, week_number = get_current_iso_week()
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        cur.execute('''
-            INSERT INTO weekly_plans (driver_id, target_amount, week_year, week_number)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (driver_id, week_year, week_number) 
-            DO UPDATE SET target_amount = EXCLUDED.target_amount,
-                         created_at = CURRENT_TIMESTAMP
-            RETURNING id
-        ''', (user_id, amount, week_year, week_number))
-        
-        plan_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        print(f"✅ Недельный план #{plan_id} сохранен для пользователя {user_id}: {amount} руб (неделя {week_number}/{week_year})")
+        plan_id = db.save_weekly_plan(user_id, amount, week_year, week_number)
+        logger.info("✅ Недельный план #%s сохранен для пользователя %s: %s руб (неделя %s/%s)",
+                    plan_id, user_id, amount, week_number, week_year)
         return True
     except Exception as e:
-        print(f"❌ Ошибка при сохранении недельного плана: {e}")
+        logger.exception("❌ Ошибка при сохранении недельного плана: %s", e)
         return False
 
+# --- Прогресс плана (по индексу итогов, без запросов к сменам) ---
+# Прогноз - по средней кассе в день за последние PLAN_AVERAGE_DAYS дней
+PLAN_AVERAGE_DAYS = int(os.environ.get('PLAN_AVERAGE_DAYS', '28'))
+
+def plan_progress(index, target, first_day, last_day, today):
+    """Выполнение плана на период [first_day, last_day] на сегодня"""
+    earned = index.total(first_day, today)['cash']
+    earned_today = index.total(today, today)['cash']
+    # Среднее - по завершенным дням, сегодняшний еще идет
+    average, work_share = index.moving_average(today - timedelta(days=1), PLAN_AVERAGE_DAYS)
+    days_left = (last_day - today).days + 1
+    remaining = max(target - earned, 0)
+    # Рабочих дней впереди - как обычно у водителя (без истории - все дни)
+    working_days = max(1, round(days_left * work_share)) if work_share > 0 else days_left
+    return {
+        'earned': earned,
+        'percent': int(earned * 100 / target) if target else 0,
+        'remaining': remaining,
+        'working_days': working_days,
+        'days_left': days_left,
+        'per_day': -(-remaining // working_days),
+        'average': int(average),
+        # Сегодня ждем не меньше среднего дня, дальше - по среднему
+        'projected': int(earned + max(average - earned_today, 0) + average * (days_left - 1)) if average else None,
+    }
+
+def format_plan_progress(user_id, target, first_day, last_day):
+    """Строки прогресса для меню плана ('' - если посчитать не удалось)"""
+    try:
+        today = get_moscow_time().date()
+        progress = plan_progress(db.daily_index(user_id), target, first_day, last_day, today)
+    except Exception as e:
+        logger.exception("❌ Ошибка при расчете прогресса плана: %s", e)
+        return ""
+
+    text = f"\n💰 Заработано: {progress['earned']:,} руб ({progress['percent']}%)"
+    if progress['remaining'] == 0:
+        text += f"\n✅ План выполнен! Сверх плана: {progress['earned'] - target:,} руб"
+    else:
+        text += (f"\n🏁 Осталось: {progress['remaining']:,} руб — {progress['per_day']:,} руб "
+                 f"в рабочий день ({progress['working_days']} из {progress['days_left']} дн.)")
+    if progress['projected'] is not None:
+        verdict = "✅" if progress['projected'] >= target else "⚠️"
+        text += (f"\n🔮 Прогноз: {progress['projected']:,} руб {verdict}\n"
+                 f"(в среднем {progress['average']:,} руб в день)")
+    return text
+
 # --- Команды бота ---
 @bot.message_handler(commands=['start'])
+@metrics.track_handler
+@profiling.profile_sampled
 def send_welcome(message):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     button_shift = types.KeyboardButton('🚗 Смена')
@@ -910,26 +630,35 @@ def show_plan_menu(message):
         reply_markup=markup
     )
 
+def request_plan_input(message):
+    """Включает ввод суммы плана - месячного или недельного, смотря из какого меню пришли"""
+    state = get_user_state(message.from_user.id)
+    state['awaiting_plan_input'] = True
+    state['plan_type'] = state.get('current_plan_menu') or 'monthly'
+
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    button_cancel = types.KeyboardButton('❌ Отмена')
+    markup.row(button_cancel)
+
+    if state['plan_type'] == 'weekly':
+        prompt = "Введите сумму недельного плана в рублях:\n\nНапример: 20000"
+    else:
+        prompt = "Введите сумму месячного плана в рублях:\n\nНапример: 80000"
+    bot.send_message(message.chat.id, prompt, reply_markup=markup)
+
+def show_current_plan_menu(message):
+    """Возвращает в меню плана, из которого начали ввод"""
+    if get_user_state(message.from_user.id).get('current_plan_menu') == 'weekly':
+        show_weekly_plan_menu(message)
+    else:
+        show_monthly_plan_menu(message)
+
 @bot.message_handler(func=lambda message: message.text in ['✏️ Редактировать', '✏️ Установить план', '◀️ Назад к планам'])
+@metrics.track_handler
+@profiling.profile_sampled
 def handle_monthly_plan_menu(message):
-    user_id = message.from_user.id
-    state = get_user_state(user_id)
-    
     if message.text == '✏️ Редактировать' or message.text == '✏️ Установить план':
-        # Включаем режим ожидания ввода плана
-        state['awaiting_plan_input'] = True
-        state['plan_type'] = 'monthly'
-        
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        button_cancel = types.KeyboardButton('❌ Отмена')
-        markup.row(button_cancel)
-        
-        bot.send_message(
-            message.chat.id,
-            "Введите сумму месячного плана в рублях:\n\n"
-            "Например: 80000",
-            reply_markup=markup
-        )
+        request_plan_input(message)
         
     elif message.text == '◀️ Назад к планам':
         show_plan_menu(message)
@@ -954,10 +683,12 @@ def show_monthly_plan_menu(message):
     
     if plan:
         # Если план есть
+        month_start = now.date().replace(day=1)
+        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
         message_text = (
             f"🎯 План на {month_name} {now.year}\n\n"
             f"Текущий план: {plan['target_amount']:,} руб"
-        )
+        ) + format_plan_progress(user_id, plan['target_amount'], month_start, month_end)
         button_text = "✏️ Редактировать"
     else:
         # Если плана нет
@@ -998,7 +729,7 @@ def show_weekly_plan_menu(message):
         message_text = (
             f"🔄 План на неделю {week_number} ({start_of_week.strftime('%d.%m')}-{end_of_week.strftime('%d.%m.%Y')})\n\n"
             f"Текущий план: {plan['target_amount']:,} руб"
-        )
+        ) + format_plan_progress(user_id, plan['target_amount'], start_of_week.date(), end_of_week.date())
         button_text = "✏️ Редактировать"
     else:
         # Если плана нет
@@ -1016,16 +747,183 @@ def show_weekly_plan_menu(message):
     
     bot.send_message(message.chat.id, message_text, reply_markup=markup)
 
+def show_reports_menu(message):
+    """Показывает меню отчетов"""
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.row(*[types.KeyboardButton(text) for text in ('📅 Неделя', '🗓 Месяц', '📆 Год')])
+    markup.row(types.KeyboardButton('⚖️ Сравнение'), types.KeyboardButton('🕐 Лучшие часы'))
+    markup.row(types.KeyboardButton('◀️ Назад'))
+    bot.send_message(message.chat.id, "📊 Раздел: Отчеты", reply_markup=markup)
+
+def format_hour_range(hour):
+    return f"{hour:02d}:00–{(hour + 1) % 24:02d}:00"
+
+def show_best_hours(message):
+    """Лучшие часы работы по карте заработка водителя (heatmap.py)"""
+    user_id = message.from_user.id
+    try:
+        driver_heatmap = db.driver_heatmap(user_id)
+    except Exception as e:
+        logger.exception("❌ Ошибка при построении карты заработка: %s", e)
+        bot.send_message(message.chat.id, "⚠️ Не удалось посчитать лучшие часы. Попробуйте позже.")
+        return
+
+    by_hour = heatmap.best_hours_of_day(driver_heatmap)
+    by_weekday = heatmap.best_hours(driver_heatmap)
+    if not by_hour:
+        bot.send_message(message.chat.id,
+                         "📭 Пока мало данных: нужно хотя бы по часу работы в одно и то же время")
+        return
+
+    response = f"🕐 Лучшие часы по {driver_heatmap['shifts']} сменам\n\n"
+    for hour, rate in by_hour:
+        response += f"⏰ {format_hour_range(hour)}  |  📊 {rate} в час\n"
+    if by_weekday:
+        response += "\n📅 Лучшее время по дням недели:\n"
+        for weekday, hour, rate, hours_worked in by_weekday:
+            response += (f"{heatmap.WEEKDAYS[weekday]} {format_hour_range(hour)}  |  "
+                         f"📊 {rate} в час  |  ⏱ {hours_worked} ч\n")
+    bot.send_message(message.chat.id, response)
+
+# --- Отчеты за период (по индексу итогов, daily_index.py) ---
+REPORT_BUTTONS = {'📅 Неделя': 'week', '🗓 Месяц': 'month', '📆 Год': 'year', '⚖️ Сравнение': 'compare'}
+MONTH_NAMES = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+               'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
+
+def report_period(kind, today):
+    """Дни, от которых зависит отчет: (первый, последний)"""
+    monday = today - timedelta(days=today.weekday())
+    if kind == 'week':
+        return monday, monday + timedelta(days=6)
+    if kind == 'month':
+        return today.replace(day=1), (today.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    if kind == 'year':
+        return today.replace(month=1, day=1), today.replace(month=12, day=31)
+    # Сравнение: с понедельника прошлой недели по сегодня
+    return monday - timedelta(days=7), today
+
+def format_totals(total):
+    return (f"💰 {total['cash']} руб  |  ⏱ {format_duration(total['seconds'])}  |  "
+            f"📊 {total['hourly_rate']} в час")
+
+def format_change(current, previous):
+    difference = current - previous
+    text = f"{difference:+d} руб"
+    if previous > 0:
+        text += f" ({difference / previous:+.0%})"
+    return text
+
+def format_report_footer(total):
+    return ("────────────────\n"
+            f"📈 Итого: {total['shifts']} смен / {total['cash']} руб\n"
+            f"⏱ {format_seconds_to_words(total['seconds'])}  |  📊 {total['hourly_rate']} в час")
+
+def day_total(daily, position):
+    shifts, seconds, cash = (int(values[position]) for values in daily)
+    return {'shifts': shifts, 'seconds': seconds, 'cash': cash,
+            'hourly_rate': int(cash / (seconds / 3600)) if seconds > 0 else 0}
+
+def render_report(kind, index, today):
+    """Текст отчета по индексу итогов водителя"""
+    first_day, last_day = report_period(kind, today)
+
+    if kind == 'compare':
+        monday = today - timedelta(days=today.weekday())
+        today_total = index.total(today, today)
+        yesterday_total = index.total(today - timedelta(days=1), today - timedelta(days=1))
+        week_total = index.total(monday, today)
+        # Прошлая неделя - те же дни (пн..сегодняшний день недели) и целиком
+        last_week_total = index.total(first_day, today - timedelta(days=7))
+        last_week_full = index.total(first_day, monday - timedelta(days=1))
+        span = heatmap.WEEKDAYS[0] if today.weekday() == 0 else f"{heatmap.WEEKDAYS[0]}–{heatmap.WEEKDAYS[today.weekday()]}"
+        return ("⚖️ Сравнение\n\n"
+                f"Сегодня: {format_totals(today_total)}\n"
+                f"Вчера: {format_totals(yesterday_total)}\n"
+                f"Разница: {format_change(today_total['cash'], yesterday_total['cash'])}\n\n"
+                f"Эта неделя ({span}): {format_totals(week_total)}\n"
+                f"Прошлая неделя ({span}): {format_totals(last_week_total)}\n"
+                f"Разница: {format_change(week_total['cash'], last_week_total['cash'])}\n\n"
+                f"Прошлая неделя целиком: {format_totals(last_week_full)}")
+
+    end = min(last_day, today)
+    total = index.total(first_day, end)
+    if kind == 'week':
+        title = f"📅 Неделя {first_day.strftime('%d.%m')}–{last_day.strftime('%d.%m.%Y')}"
+    elif kind == 'month':
+        title = f"🗓 {MONTH_NAMES[today.month - 1]} {today.year}"
+    else:
+        title = f"📆 {today.year} год"
+    if total['shifts'] == 0:
+        return f"{title}\n\n📭 Завершенных смен пока нет"
+
+    daily = index.daily(first_day, end)
+    lines = []
+    if kind == 'week':
+        # По дням, новые первыми
+        for position in range(daily.shape[1] - 1, -1, -1):
+            if daily[0][position]:
+                day = first_day + timedelta(days=position)
+                lines.append(f"{heatmap.WEEKDAYS[day.weekday()]} {day.strftime('%d.%m')}  |  "
+                             f"{format_totals(day_total(daily, position))}")
+    elif kind == 'month':
+        # По неделям (понедельник - начало недели), новые первыми
+        weeks = (np.arange(daily.shape[1]) + first_day.weekday()) // 7
+        by_week = np.zeros((3, weeks[-1] + 1), dtype='int64')
+        np.add.at(by_week, (slice(None), weeks), daily)
+        for week in range(by_week.shape[1] - 1, -1, -1):
+            if by_week[0][week]:
+                week_first = max(first_day, first_day + timedelta(days=7 * week - first_day.weekday()))
+                week_last = min(end, week_first + timedelta(days=6 - week_first.weekday()))
+                lines.append(f"{week_first.strftime('%d.%m')}–{week_last.strftime('%d.%m')}  |  "
+                             f"{format_totals(day_total(by_week, week))}")
+        best = int(np.argmax(daily[2]))
+        lines.append(f"\n🏆 Лучший день: {(first_day + timedelta(days=best)).strftime('%d.%m')} — "
+                     f"{int(daily[2][best])} руб")
+    else:
+        # По месяцам, новые первыми
+        months = np.array([(first_day + timedelta(days=position)).month - 1
+                           for position in range(daily.shape[1])])
+        by_month = np.zeros((3, 12), dtype='int64')
+        np.add.at(by_month, (slice(None), months), daily)
+        for month in range(11, -1, -1):
+            if by_month[0][month]:
+                lines.append(f"{MONTH_NAMES[month]}  |  {format_totals(day_total(by_month, month))}")
+    return f"{title}\n\n" + "\n".join(lines) + "\n\n" + format_report_footer(total)
+
+def get_report_text(user_id, kind):
+    """Текст отчета: из кэша водителя или по индексу итогов (кэш сбрасывает завершение
+    смены в периоде отчета и правки админки)"""
+    today = get_moscow_time().date()
+    name = f"{kind}:{today.isoformat()}"
+    key = cache.reports_key(user_id)
+    reports = db.cache.get(key) or {}
+    if name in reports:
+        return reports[name]['text']
+
+    text = render_report(kind, db.daily_index(user_id), today)
+    first_day, last_day = report_period(kind, today)
+    # Отчеты прошлых дней больше не нужны
+    reports = {other: report for other, report in reports.items() if other.endswith(today.isoformat())}
+    reports[name] = {'text': text, 'first_day': first_day.isoformat(), 'last_day': last_day.isoformat()}
+    db.cache.set(key, reports, cache.REPORT_TTL)
+    return text
+
+def show_report(message, kind):
+    try:
+        text = get_report_text(message.from_user.id, kind)
+    except Exception as e:
+        logger.exception("❌ Ошибка при построении отчета %s: %s", kind, e)
+        text = "⚠️ Не удалось построить отчет. Попробуйте позже."
+    bot.send_message(message.chat.id, text)
+
 @bot.message_handler(func=lambda message: message.text in ['🚗 Смена', '📊 Отчеты', '🎯 План', '◀️ Назад'])
+@metrics.track_handler
+@profiling.profile_sampled
 def handle_main_menu(message):
     if message.text == '🚗 Смена':
         show_shift_menu(message)
     elif message.text == '📊 Отчеты':
-        # Пока заглушка
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        button_back = types.KeyboardButton('◀️ Назад')
-        markup.row(button_back)
-        bot.send_message(message.chat.id, "📊 Раздел: Отчеты\n(в разработке)", reply_markup=markup)
+        show_reports_menu(message)
     elif message.text == '🎯 План':  # ← ДОБАВИЛИ ЭТО
         show_plan_menu(message)       # ← И ЭТО
     elif message.text == '◀️ Назад':
@@ -1043,18 +941,20 @@ def handle_main_menu(message):
 
 @bot.message_handler(func=lambda message: 
     get_user_state(message.from_user.id).get('awaiting_cash_input', False) == True)
+@metrics.track_handler
+@profiling.profile_sampled
 def handle_cash_input(message):
     try:
         user_id = message.from_user.id
-        print(f"💰 Обрабатываем ввод кассы от пользователя {user_id}")
+        logger.debug("💰 Обрабатываем ввод кассы от пользователя %s", user_id)
         
         state = get_user_state(user_id)
-        print(f"📊 Состояние: awaiting_cash_input={state.get('awaiting_cash_input')}")
-        print(f"📊 pending_shift_data: {state.get('pending_shift_data')}")
+        logger.debug("📊 Состояние: awaiting_cash_input=%s", state.get('awaiting_cash_input'))
+        logger.debug("📊 pending_shift_data: %s", state.get('pending_shift_data'))
         
         # Проверяем наличие данных
         if not state.get('pending_shift_data'):
-            print(f"❌ Нет данных о смене для пользователя {user_id}")
+            logger.warning("❌ Нет данных о смене для пользователя %s", user_id)
             state['awaiting_cash_input'] = False
             bot.send_message(message.chat.id, 
                            "❌ Ошибка: данные смены не найдены.\n"
@@ -1065,7 +965,7 @@ def handle_cash_input(message):
         
         # Проверяем наличие всех необходимых полей
         if not data.get('start_time') or not data.get('end_time'):
-            print(f"❌ Неполные данные о смене: {data}")
+            logger.warning("❌ Неполные данные о смене: %s", data)
             state['awaiting_cash_input'] = False
             state['pending_shift_data'] = None
             bot.send_message(message.chat.id, 
@@ -1124,13 +1024,13 @@ def handle_cash_input(message):
             return
             
     except Exception as e:
-        print(f"❌ Ошибка в handle_cash_input: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка в handle_cash_input: %s", e)
         bot.send_message(message.chat.id, "⚠️ Произошла ошибка. Попробуйте еще раз.")
 
 @bot.message_handler(func=lambda message: 
     get_user_state(message.from_user.id).get('awaiting_plan_input', False) == True)
+@metrics.track_handler
+@profiling.profile_sampled
 def handle_plan_input(message):
     user_id = message.from_user.id
     state = get_user_state(user_id)
@@ -1139,7 +1039,7 @@ def handle_plan_input(message):
         # Отмена ввода
         state['awaiting_plan_input'] = False
         state['plan_type'] = None
-        show_monthly_plan_menu(message)
+        show_current_plan_menu(message)
         return
     
     try:
@@ -1155,7 +1055,8 @@ def handle_plan_input(message):
             return
         
         # Сохраняем план
-        success = save_monthly_plan(user_id, amount)
+        weekly = state.get('plan_type') == 'weekly'
+        success = save_weekly_plan(user_id, amount) if weekly else save_monthly_plan(user_id, amount)
         
         if success:
             # Сбрасываем состояние
@@ -1164,15 +1065,19 @@ def handle_plan_input(message):
             
             # Показываем подтверждение и возвращаем в меню
             now = get_moscow_time()
-            month_names = [
-                'январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
-                'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь'
-            ]
-            month_name = month_names[now.month - 1]
+            if weekly:
+                _, week_number = get_current_iso_week()
+                period = f"неделю {week_number}"
+            else:
+                month_names = [
+                    'январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
+                    'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь'
+                ]
+                period = f"{month_names[now.month - 1]} {now.year}"
             
             bot.send_message(
                 message.chat.id,
-                f"✅ План на {month_name} {now.year} установлен: {amount:,} руб"
+                f"✅ План на {period} установлен: {amount:,} руб"
             )
             
             # Возвращаем в меню плана
@@ -1188,24 +1093,26 @@ def handle_plan_input(message):
                        "Введите сумму еще раз:")
 
 @bot.message_handler(func=lambda message: True)
+@metrics.track_handler
+@profiling.profile_sampled
 def handle_buttons(message):
     try:
         user_id = message.from_user.id
-        print(f"🔍 Обрабатываем сообщение от пользователя {user_id}: '{message.text}'")
+        logger.debug("🔍 Обрабатываем сообщение от пользователя %s: '%s'", user_id, message.text)
         
         state = get_user_state(user_id)
-        print(f"📊 Состояние пользователя: is_working={state.get('is_working')}")
+        logger.debug("📊 Состояние пользователя: is_working=%s", state.get('is_working'))
         
         # ===== ОБРАБОТКА КНОПКИ ОТМЕНЫ =====
         if message.text == '❌ Отмена':
             if state.get('awaiting_plan_input'):
-                print(f"❌ Отмена ввода плана для пользователя {user_id}")
+                logger.debug("❌ Отмена ввода плана для пользователя %s", user_id)
                 state['awaiting_plan_input'] = False
                 state['plan_type'] = None
                 show_plan_menu(message)
                 return
             elif state.get('awaiting_cash_input'):
-                print(f"❌ Отмена ввода кассы для пользователя {user_id}")
+                logger.debug("❌ Отмена ввода кассы для пользователя %s", user_id)
                 state['awaiting_cash_input'] = False
                 state['pending_shift_data'] = None
                 show_shift_menu(message)
@@ -1222,82 +1129,21 @@ def handle_buttons(message):
             show_plan_menu(message)
             return
         elif message.text in ['✏️ Редактировать', '✏️ Установить план']:
-            user_id = message.from_user.id
-            state = get_user_state(user_id)
-            
-            # Включаем режим ожидания ввода плана
-            state['awaiting_plan_input'] = True
-            state['plan_type'] = 'monthly'
-            
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-            button_cancel = types.KeyboardButton('❌ Отмена')
-            markup.row(button_cancel)
-            
-            bot.send_message(
-                message.chat.id,
-                "Введите сумму месячного плана в рублях:\n\n"
-                "Например: 80000",
-                reply_markup=markup
-            )
-            return
-        
-        elif message.text in ['✏️ Редактировать', '✏️ Установить план']:
-            # Нужно определить в каком меню мы находимся
-            # Проще всего проверить состояние или последнее действие
-            # Пока сделаем так: если есть weekly_plan - значит в меню недельного
-            
-            user_id = message.from_user.id
-            state = get_user_state(user_id)
-            
-            # Проверяем какой план редактируем
-            weekly_plan = get_weekly_plan(user_id)
-            monthly_plan = get_monthly_plan(user_id)
-            
-            # Определяем тип плана по контексту (упрощенно)
-            # В реальности нужно хранить текущее меню в состоянии
-            
-            if weekly_plan is not None or True:  # Пока всегда weekly для теста
-                state['awaiting_plan_input'] = True
-                state['plan_type'] = 'weekly'
-            else:
-                state['awaiting_plan_input'] = True
-                state['plan_type'] = 'monthly'
-            
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-            button_cancel = types.KeyboardButton('❌ Отмена')
-            markup.row(button_cancel)
-            
-            plan_type_str = "недельного" if state['plan_type'] == 'weekly' else "месячного"
-            
-            bot.send_message(
-                message.chat.id,
-                f"Введите сумму {plan_type_str} плана в рублях:\n\n"
-                "Например: 20000",
-                reply_markup=markup
-            )
+            request_plan_input(message)
             return
 
 
         # Если смена активна и ожидает кассу, но нет данных - сбрасываем
         if state.get('awaiting_cash_input') and not state.get('pending_shift_data'):
-            print(f"⚠️ Сброс состояния ожидания кассы для пользователя {user_id}")
+            logger.warning("⚠️ Сброс состояния ожидания кассы для пользователя %s", user_id)
             state['awaiting_cash_input'] = False
             
             # Обновляем в БД
             try:
-                conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                cur = conn.cursor()
-                cur.execute('''
-                    UPDATE shifts 
-                    SET awaiting_cash_input = FALSE
-                    WHERE driver_id = %s AND is_active = TRUE
-                ''', (user_id,))
-                conn.commit()
-                cur.close()
-                conn.close()
-                print(f"✅ Сброшен awaiting_cash_input в БД")
+                db.set_awaiting_cash(user_id, False)
+                logger.debug("✅ Сброшен awaiting_cash_input в БД")
             except Exception as e:
-                print(f"❌ Ошибка при сбросе в БД: {e}")
+                logger.exception("❌ Ошибка при сбросе в БД: %s", e)
         
         # ===== ОБРАБОТКА КНОПОК ИЗ РАЗДЕЛА "СМЕНА" =====
         
@@ -1332,7 +1178,6 @@ def handle_buttons(message):
                 # Ставим на паузу
                 state['is_paused'] = True
                 state['pause_start_time'] = current_time
-                state['last_pause_reminder_minutes'] = 0
                 # Обновляем в БД
                 update_shift_pause(user_id, True, current_time)
                 
@@ -1347,7 +1192,6 @@ def handle_buttons(message):
                 state['shift_start_time'] += pause_duration
                 state['is_paused'] = False
                 state['pause_start_time'] = None
-                state['last_pause_reminder_minutes'] = 0
                 # Обновляем в БД
                 update_shift_pause(user_id, False, None)
                 
@@ -1391,19 +1235,9 @@ def handle_buttons(message):
             
             # Помечаем в БД что ожидаем ввод кассы
             try:
-                conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                cur = conn.cursor()
-                cur.execute('''
-                    UPDATE shifts 
-                    SET awaiting_cash_input = TRUE,
-                        end_time = %s
-                    WHERE driver_id = %s AND is_active = TRUE
-                ''', (end_time, user_id))
-                conn.commit()
-                cur.close()
-                conn.close()
+                db.set_awaiting_cash(user_id, True, end_time)
             except Exception as e:
-                print(f"❌ Ошибка при обновлении БД: {e}")
+                logger.exception("❌ Ошибка при обновлении БД: %s", e)
             
             # НЕ возвращаем в меню СМЕНА - остаёмся в ожидании кассы
             bot.send_message(message.chat.id, 
@@ -1506,29 +1340,25 @@ def handle_buttons(message):
             
             # Помечаем в БД что ожидаем ввод кассы
             try:
-                conn = psycopg2.connect(os.environ['DATABASE_URL'])
-                cur = conn.cursor()
-                cur.execute('''
-                    UPDATE shifts 
-                    SET awaiting_cash_input = TRUE,
-                        end_time = %s
-                    WHERE driver_id = %s AND is_active = TRUE
-                ''', (end_time, user_id))
-                conn.commit()
-                cur.close()
-                conn.close()
+                db.set_awaiting_cash(user_id, True, end_time)
             except Exception as e:
-                print(f"❌ Ошибка при обновлении БД: {e}")
+                logger.exception("❌ Ошибка при обновлении БД: %s", e)
             
             bot.send_message(message.chat.id, 
                            f"⏱ Отработано: {time_str}\n"
                            "💵 Введите сумму в кассе:")
         
+        elif message.text == '🕐 Лучшие часы':
+            show_best_hours(message)
+
+        elif message.text in REPORT_BUTTONS:
+            show_report(message, REPORT_BUTTONS[message.text])
+
         elif message.text == '📊 Мои смены':
             shifts = get_user_shifts_grouped_by_date(user_id)
             
             if not shifts:
-                month_name = datetime.datetime.now(MOSCOW_TZ).strftime('%B').lower()
+                month_name = get_moscow_time().strftime('%B').lower()
                 bot.send_message(message.chat.id, f"📭 В {month_name} пока нет завершенных смен")
                 return
             
@@ -1562,60 +1392,83 @@ def handle_buttons(message):
             send_welcome(message)
             
     except Exception as e:
-        print(f"❌ Ошибка в handle_buttons: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка в handle_buttons: %s", e)
         bot.send_message(message.chat.id, "⚠️ Произошла ошибка. Попробуйте еще раз.")
 
 # --- Webhook настройка ---
+import hmac
 import flask
 from flask import Flask, request
 
 app = Flask(__name__)
 
-print("✅ Бот инициализирован с PostgreSQL!")
-start_pause_reminder_checker()
-print("✅ Проверщик напоминаний запущен")
+logger.info("✅ Бот инициализирован (хранилище: %s)", db.name)
+
+# --- Несколько реплик ---
+def drop_driver_state(driver_id):
+    """Водителя изменила другая реплика: сбрасываем его состояние и кэш, при следующем
+    сообщении состояние восстановится из БД"""
+    user_states.pop(driver_id, None)
+    now = get_moscow_time()
+    week_year, week_number = get_current_iso_week()
+    db.cache.delete(
+        cache.summary_key(driver_id),
+        cache.heatmap_key(driver_id),
+        cache.reports_key(driver_id),
+        cache.monthly_plan_key(driver_id, now.year, now.month),
+        cache.weekly_plan_key(driver_id, week_year, week_number)
+    )
+
+def drop_all_states():
+    """Уведомления могли потеряться - сбрасываем все состояния"""
+    user_states.clear()
+    if isinstance(db.cache, cache.LocalCache):
+        db.cache.clear()
+
+# STATE_SYNC=1: реплики оповещают друг друга об изменениях водителей (LISTEN/NOTIFY PostgreSQL)
+if os.environ.get('STATE_SYNC', '0') == '1' and db.name == 'postgres':
+    db.enable_notifications(cluster.CHANNEL, cluster.NODE_ID)
+    state_listener = cluster.StateListener(os.environ['DATABASE_URL'], drop_driver_state, drop_all_states)
+    state_listener.start()
+    logger.info("✅ Синхронизация состояний между репликами включена (узел %s)", cluster.NODE_ID)
+else:
+    state_listener = None
+
+# Привязка водителей к репликам: CLUSTER_PEERS=имя=url,...
+affinity = cluster.AffinityRouter(cluster.parse_peers(os.environ.get('CLUSTER_PEERS')))
 
-# Инициализация при запуске (только один раз)
+# Фоновые задачи выполняет одна реплика: держатель advisory-lock PostgreSQL
+if db.name == 'postgres':
+    election = leader.LeaderElection(os.environ['DATABASE_URL'])
+else:
+    election = leader.SingleNode()
+
+# Симуляция отключает фоновый поток и проверяет паузы сама, по виртуальным часам
+if os.environ.get('PAUSE_REMINDER_THREAD', '1') != '0':
+    election.start()
+    reminder_thread = start_background_jobs(election)
+else:
+    reminder_thread = None
+
+# Инициализация при запуске (только один раз); зависшие смены закрывает
+# фоновое обслуживание ведущей реплики
 try:
-    cleanup_old_states()
-    
     # Восстанавливаем активные смены
-    print("🔄 Восстанавливаем активные смены из БД...")
+    logger.info("🔄 Восстанавливаем активные смены из БД...")
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        active_drivers = db.active_driver_ids()
         
-        cur.execute('''
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='shifts' AND column_name='is_active'
-        ''')
+        for user_id in active_drivers:
+            get_user_state(user_id)
+            logger.debug("Восстановлена смена для водителя %s", user_id)
         
-        if cur.fetchone():
-            cur.execute("SELECT DISTINCT driver_id FROM shifts WHERE is_active = TRUE")
-            active_drivers = cur.fetchall()
-            
-            for driver in active_drivers:
-                user_id = driver['driver_id']
-                get_user_state(user_id)
-                print(f"   Восстановлена смена для водителя {user_id}")
-            
-            print(f"✅ Восстановлено {len(active_drivers)} активных смен")
-        
-        cur.close()
-        conn.close()
+        logger.info("✅ Восстановлено %s активных смен", len(active_drivers))
         
     except Exception as e:
-        print(f"⚠️ Ошибка при восстановлении смен: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.warning("⚠️ Ошибка при восстановлении смен: %s", e, exc_info=True)
 
 except Exception as e:
-    print(f"❌ Критическая ошибка при инициализации: {e}")
-    import traceback
-    traceback.print_exc()
+    logger.exception("❌ Критическая ошибка при инициализации: %s", e)
 
 @app.route('/', methods=['POST'])
 def webhook():
@@ -1623,7 +1476,14 @@ def webhook():
     if request.headers.get('content-type') == 'application/json':
         json_string = request.get_data().decode('utf-8')
         update = telebot.types.Update.de_json(json_string)
-        bot.process_new_updates([update])
+        # Апдейт чужого водителя - его реплике (если включена привязка водителей)
+        driver_id = cluster.update_driver_id(update)
+        if driver_id is not None and affinity.forward(driver_id, json_string.encode('utf-8'), request.headers):
+            return '', 200
+        # Фильтры обработчиков (get_user_state) выполняются здесь, сами обработчики -
+        # в пуле потоков telebot (или здесь же, если bot.threaded = False)
+        with metrics.handler_context('webhook'), profiling.sample_update(update):
+            bot.process_new_updates([update])
         return '', 200
     return 'Bad request', 400
 
@@ -1631,6 +1491,128 @@ def webhook():
 def index():
     return 'Bot is running!'
 
+# Апдейт ждёт в очереди пула потоков telebot дольше обычного - не готовы
+READY_MAX_QUEUE = int(os.environ.get('READY_MAX_QUEUE', '100'))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики в формате Prometheus"""
+    pool = bot.worker_pool if bot.threaded else None
+    gauges = {
+        'taxi_bot_user_states': ("Состояний пользователей в памяти", len(user_states)),
+        'taxi_bot_worker_queue': ("Апдейтов в очереди пула потоков", pool.tasks.qsize() if pool else 0),
+        'taxi_bot_worker_threads': ("Потоков обработки апдейтов", len(pool.workers) if pool else 0),
+        'taxi_bot_state_notifications_applied': (
+            "Сброшено состояний по уведомлениям других реплик", state_listener.applied if state_listener else 0),
+        'taxi_bot_affinity_forwarded': ("Апдейтов переслано реплике-владельцу", affinity.forwarded),
+        'taxi_bot_is_leader': ("Реплика выполняет фоновые задачи (1 - да)", int(election.is_leader)),
+        'taxi_bot_long_running_shifts': (
+            "Смен дольше LONG_SHIFT_HOURS при последнем обслуживании", maintenance.last_run.get('long_running', 0)),
+    }
+    return flask.Response(metrics.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ready')
+def ready():
+    """Готовность к приёму апдейтов: БД, очередь пула потоков, фоновый поток напоминаний"""
+    checks = {}
+    
+    with metrics.handler_context('ready'):
+        started = time.perf_counter()
+        try:
+            db.ping()
+            checks['database'] = {
+                'ok': True,
+                'backend': db.name,
+                'replica': bool(getattr(db, 'read_dsn', None)),
+                'latency_ms': round((time.perf_counter() - started) * 1000, 1)
+            }
+        except Exception as e:
+            checks['database'] = {'ok': False, 'error': str(e)}
+    
+    # Кэш не влияет на готовность: без него чтения идут в БД
+    shared_cache = cache.get_cache()
+    checks['cache'] = {'ok': True, 'backend': shared_cache.name}
+    if isinstance(shared_cache, cache.RedisCache):
+        try:
+            checks['cache']['reachable'] = shared_cache.ping()
+        except Exception as e:
+            checks['cache']['reachable'] = False
+            checks['cache']['error'] = str(e)
+    
+    checks['state_sync'] = {'ok': state_listener is None or state_listener.is_alive(),
+                            'enabled': state_listener is not None}
+    if state_listener is not None:
+        checks['state_sync'].update(state_listener.status())
+    if affinity.enabled:
+        checks['affinity'] = dict(affinity.status(), ok=True)
+    
+    pool = bot.worker_pool if bot.threaded else None
+    queue_size = pool.tasks.qsize() if pool else 0
+    checks['worker_pool'] = {
+        'ok': queue_size <= READY_MAX_QUEUE,
+        'threads': len(pool.workers) if pool else 0,
+        'alive_threads': sum(worker.is_alive() for worker in pool.workers) if pool else 0,
+        'queue': queue_size,
+        'max_queue': READY_MAX_QUEUE
+    }
+    checks['pause_reminders'] = {'ok': reminder_thread is None or reminder_thread.is_alive(),
+                                 'enabled': reminder_thread is not None}
+    if reminder_thread is not None:
+        checks['pause_reminders']['leader'] = dict(election.status(), alive=election.is_alive())
+        checks['pause_reminders']['ok'] = checks['pause_reminders']['ok'] and election.is_alive()
+        # Ошибки обслуживания не мешают принимать апдейты
+        checks['maintenance'] = dict(maintenance.status(), ok=True)
+    
+    is_ready = all(check['ok'] for check in checks.values())
+    return flask.jsonify({'ready': is_ready, 'checks': checks}), 200 if is_ready else 503
+
+# Профили доступны только с токеном; без PROFILE_TOKEN маршруты выключены
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+
+def profile_access_denied():
+    """Проверяет токен профилирования; возвращает ответ-отказ или None"""
+    if not PROFILE_TOKEN:
+        return 'Not found', 404
+    token = request.headers.get('X-Profile-Token') or request.args.get('token', '')
+    if not hmac.compare_digest(token, PROFILE_TOKEN):
+        return 'Forbidden', 403
+    return None
+
+@app.route('/debug/profile', methods=['GET', 'POST', 'DELETE'])
+def debug_profile():
+    """GET - состояние, POST {"sample_every": N} - включить/выключить, DELETE - сбросить профили"""
+    denied = profile_access_denied()
+    if denied:
+        return denied
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        try:
+            profiling.configure(int(data.get('sample_every', 0)))
+        except (TypeError, ValueError):
+            return 'sample_every должен быть целым числом', 400
+    elif request.method == 'DELETE':
+        profiling.reset()
+    
+    return flask.jsonify(profiling.summary())
+
+@app.route('/debug/profile/<name>')
+def download_profile(name):
+    """Сводный профиль обработчика: файл .prof (pstats/snakeviz) или ?format=text"""
+    denied = profile_access_denied()
+    if denied:
+        return denied
+    if not profiling.has_profile(name):
+        return 'Профиль не найден', 404
+    
+    if request.args.get('format') == 'text':
+        report = profiling.report_text(name, sort=request.args.get('sort', 'cumulative'))
+        return flask.Response(report, mimetype='text/plain; charset=utf-8')
+    
+    profiling.flush()
+    return flask.send_file(os.path.abspath(profiling.profile_path(name)), as_attachment=True,
+                           download_name=f"{name}.prof")
+
 @app.route('/set_webhook', methods=['GET'])
 def set_webhook():
     """Установить webhook (вызови в браузере после деплоя)"""
@@ -1645,12 +1627,12 @@ if __name__ == '__main__':
     import os
     if os.environ.get('RAILWAY_ENVIRONMENT') is None:
         # Локальный запуск
-        print("🚀 Локальный запуск (polling)...")
+        logger.info("🚀 Локальный запуск (polling)...")
         bot.remove_webhook()
         time.sleep(1)
         bot.polling(none_stop=True)
     else:
         # На Railway - запускаем Flask
-        print("🚀 Запуск на Railway (webhook)...")
+        logger.info("🚀 Запуск на Railway (webhook)...")
         port = int(os.environ.get('PORT', 5000))
         app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,260 @@
+"""Общий кэш бота и админки.
+
+LocalCache - словарь в памяти процесса (по умолчанию). RedisCache - сетевой
+кэш по протоколу Redis (RESP), общий для всех реплик бота и админки:
+
+    CACHE_URL=redis://127.0.0.1:6379/0
+
+Для тестов и бенчмарков вместо Redis подходит bench/resp_server.py.
+Значения в сетевом кэше хранятся в JSON (datetime/date/Decimal сохраняются).
+Ошибки сети не ломают бота: чтение считается промахом, запись пропускается.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import urlparse
+
+import metrics
+
+logger = logging.getLogger('taxi_bot.cache')
+
+# Время жизни записей, секунды
+PLAN_TTL = int(os.environ.get('CACHE_PLAN_TTL', '3600'))
+SUMMARY_TTL = int(os.environ.get('CACHE_SUMMARY_TTL', '300'))
+# Карту по часам сбрасывают завершение смен и правки админки, поэтому она живёт долго
+HEATMAP_TTL = int(os.environ.get('CACHE_HEATMAP_TTL', '86400'))
+REPORT_TTL = int(os.environ.get('CACHE_REPORT_TTL', '3600'))
+
+
+# --- Ключи ---
+def monthly_plan_key(driver_id, year, month):
+    return f"plan:monthly:{driver_id}:{year}:{month}"
+
+
+def weekly_plan_key(driver_id, week_year, week_number):
+    return f"plan:weekly:{driver_id}:{week_year}:{week_number}"
+
+
+def summary_key(driver_id):
+    """Итоги водителя по дням (один период на водителя - текущий месяц)"""
+    return f"summary:{driver_id}"
+
+
+def heatmap_key(driver_id):
+    """Карта заработка водителя по часам недели (heatmap.py)"""
+    return f"heatmap:{driver_id}"
+
+
+def reports_key(driver_id):
+    """Готовые тексты отчетов водителя: {"вид:сегодня": {text, first_day, last_day}}"""
+    return f"reports:{driver_id}"
+
+
+# --- Сериализация для сетевого кэша ---
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    raise TypeError(f"Не сериализуется: {type(value).__name__}")
+
+
+def _decode(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    if '__decimal__' in obj:
+        return Decimal(obj['__decimal__'])
+    return obj
+
+
+def dumps(value):
+    return json.dumps(value, default=_encode, ensure_ascii=False).encode()
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode)
+
+
+class LocalCache:
+    """Кэш в памяти процесса; значения не копируются - не изменяйте их после get/set"""
+
+    name = 'local'
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] <= now:
+                del self._data[key]
+                item = None
+        metrics.record_cache(self.name, 'hit' if item is not None else 'miss')
+        return item[1] if item is not None else None
+
+    def set(self, key, value, ttl):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._data) >= self.max_size and key not in self._data:
+                # Сначала выбрасываем просроченные, затем самые старые записи
+                self._data = {k: item for k, item in self._data.items() if item[0] > now}
+                while len(self._data) >= self.max_size:
+                    del self._data[next(iter(self._data))]
+            self._data[key] = (now + ttl, value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """Минимальный клиент Redis (GET/SET PX/DEL/PING), одно соединение на поток"""
+
+    name = 'redis'
+
+    def __init__(self, url, timeout=0.5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # --- Протокол ---
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self.password:
+            self._roundtrip('AUTH', self.password)
+        if self.db:
+            self._roundtrip('SELECT', self.db)
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                self._local.reader.close()
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _roundtrip(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._local.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Сервер кэша закрыл соединение")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RuntimeError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            return [self._read_reply() for _ in range(int(payload))]
+        raise RuntimeError(f"Неизвестный ответ кэша: {line!r}")
+
+    def command(self, *args):
+        """Команда с одним переподключением при обрыве соединения"""
+        for attempt in (1, 2):
+            try:
+                if getattr(self._local, 'sock', None) is None:
+                    self._connect()
+                return self._roundtrip(*args)
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt == 2:
+                    raise
+
+    # --- Интерфейс кэша ---
+    def get(self, key):
+        try:
+            data = self.command('GET', key)
+        except Exception as e:
+            logger.warning("⚠️ Кэш недоступен (GET %s): %s", key, e)
+            metrics.record_cache(self.name, 'error')
+            return None
+        metrics.record_cache(self.name, 'hit' if data is not None else 'miss')
+        return loads(data) if data is not None else None
+
+    def set(self, key, value, ttl):
+        try:
+            self.command('SET', key, dumps(value), 'PX', int(ttl * 1000))
+        except Exception as e:
+            logger.warning("⚠️ Кэш недоступен (SET %s): %s", key, e)
+            metrics.record_cache(self.name, 'error')
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self.command('DEL', *keys)
+        except Exception as e:
+            # Запись останется до конца TTL
+            logger.warning("⚠️ Не удалось сбросить кэш %s: %s", keys, e)
+            metrics.record_cache(self.name, 'error')
+
+    def ping(self):
+        return self.command('PING') == 'PONG'
+
+
+def create_cache(url=None):
+    """Кэш по CACHE_URL: redis://... - сетевой, иначе в памяти процесса"""
+    url = os.environ.get('CACHE_URL', '') if url is None else url
+    if url.startswith('redis://'):
+        return RedisCache(url)
+    return LocalCache()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = create_cache()
+        return _cache
+
+
+def set_cache(new_cache):
+    """Подменяет кэш (тесты, бенчмарки); возвращает прежний"""
+    global _cache
+    with _cache_lock:
+        previous, _cache = _cache, new_cache
+    return previous
@@ -0,0 +1,84 @@
+"""Часы бота и админки.
+
+Весь код, которому нужно текущее время или ожидание, обращается к
+clock.now()/clock.sleep(). По умолчанию это системные часы; симуляция
+(bench/simulate.py) и тесты подставляют SimulatedClock и двигают
+виртуальное время вручную.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+
+class SystemClock:
+    """Реальное время"""
+
+    def now(self, tz=None):
+        return datetime.now(tz)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SimulatedClock:
+    """Виртуальное время: стоит на месте, пока его не сдвинут advance()/advance_to()"""
+
+    def __init__(self, start=None):
+        start = start or datetime.now(pytz.UTC)
+        if start.tzinfo is None:
+            start = pytz.UTC.localize(start)
+        self._now = start.astimezone(pytz.UTC)
+        self._changed = threading.Condition()
+
+    def now(self, tz=None):
+        with self._changed:
+            current = self._now
+        if tz is None:
+            # Как datetime.now(): локальное время без часового пояса
+            return current.astimezone().replace(tzinfo=None)
+        return current.astimezone(tz)
+
+    def sleep(self, seconds):
+        """Ждёт, пока виртуальное время не уйдёт вперёд на seconds"""
+        with self._changed:
+            wake_at = self._now + timedelta(seconds=seconds)
+            while self._now < wake_at:
+                self._changed.wait()
+
+    def advance(self, seconds):
+        with self._changed:
+            self._now += timedelta(seconds=seconds)
+            self._changed.notify_all()
+
+    def advance_to(self, moment):
+        if moment.tzinfo is None:
+            moment = pytz.UTC.localize(moment)
+        with self._changed:
+            moment = moment.astimezone(pytz.UTC)
+            if moment > self._now:
+                self._now = moment
+                self._changed.notify_all()
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(new_clock):
+    """Подменяет часы (SimulatedClock для симуляции и тестов); возвращает прежние"""
+    global _clock
+    previous, _clock = _clock, new_clock
+    return previous
+
+
+def now(tz=None):
+    return _clock.now(tz)
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
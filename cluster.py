@@ -0,0 +1,207 @@
+"""Несколько реплик бота за одним webhook.
+
+Источник правды - БД. Каждая реплика держит user_states только как кэш:
+записи смен и планов в PostgreSQL сопровождаются NOTIFY (storage/postgres.py),
+а StateListener на остальных репликах получает их через LISTEN и сбрасывает
+состояние водителя - при следующем сообщении оно восстановится из БД.
+
+Привязка водителей к репликам (необязательно): при заданных CLUSTER_PEERS
+webhook пересылает апдейт реплике-владельцу водителя (rendezvous hashing),
+чтобы его состояние и кэш жили на одной реплике. Если владелец недоступен,
+апдейт обрабатывается на месте.
+
+    NODE_ID=bot-0
+    STATE_SYNC=1
+    CLUSTER_PEERS=bot-0=http://bot-0:8080/,bot-1=http://bot-1:8080/
+"""
+import hashlib
+import logging
+import os
+import select
+import socket
+import threading
+
+import psycopg2
+import psycopg2.extensions
+import requests
+
+logger = logging.getLogger('taxi_bot.cluster')
+
+NODE_ID = os.environ.get('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+CHANNEL = 'taxi_bot_driver_state'
+# Заголовок пересланного апдейта: повторно его не пересылаем
+FORWARDED_HEADER = 'X-Taxi-Bot-Forwarded'
+FORWARD_TIMEOUT = float(os.environ.get('CLUSTER_FORWARD_TIMEOUT', '2'))
+
+
+class StateListener:
+    """Поток LISTEN: on_change(driver_id) на изменения с других реплик.
+
+    После обрыва соединения уведомления могли потеряться, поэтому при
+    переподключении вызывается on_reset() - сбросить всё закэшированное.
+    """
+
+    def __init__(self, dsn, on_change, on_reset, channel=CHANNEL, node_id=NODE_ID):
+        self.dsn = dsn
+        self.on_change = on_change
+        self.on_reset = on_reset
+        self.channel = channel
+        self.node_id = node_id
+        self.received = 0
+        self.applied = 0
+        self.reconnects = 0
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name='state-listener')
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cur = conn.cursor()
+        cur.execute(f'LISTEN "{self.channel}"')
+        cur.close()
+        return conn
+
+    def _run(self):
+        delay = 1
+        first = True
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._listen()
+                self.connected = True
+                delay = 1
+                if not first:
+                    self.reconnects += 1
+                    logger.warning("🔄 LISTEN восстановлен, сбрасываем закэшированные состояния")
+                    self.on_reset()
+                first = False
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._handle(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning("⚠️ LISTEN %s прерван: %s", self.channel, e)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(delay)
+            delay = min(delay * 2, 30)
+
+    def _handle(self, payload):
+        self.received += 1
+        node, _, driver = payload.rpartition(' ')
+        if node == self.node_id:
+            return
+        try:
+            driver_id = int(driver)
+        except ValueError:
+            logger.warning("⚠️ Непонятное уведомление: %r", payload)
+            return
+        self.on_change(driver_id)
+        self.applied += 1
+
+    def status(self):
+        return {
+            'connected': self.connected,
+            'received': self.received,
+            'applied': self.applied,
+            'reconnects': self.reconnects
+        }
+
+
+# --- Привязка водителей к репликам ---
+def parse_peers(value):
+    """'bot-0=http://a/,bot-1=http://b/' -> {'bot-0': 'http://a/', ...}"""
+    peers = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, url = item.partition('=')
+        peers[name.strip()] = url.strip()
+    return peers
+
+
+def owner_of(driver_id, nodes):
+    """Реплика-владелец водителя (rendezvous hashing: при удалении реплики
+    переезжают только её водители)"""
+    def weight(node):
+        return hashlib.blake2b(f"{node}:{driver_id}".encode(), digest_size=8).digest()
+    return max(nodes, key=weight)
+
+
+class AffinityRouter:
+    """Пересылка апдейтов реплике-владельцу водителя (выключена, если реплик меньше двух)"""
+
+    def __init__(self, peers, node_id=NODE_ID):
+        self.peers = peers
+        self.node_id = node_id
+        self.forwarded = 0
+        self.forward_errors = 0
+        self._session = requests.Session()
+        if peers and node_id not in peers:
+            logger.warning("⚠️ NODE_ID %s нет в CLUSTER_PEERS - апдейты будут только пересылаться", node_id)
+
+    @property
+    def enabled(self):
+        return len(self.peers) > 1
+
+    def owner(self, driver_id):
+        return owner_of(driver_id, sorted(self.peers))
+
+    def forward(self, driver_id, body, headers):
+        """Пересылает апдейт владельцу; True - переслан, False - обработать здесь"""
+        if not self.enabled or headers.get(FORWARDED_HEADER):
+            return False
+        owner = self.owner(driver_id)
+        if owner == self.node_id:
+            return False
+        try:
+            response = self._session.post(
+                self.peers[owner],
+                data=body,
+                headers={'Content-Type': 'application/json', FORWARDED_HEADER: self.node_id},
+                timeout=FORWARD_TIMEOUT
+            )
+            response.raise_for_status()
+            self.forwarded += 1
+            return True
+        except Exception as e:
+            self.forward_errors += 1
+            logger.warning("⚠️ Реплика %s недоступна (%s), обрабатываем апдейт здесь", owner, e)
+            return False
+
+    def status(self):
+        return {
+            'node': self.node_id,
+            'peers': sorted(self.peers),
+            'forwarded': self.forwarded,
+            'forward_errors': self.forward_errors
+        }
+
+
+def update_driver_id(update):
+    """ID водителя из апдейта Telegram (None, если его нет)"""
+    for kind in ('message', 'edited_message', 'callback_query'):
+        item = getattr(update, kind, None)
+        if item is not None and getattr(item, 'from_user', None) is not None:
+            return item.from_user.id
+    return None
@@ -0,0 +1,132 @@
+"""Накопленные итоги водителя по дням (префиксные суммы).
+
+Для каждого дня от первой смены водителя хранятся суммы с начала истории:
+число смен, отработанные секунды и касса. Итог за любой период [start, end] -
+разность двух столбцов, без обращения к сменам.
+
+День смены - DATE(start_time), как в итогах по дням. Учитываются завершённые
+водителем смены (is_active = FALSE и есть duration_seconds): брошенные и
+закрытые обслуживанием смены без длительности в итоги не входят.
+
+Индекс хранится в БД (driver_day_index) тремя массивами int64 в одном BYTEA/BLOB.
+При завершении смены ботом он дописывается (ShiftStorage.index_completed_shift),
+а вставка уже завершённых смен (add_shift, админка, импорт) и любые их правки
+сбрасывают его триггером - следующее чтение перестраивает индекс одним GROUP BY.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+FIELDS = ('shifts', 'seconds', 'cash')
+
+
+class DailyIndex:
+    """sums[поле][i] - сумма поля за дни first_day .. first_day + i включительно"""
+
+    def __init__(self, first_day=None, sums=None, last_id=0):
+        self.first_day = first_day
+        self.sums = sums if sums is not None else np.zeros((len(FIELDS), 0), dtype='int64')
+        # Наибольший id учтённой смены: повторное добавление той же смены пропускается
+        self.last_id = last_id
+
+    @property
+    def days(self):
+        return self.sums.shape[1]
+
+    @property
+    def last_day(self):
+        return self.first_day + timedelta(days=self.days - 1) if self.days else None
+
+    @property
+    def shift_count(self):
+        return int(self.sums[0, -1]) if self.days else 0
+
+    # --- Построение ---
+    @classmethod
+    def from_totals(cls, rows):
+        """Индекс по итогам дней [(день, смен, секунд, касса, max id)] в любом порядке"""
+        if not rows:
+            return cls()
+        days = np.array([_as_date(row[0]) for row in rows], dtype='datetime64[D]')
+        first = days.min()
+        positions = (days - first).astype('int64')
+        daily = np.zeros((len(FIELDS), positions.max() + 1), dtype='int64')
+        for field in range(len(FIELDS)):
+            np.add.at(daily[field], positions, [int(row[field + 1] or 0) for row in rows])
+        return cls(first.astype(object), np.cumsum(daily, axis=1),
+                   max(int(row[4] or 0) for row in rows))
+
+    def add(self, shift_id, day, seconds, cash):
+        """Дописывает смену; False - смена уже учтена"""
+        if shift_id is not None and shift_id <= self.last_id:
+            return False
+        day = _as_date(day)
+        if self.first_day is None:
+            self.first_day = day
+            self.sums = np.zeros((len(FIELDS), 1), dtype='int64')
+        elif day < self.first_day:
+            # Смена раньше начала истории: слева - дни без смен
+            padding = np.zeros((len(FIELDS), (self.first_day - day).days), dtype='int64')
+            self.sums = np.concatenate([padding, self.sums], axis=1)
+            self.first_day = day
+        position = (day - self.first_day).days
+        if position >= self.days:
+            # Дни без смен повторяют последнюю сумму
+            tail = np.repeat(self.sums[:, -1:], position - self.days + 1, axis=1)
+            self.sums = np.concatenate([self.sums, tail], axis=1)
+        self.sums[:, position:] += np.array([1, seconds or 0, cash or 0], dtype='int64')[:, None]
+        self.last_id = max(self.last_id, shift_id or 0)
+        return True
+
+    # --- Запросы ---
+    def _through(self, day):
+        """Суммы с начала истории по день day включительно"""
+        if self.first_day is None or day < self.first_day:
+            return np.zeros(len(FIELDS), dtype='int64')
+        return self.sums[:, min((day - self.first_day).days, self.days - 1)]
+
+    def total(self, start, end):
+        """Итог за дни [start, end]: смены, секунды, касса и средний час"""
+        start, end = _as_date(start), _as_date(end)
+        values = self._through(end) - self._through(start - timedelta(days=1))
+        result = {field: int(value) for field, value in zip(FIELDS, values)}
+        result['hourly_rate'] = int(result['cash'] / (result['seconds'] / 3600)) if result['seconds'] > 0 else 0
+        return result
+
+    def daily(self, start, end):
+        """Итоги по каждому дню [start, end]: массив (поле, день)"""
+        start, end = _as_date(start), _as_date(end)
+        count = (end - start).days + 1
+        if self.first_day is None:
+            return np.zeros((len(FIELDS), count), dtype='int64')
+        # Суммы по день перед start и по каждый день периода
+        positions = (start - self.first_day).days - 1 + np.arange(count + 1)
+        through = np.where(positions >= 0, self.sums[:, np.clip(positions, 0, self.days - 1)], 0)
+        return np.diff(through, axis=1)
+
+    def moving_average(self, end, days):
+        """Средняя касса в день и доля дней со сменами за days дней по end включительно
+        (но не раньше первого дня истории: новичку не занижаем среднее)"""
+        end = _as_date(end)
+        if self.first_day is None or end < self.first_day:
+            return 0.0, 0.0
+        days = min(days, (end - self.first_day).days + 1)
+        daily = self.daily(end - timedelta(days=days - 1), end)
+        return float(daily[2].sum()) / days, float((daily[0] > 0).mean())
+
+    # --- Хранение ---
+    def to_record(self):
+        return {'first_day': self.first_day, 'last_id': self.last_id,
+                'sums': self.sums.astype('<i8').tobytes()}
+
+    @classmethod
+    def from_record(cls, record):
+        sums = np.frombuffer(bytes(record['sums']), dtype='<i8').reshape(len(FIELDS), -1).astype('int64')
+        first_day = _as_date(record['first_day']) if record['first_day'] else None
+        return cls(first_day, sums, record['last_id'])
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if hasattr(value, 'date') else value
@@ -0,0 +1,87 @@
+"""Карта заработка водителя по дням недели и часам.
+
+Касса каждой смены раскладывается по часам, которые смена покрывает,
+пропорционально отработанным в часе секундам. Итог - две матрицы 7×24
+(понедельник - строка 0): касса и отработанные секунды в каждом часе недели.
+Средний заработок в час ячейки = касса / часы.
+
+Карта хранится в кэше водителя (storage/cached.py) в виде, пригодном для JSON;
+завершение смены сбрасывает её, следующее чтение строит карту заново.
+"""
+import numpy as np
+
+DAYS = 7
+HOURS = 24
+# Ячейка с меньшим временем работы не попадает в лучшие часы - слишком мало данных
+MIN_SECONDS = 3600
+
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+_HOUR = np.timedelta64(1, 'h')
+
+
+def spread(start_times, end_times, cash):
+    """Раскладывает кассу смен по часам недели; возвращает (касса 7×24, секунды 7×24)"""
+    start = np.asarray(start_times, dtype='datetime64[s]')
+    end = np.asarray(end_times, dtype='datetime64[s]')
+    cash = np.asarray(cash, dtype='float64')
+    duration = (end - start).astype('int64')
+    valid = duration > 0
+    start, end, cash, duration = start[valid], end[valid], cash[valid], duration[valid]
+
+    # Каждая смена превращается в отрезки по часам: первый начинается с часа начала смены
+    first_hour = start.astype('datetime64[h]')
+    counts = ((end - first_hour).astype('int64') + 3599) // 3600
+    shift = np.repeat(np.arange(len(start)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    hour = first_hour[shift] + offsets * _HOUR
+
+    seconds = (np.minimum(hour + _HOUR, end[shift]) - np.maximum(hour, start[shift])).astype('int64')
+    earned = cash[shift] * seconds / duration[shift]
+
+    # Часы от 1970-01-01 (четверг, день 3 при понедельнике = 0)
+    hours = hour.astype('int64')
+    slot = ((hours // HOURS + 3) % DAYS) * HOURS + hours % HOURS
+    size = DAYS * HOURS
+    return (np.bincount(slot, weights=earned, minlength=size).reshape(DAYS, HOURS),
+            np.bincount(slot, weights=seconds, minlength=size).reshape(DAYS, HOURS))
+
+
+def build(shifts):
+    """Карта по строкам смен из хранилища (учитываются только завершённые)"""
+    done = [shift for shift in shifts
+            if not shift['is_active'] and shift['end_time'] and shift['start_time']]
+    cash, seconds = spread([shift['start_time'] for shift in done],
+                           [shift['end_time'] for shift in done],
+                           [shift['cash'] or 0 for shift in done])
+    return {'cash': cash.tolist(), 'seconds': seconds.tolist(), 'shifts': len(done)}
+
+
+def rates(heatmap, min_seconds=MIN_SECONDS):
+    """Средний заработок в час по ячейкам 7×24 (NaN - мало данных)"""
+    cash = np.asarray(heatmap['cash'])
+    seconds = np.asarray(heatmap['seconds'])
+    result = np.full((DAYS, HOURS), np.nan)
+    enough = seconds >= min_seconds
+    result[enough] = cash[enough] / (seconds[enough] / 3600)
+    return result
+
+
+def best_hours(heatmap, limit=5, min_seconds=MIN_SECONDS):
+    """Лучшие ячейки: [(день недели 0-6, час, руб/час, отработано часов)]"""
+    hourly = rates(heatmap, min_seconds)
+    seconds = np.asarray(heatmap['seconds'])
+    known = np.flatnonzero(~np.isnan(hourly))
+    top = known[np.argsort(-hourly.ravel()[known], kind='stable')[:limit]]
+    return [(int(slot // HOURS), int(slot % HOURS), int(hourly.ravel()[slot]),
+             round(float(seconds.ravel()[slot]) / 3600, 1)) for slot in top]
+
+
+def best_hours_of_day(heatmap, limit=3, min_seconds=MIN_SECONDS):
+    """Лучшие часы суток без учёта дня недели: [(час, руб/час)]"""
+    cash = np.asarray(heatmap['cash']).sum(axis=0)
+    seconds = np.asarray(heatmap['seconds']).sum(axis=0)
+    known = np.flatnonzero(seconds >= min_seconds)
+    hourly = cash[known] / (seconds[known] / 3600)
+    order = np.argsort(-hourly, kind='stable')[:limit]
+    return [(int(known[i]), int(hourly[i])) for i in order]
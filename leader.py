@@ -0,0 +1,105 @@
+"""Выбор ведущей реплики для фоновых задач (напоминания о паузах, обслуживание).
+
+Ведущая та реплика, что держит advisory-lock PostgreSQL на отдельном
+соединении. Если она падает или теряет соединение, блокировка снимается
+сама, и её забирает другая реплика при следующей попытке (раз в
+LEADER_RETRY_SECONDS). Со встроенным SQLite реплика одна - она всегда ведущая.
+"""
+import hashlib
+import logging
+import os
+import threading
+
+import psycopg2
+
+logger = logging.getLogger('taxi_bot.leader')
+
+RETRY_SECONDS = float(os.environ.get('LEADER_RETRY_SECONDS', '10'))
+
+
+def lock_key(name):
+    """64-битный ключ advisory-lock по имени задачи"""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+class LeaderElection:
+    """Поток, который держит или пытается взять блокировку name"""
+
+    def __init__(self, dsn, name='taxi_bot_background_jobs', retry_seconds=RETRY_SECONDS):
+        self.dsn = dsn
+        self.name = name
+        self.key = lock_key(name)
+        self.retry_seconds = retry_seconds
+        self.elections = 0
+        self._is_leader = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self._is_leader.is_set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name='leader-election')
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        conn = None
+        while not self._stop.is_set():
+            try:
+                if conn is None or conn.closed:
+                    conn = psycopg2.connect(self.dsn)
+                    conn.autocommit = True
+                cur = conn.cursor()
+                if self.is_leader:
+                    # Блокировка живёт, пока живо соединение - проверяем его
+                    cur.execute("SELECT 1")
+                else:
+                    cur.execute("SELECT pg_try_advisory_lock(%s)", (self.key,))
+                    if cur.fetchone()[0]:
+                        self._is_leader.set()
+                        self.elections += 1
+                        logger.info("👑 Эта реплика ведущая для %s", self.name)
+                cur.close()
+            except Exception as e:
+                if self.is_leader:
+                    logger.warning("⚠️ Потеряно соединение ведущей реплики, уступаем: %s", e)
+                else:
+                    logger.warning("⚠️ Ошибка выбора ведущей реплики: %s", e)
+                self._is_leader.clear()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+            self._stop.wait(self.retry_seconds)
+        self._is_leader.clear()
+        if conn is not None:
+            conn.close()
+
+    def status(self):
+        return {'is_leader': self.is_leader, 'elections': self.elections, 'lock_key': self.key}
+
+
+class SingleNode:
+    """Одна реплика (SQLite): всегда ведущая"""
+
+    is_leader = True
+    elections = 1
+
+    def start(self):
+        return None
+
+    def is_alive(self):
+        return True
+
+    def status(self):
+        return {'is_leader': True, 'single_node': True}
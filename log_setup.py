@@ -0,0 +1,40 @@
+"""Настройка логирования бота.
+
+Обработчики пишут в очередь (QueueHandler), а вывод в stdout делает
+отдельный поток QueueListener - запись лога не блокирует обработку апдейта.
+Уровень задаётся LOG_LEVEL (по умолчанию INFO); построчная трассировка
+каждого сообщения идёт на уровне DEBUG.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s'
+
+_listener = None
+
+
+def configure_logging(name='taxi_bot'):
+    """Настраивает логгер name с неблокирующей очередью; повторный вызов ничего не меняет"""
+    global _listener
+    logger = logging.getLogger(name)
+    if _listener is not None:
+        return logger
+
+    level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    logger.setLevel(level)
+    logger.propagate = False
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Дописываем очередь при остановке процесса
+    atexit.register(_listener.stop)
+    return logger
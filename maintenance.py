@@ -0,0 +1,105 @@
+"""Периодическое обслуживание БД; выполняет ведущая реплика (bot.start_background_jobs).
+
+Зависшие смены (ждут ввода кассы больше суток) закрываются пачками по
+MAINTENANCE_BATCH_SIZE строк с коротким statement_timeout: блокировки держатся
+на немногих строках и недолго. Что не успели за проход (MAINTENANCE_MAX_BATCHES
+пачек), закроет следующий.
+
+Смены, идущие дольше LONG_SHIFT_HOURS, только находятся: они попадают в лог и
+метрики, а закрывать их - дело водителя или администратора.
+
+Там же создаются будущие помесячные секции shifts и архивируются старые
+(partitions.py; для SQLite ничего не делается).
+"""
+import logging
+import os
+import time
+from datetime import timedelta
+
+import metrics
+
+logger = logging.getLogger('taxi_bot.maintenance')
+
+BATCH_SIZE = int(os.environ.get('MAINTENANCE_BATCH_SIZE', '100'))
+MAX_BATCHES = int(os.environ.get('MAINTENANCE_MAX_BATCHES', '20'))
+STATEMENT_TIMEOUT_MS = int(os.environ.get('MAINTENANCE_STATEMENT_TIMEOUT_MS', '2000'))
+LONG_SHIFT_HOURS = float(os.environ.get('LONG_SHIFT_HOURS', '16'))
+
+# Итоги последнего прохода (для /metrics и /ready)
+last_run = {}
+
+
+def close_stale_shifts(db, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES, timeout_ms=STATEMENT_TIMEOUT_MS):
+    """Закрывает зависшие смены пачками; возвращает (закрытые [(id, driver_id)], число пачек)"""
+    closed = []
+    batches = 0
+    while batches < max_batches:
+        batch = db.cleanup_stale_shifts(limit=batch_size, timeout_ms=timeout_ms)
+        batches += 1
+        closed.extend(batch)
+        metrics.record_maintenance('stale_shifts', len(batch))
+        if len(batch) < batch_size:
+            break
+    return closed, batches
+
+
+def run(db, now):
+    """Один проход обслуживания; now - московское время без пояса"""
+    report = {'started_at': now, 'succeeded': True}
+
+    started = time.perf_counter()
+    try:
+        closed, batches = close_stale_shifts(db)
+        report['stale_closed'] = len(closed)
+        report['stale_batches'] = batches
+        if closed:
+            logger.info("🔄 Закрыто %s зависших смен за %s пач.: %s", len(closed), batches, closed)
+        else:
+            logger.debug("✅ Нет зависших смен для закрытия")
+    except Exception as e:
+        # Например, statement_timeout: оставшееся закроет следующий проход
+        report['succeeded'] = False
+        report['stale_error'] = str(e)
+        metrics.record_maintenance('stale_shifts', error=True)
+        logger.warning("⚠️ Ошибка при закрытии зависших смен: %s", e, exc_info=True)
+    metrics.record_maintenance_seconds('stale_shifts', time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        long_running = db.long_running_shifts(now - timedelta(hours=LONG_SHIFT_HOURS), limit=BATCH_SIZE)
+        report['long_running'] = len(long_running)
+        if long_running:
+            logger.warning("⏳ Смен дольше %s ч: %s (%s)", LONG_SHIFT_HOURS, len(long_running),
+                           [(row['id'], row['driver_id']) for row in long_running])
+    except Exception as e:
+        report['succeeded'] = False
+        report['long_running_error'] = str(e)
+        metrics.record_maintenance('long_running_shifts', error=True)
+        logger.warning("⚠️ Ошибка при поиске долгих смен: %s", e, exc_info=True)
+    metrics.record_maintenance_seconds('long_running_shifts', time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        created = db.ensure_partitions(now.date())
+        archived = db.archive_old_partitions(now.date())
+        report['partitions_created'] = len(created)
+        report['partitions_archived'] = len(archived)
+        metrics.record_maintenance('partitions', len(created))
+        metrics.record_maintenance('archive', sum(count for _, count in archived))
+    except Exception as e:
+        report['succeeded'] = False
+        report['partitions_error'] = str(e)
+        metrics.record_maintenance('partitions', error=True)
+        logger.warning("⚠️ Ошибка при обслуживании секций: %s", e, exc_info=True)
+    metrics.record_maintenance_seconds('partitions', time.perf_counter() - started)
+
+    last_run.clear()
+    last_run.update(report)
+    return report
+
+
+def status():
+    """Итоги последнего прохода в виде, пригодном для JSON"""
+    if not last_run:
+        return {'runs': 0}
+    return dict(last_run, started_at=last_run['started_at'].isoformat())
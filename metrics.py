@@ -0,0 +1,297 @@
+"""Метрики бота: обращения к БД и Telegram на апдейт, задержки обработчиков.
+
+Счётчики и гистограммы хранятся в памяти процесса и отдаются Flask-маршрутом
+/metrics в текстовом формате Prometheus. Подпись handler берётся из контекста
+потока: его выставляет track_handler (обработчики бота) и handler_context
+(webhook, фоновые проверки).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import psycopg2.extensions
+
+# Границы гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы гистограмм "обращений на апдейт"
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30)
+
+NO_HANDLER = 'none'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, label_values=(), amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, label_values=()):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series['counts'][index] += 1
+                break
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                bucket_labels = _labels(self.labels + ('le',), label_values + (_format_bound(bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _labels(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append(f"{self.name}_bucket{inf_labels} {series['count']}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {series['count']}")
+        return lines
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+_lock = threading.Lock()
+
+UPDATES = Counter('taxi_bot_handler_calls_total', "Вызовы обработчиков", ('handler',))
+HANDLER_ERRORS = Counter('taxi_bot_handler_errors_total', "Исключения в обработчиках", ('handler',))
+HANDLER_SECONDS = Histogram('taxi_bot_handler_seconds', "Время обработчика", ('handler',))
+DB_CONNECTS = Counter('taxi_bot_db_connects_total', "Подключения к PostgreSQL", ('handler',))
+DB_CONNECT_SECONDS = Histogram('taxi_bot_db_connect_seconds', "Время подключения к PostgreSQL", ('handler',))
+DB_QUERIES = Counter('taxi_bot_db_queries_total', "Запросы к PostgreSQL", ('handler',))
+DB_QUERY_SECONDS = Histogram('taxi_bot_db_query_seconds', "Время запроса к PostgreSQL", ('handler',))
+DB_COMMITS = Counter('taxi_bot_db_commits_total', "Коммиты в PostgreSQL", ('handler',))
+CACHE_REQUESTS = Counter('taxi_bot_cache_requests_total', "Чтения общего кэша", ('cache', 'result'))
+DB_READS = Counter('taxi_bot_db_reads_total', "Чтения отчётов и планов: реплика или основная БД", ('handler', 'target'))
+MAINTENANCE_ROWS = Counter('taxi_bot_maintenance_rows_total', "Строки, изменённые обслуживанием БД", ('task',))
+MAINTENANCE_ERRORS = Counter('taxi_bot_maintenance_errors_total', "Ошибки обслуживания БД", ('task',))
+MAINTENANCE_SECONDS = Histogram('taxi_bot_maintenance_seconds', "Время задачи обслуживания БД", ('task',))
+TELEGRAM_CALLS = Counter('taxi_bot_telegram_calls_total', "Вызовы Bot API", ('handler', 'method'))
+TELEGRAM_ERRORS = Counter('taxi_bot_telegram_errors_total', "Ошибки вызовов Bot API", ('handler', 'method'))
+TELEGRAM_SECONDS = Histogram('taxi_bot_telegram_seconds', "Время вызова Bot API", ('method',))
+DB_ROUND_TRIPS_PER_CALL = Histogram(
+    'taxi_bot_handler_db_round_trips', "Обращений к БД (подключения + запросы + коммиты) за вызов обработчика",
+    ('handler',), buckets=COUNT_BUCKETS
+)
+TELEGRAM_CALLS_PER_CALL = Histogram(
+    'taxi_bot_handler_telegram_calls', "Вызовов Bot API за вызов обработчика",
+    ('handler',), buckets=COUNT_BUCKETS
+)
+
+ALL_METRICS = [
+    UPDATES, HANDLER_ERRORS, HANDLER_SECONDS, DB_ROUND_TRIPS_PER_CALL, TELEGRAM_CALLS_PER_CALL,
+    DB_CONNECTS, DB_CONNECT_SECONDS, DB_QUERIES, DB_QUERY_SECONDS, DB_COMMITS, DB_READS,
+    CACHE_REQUESTS, MAINTENANCE_ROWS, MAINTENANCE_ERRORS, MAINTENANCE_SECONDS,
+    TELEGRAM_CALLS, TELEGRAM_ERRORS, TELEGRAM_SECONDS,
+]
+
+
+# --- Контекст текущего обработчика ---
+_context = threading.local()
+
+
+def current_handler():
+    return getattr(_context, 'handler', NO_HANDLER)
+
+
+def _bump(name):
+    """Увеличивает счётчик обращений текущего обработчика (для гистограмм на вызов)"""
+    tally = getattr(_context, 'tally', None)
+    if tally is not None:
+        tally[name] += 1
+
+
+@contextmanager
+def handler_context(name, is_handler=False):
+    """Подписывает обращения к БД и Telegram внутри блока именем name.
+
+    Вложенные контексты считаются отдельно: в синхронном режиме webhook
+    видит все обращения апдейта, а обработчик внутри него - только свои.
+    """
+    saved = dict(_context.__dict__)
+    _context.handler = name
+    _context.in_handler = is_handler or saved.get('in_handler', False)
+    _context.tally = {'db': 0, 'telegram': 0}
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        with _lock:
+            HANDLER_ERRORS.inc((name,))
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        tally = _context.tally
+        with _lock:
+            UPDATES.inc((name,))
+            HANDLER_SECONDS.observe(elapsed, (name,))
+            DB_ROUND_TRIPS_PER_CALL.observe(tally['db'], (name,))
+            TELEGRAM_CALLS_PER_CALL.observe(tally['telegram'], (name,))
+        outer_tally = saved.get('tally')
+        if outer_tally is not None:
+            for key, value in tally.items():
+                outer_tally[key] += value
+        _context.__dict__.clear()
+        _context.__dict__.update(saved)
+
+
+def track_handler(func):
+    """Декоратор обработчика бота: считает вызовы, время и обращения к БД/Telegram.
+
+    Обработчик, вызванный из другого обработчика (например, send_welcome
+    из handle_buttons), учитывается в вызвавшем.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_context, 'in_handler', False):
+            return func(*args, **kwargs)
+        with handler_context(func.__name__, is_handler=True):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# --- PostgreSQL ---
+_cursor_classes = {}
+
+
+def _instrumented_cursor_class(base):
+    cls = _cursor_classes.get(base)
+    if cls is not None:
+        return cls
+
+    def execute(self, query, vars=None):
+        handler = current_handler()
+        started = time.perf_counter()
+        try:
+            return base.execute(self, query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            with _lock:
+                DB_QUERIES.inc((handler,))
+                DB_QUERY_SECONDS.observe(elapsed, (handler,))
+            _bump('db')
+
+    cls = type('Instrumented' + base.__name__, (base,), {'execute': execute})
+    _cursor_classes[base] = cls
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Соединение, которое записывает запросы и коммиты в метрики"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _instrumented_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        with _lock:
+            DB_COMMITS.inc((current_handler(),))
+        _bump('db')
+        return super().commit()
+
+
+def connect(dsn):
+    """psycopg2.connect с метриками подключения, запросов и коммитов"""
+    handler = current_handler()
+    started = time.perf_counter()
+    conn = psycopg2.connect(dsn, connection_factory=InstrumentedConnection)
+    elapsed = time.perf_counter() - started
+    with _lock:
+        DB_CONNECTS.inc((handler,))
+        DB_CONNECT_SECONDS.observe(elapsed, (handler,))
+    _bump('db')
+    return conn
+
+
+def record_read(target):
+    """Куда ушло чтение: replica, primary (реплики нет) или primary_after_write"""
+    with _lock:
+        DB_READS.inc((current_handler(), target))
+
+
+def record_cache(cache_name, result):
+    """Результат обращения к кэшу: hit, miss или error"""
+    with _lock:
+        CACHE_REQUESTS.inc((cache_name, result))
+
+
+def record_maintenance(task, rows=0, error=False):
+    """Итог шага обслуживания: изменённые строки или ошибка"""
+    with _lock:
+        if error:
+            MAINTENANCE_ERRORS.inc((task,))
+        else:
+            MAINTENANCE_ROWS.inc((task,), rows)
+
+
+def record_maintenance_seconds(task, seconds):
+    with _lock:
+        MAINTENANCE_SECONDS.observe(seconds, (task,))
+
+
+# --- Telegram ---
+def track_telegram(method_name, func):
+    """Оборачивает метод бота (например, bot.send_message) счётчиком и таймером"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        handler = current_handler()
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            with _lock:
+                TELEGRAM_ERRORS.inc((handler, method_name))
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with _lock:
+                TELEGRAM_CALLS.inc((handler, method_name))
+                TELEGRAM_SECONDS.observe(elapsed, (method_name,))
+            _bump('telegram')
+    return wrapper
+
+
+def render_prometheus(extra_gauges=None):
+    """Все метрики в текстовом формате Prometheus; extra_gauges - {имя: (описание, значение)}"""
+    lines = []
+    with _lock:
+        for metric in ALL_METRICS:
+            lines.extend(metric.render())
+    for name, (help_text, value) in (extra_gauges or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,283 @@
+"""Помесячные секции таблицы shifts (PostgreSQL) и архив старых месяцев.
+
+shifts секционирована по start_time: секция shifts_ГГГГ_ММ на каждый месяц и
+shifts_default для смен вне созданных месяцев. Секции на MONTHS_AHEAD месяцев
+вперёд создают init_schema и периодическое обслуживание (maintenance.py).
+Несекционированную таблицу init_schema переводит одной транзакцией
+(SHIFTS_PARTITIONING=0 - оставить как есть).
+
+Первичный ключ секционированной таблицы - (id, start_time), поэтому внешний
+ключ shift_edits -> shifts невозможен: историю правок удалённых смен удаляет
+триггер shifts_delete_edits.
+
+Хранение: при SHIFTS_RETENTION_MONTHS > 0 секции старше стольких месяцев
+отсоединяются, смены и их правки выгружаются в SHIFTS_ARCHIVE_DIR
+(shifts_ГГГГ_ММ.csv.gz, shift_edits_ГГГГ_ММ.csv.gz), а секция удаляется.
+Выгруженные месяцы перечислены в shift_archives, админка читает файлы по
+запросу. Каталог архива должен быть доступен и боту, и админке.
+"""
+import gzip
+import logging
+import os
+import re
+from datetime import date
+
+import leader
+
+logger = logging.getLogger('taxi_bot.partitions')
+
+ENABLED = os.environ.get('SHIFTS_PARTITIONING', '1') != '0'
+MONTHS_AHEAD = int(os.environ.get('SHIFTS_PARTITION_MONTHS_AHEAD', '3'))
+RETENTION_MONTHS = int(os.environ.get('SHIFTS_RETENTION_MONTHS', '0'))
+ARCHIVE_DIR = os.environ.get('SHIFTS_ARCHIVE_DIR', 'archive')
+
+DEFAULT_PARTITION = 'shifts_default'
+PARTITION_RE = re.compile(r'^shifts_(\d{4})_(\d{2})$')
+
+
+# --- Месяцы ---
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"shifts_{month.year}_{month.month:02d}"
+
+
+def partition_month(name):
+    """Месяц секции по имени (None - не помесячная секция)"""
+    match = PARTITION_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+# --- Секции ---
+def is_partitioned(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('shifts')")
+    row = cur.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions(cur):
+    """Имена секций shifts"""
+    cur.execute('''
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'shifts'::regclass
+        ORDER BY child.relname
+    ''')
+    return [row[0] for row in cur.fetchall()]
+
+
+def create_partition(cur, month):
+    """Создаёт секцию месяца; False - уже есть или не удалось"""
+    name = partition_name(month)
+    bounds = (month, add_months(month, 1))
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    if cur.fetchone()[0]:
+        return False
+    cur.execute("SAVEPOINT create_partition")
+    try:
+        cur.execute("SELECT to_regclass(%s)", (DEFAULT_PARTITION,))
+        in_default = False
+        if cur.fetchone()[0]:
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+                        f"WHERE start_time >= %s AND start_time < %s)", bounds)
+            in_default = cur.fetchone()[0]
+        if in_default:
+            # Смены этого месяца уже попали в shifts_default - переносим их в новую
+            # секцию и только потом присоединяем её
+            cur.execute(f"CREATE TABLE {name} (LIKE shifts INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cur.execute(f'''
+                WITH moved AS (
+                    DELETE FROM {DEFAULT_PARTITION}
+                    WHERE start_time >= %s AND start_time < %s
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            ''', bounds)
+            logger.info("🔄 Из %s в %s перенесено смен: %s", DEFAULT_PARTITION, name, cur.rowcount)
+            cur.execute(f"ALTER TABLE shifts ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+        else:
+            cur.execute(f'''
+                CREATE TABLE {name} PARTITION OF shifts
+                FOR VALUES FROM (%s) TO (%s)
+            ''', bounds)
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT create_partition")
+        logger.warning("⚠️ Секция %s не создана: %s", name, e)
+        return False
+    cur.execute("RELEASE SAVEPOINT create_partition")
+    logger.info("✅ Создана секция %s", name)
+    return True
+
+
+def ensure_partitions(cur, today, months_ahead=MONTHS_AHEAD, retention_months=RETENTION_MONTHS):
+    """Секции с текущего месяца на months_ahead вперёд и для месяцев, чьи смены
+    попали в shifts_default (кроме уже подлежащих архивации); возвращает созданные"""
+    first = month_start(today)
+    months = {add_months(first, offset) for offset in range(months_ahead + 1)}
+    cur.execute("SELECT to_regclass(%s)", (DEFAULT_PARTITION,))
+    if cur.fetchone()[0]:
+        cur.execute(f"SELECT DISTINCT date_trunc('month', start_time)::DATE FROM {DEFAULT_PARTITION}")
+        oldest_kept = add_months(first, -retention_months) if retention_months > 0 else date.min
+        months.update(row[0] for row in cur.fetchall() if row[0] >= oldest_kept)
+    return [partition_name(month) for month in sorted(months) if create_partition(cur, month)]
+
+
+def migrate(cur, today, months_ahead=MONTHS_AHEAD):
+    """Переводит обычную таблицу shifts в секционированную (в текущей транзакции);
+    возвращает число перенесённых смен"""
+    cur.execute("LOCK TABLE shifts, shift_edits IN ACCESS EXCLUSIVE MODE")
+    cur.execute("SELECT pg_get_serial_sequence('shifts', 'id')")
+    sequence = cur.fetchone()[0]
+
+    # Внешние ключи на shifts(id) заменит триггер
+    cur.execute('''
+        SELECT conrelid::regclass::text, conname
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = 'shifts'::regclass
+    ''')
+    for table, constraint in cur.fetchall():
+        cur.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{constraint}"')
+
+    cur.execute("ALTER TABLE shifts RENAME TO shifts_unpartitioned")
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    cur.execute('''
+        CREATE TABLE shifts (LIKE shifts_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE (start_time)
+    ''')
+
+    cur.execute("SELECT MIN(start_time), MAX(start_time) FROM shifts_unpartitioned")
+    oldest, newest = cur.fetchone()
+    month = month_start(min(oldest.date(), today) if oldest else today)
+    last = add_months(month_start(today), months_ahead)
+    if newest and newest.date() > last:
+        last = month_start(newest)
+    while month <= last:
+        create_partition(cur, month)
+        month = add_months(month, 1)
+    cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF shifts DEFAULT")
+
+    cur.execute("INSERT INTO shifts SELECT * FROM shifts_unpartitioned")
+    moved = cur.rowcount
+    cur.execute("DROP TABLE shifts_unpartitioned")
+    cur.execute("ALTER TABLE shifts ADD PRIMARY KEY (id, start_time)")
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY shifts.id")
+    return moved
+
+
+def create_edits_trigger(cur):
+    """Удаление истории правок вместе со сменами (вместо ON DELETE CASCADE)"""
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION shifts_delete_edits() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM shift_edits WHERE shift_id IN (SELECT id FROM deleted_shifts);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cur.execute('''
+        SELECT 1 FROM pg_trigger
+        WHERE tgrelid = 'shifts'::regclass AND tgname = 'shifts_delete_edits'
+    ''')
+    if not cur.fetchone():
+        cur.execute('''
+            CREATE TRIGGER shifts_delete_edits
+            AFTER DELETE ON shifts
+            REFERENCING OLD TABLE AS deleted_shifts
+            FOR EACH STATEMENT EXECUTE FUNCTION shifts_delete_edits()
+        ''')
+
+
+def prepare(conn, today):
+    """Секционирование при запуске: перевод таблицы, будущие секции, таблица архивов"""
+    cur = conn.cursor()
+    # Реплики стартуют одновременно - переводит таблицу одна
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (leader.lock_key('shifts_partitioning'),))
+    if not is_partitioned(cur):
+        moved = migrate(cur, today)
+        logger.info("✅ Таблица shifts секционирована по месяцам, перенесено смен: %s", moved)
+    create_edits_trigger(cur)
+    ensure_partitions(cur, today)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS shift_archives (
+            month DATE PRIMARY KEY,
+            shifts_file TEXT NOT NULL,
+            edits_file TEXT NOT NULL,
+            shifts_count INTEGER NOT NULL,
+            edits_count INTEGER NOT NULL,
+            total_cash BIGINT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    cur.close()
+
+
+# --- Архив ---
+def _export(cur, query, path):
+    """COPY запроса в CSV.gz; файл появляется целиком или не появляется"""
+    partial = path + '.partial'
+    with gzip.open(partial, 'wb') as output:
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", output)
+    os.replace(partial, path)
+
+
+def archive_partition(conn, month, archive_dir=ARCHIVE_DIR):
+    """Отсоединяет секцию месяца, выгружает её и удаляет; возвращает число смен"""
+    name = partition_name(month)
+    shifts_file = os.path.join(archive_dir, f"{name}.csv.gz")
+    edits_file = os.path.join(archive_dir, f"shift_edits_{month.year}_{month.month:02d}.csv.gz")
+    os.makedirs(archive_dir, exist_ok=True)
+
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM shift_archives WHERE month = %s", (month,))
+        if cur.fetchone():
+            # Файлы месяца уже есть - не перезаписываем их
+            raise RuntimeError(f"Месяц {month:%m.%Y} уже в архиве, а секция {name} снова есть")
+        cur.execute(f"ALTER TABLE shifts DETACH PARTITION {name}")
+        cur.execute(f"SELECT COUNT(*), COALESCE(SUM(cash), 0) FROM {name}")
+        shifts_count, total_cash = cur.fetchone()
+        _export(cur, f"SELECT * FROM {name} ORDER BY id", shifts_file)
+        _export(cur, f"SELECT * FROM shift_edits WHERE shift_id IN (SELECT id FROM {name}) ORDER BY id",
+                edits_file)
+        cur.execute(f"DELETE FROM shift_edits WHERE shift_id IN (SELECT id FROM {name})")
+        edits_count = cur.rowcount
+        # DROP не вызывает триггеров - индексы итогов водителей месяца сбрасываем сами
+        cur.execute(f"DELETE FROM driver_day_index WHERE driver_id IN (SELECT driver_id FROM {name})")
+        cur.execute(f"DROP TABLE {name}")
+        cur.execute('''
+            INSERT INTO shift_archives (month, shifts_file, edits_file, shifts_count, edits_count, total_cash)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        ''', (month, shifts_file, edits_file, shifts_count, edits_count, total_cash))
+        conn.commit()
+    except Exception:
+        # Секция остаётся на месте (DETACH откатывается вместе с транзакцией)
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    logger.info("🗄 Секция %s выгружена в архив: %s смен, %s правок", name, shifts_count, edits_count)
+    return shifts_count
+
+
+def archive_old_partitions(conn, today, retention_months=RETENTION_MONTHS, archive_dir=ARCHIVE_DIR):
+    """Архивирует секции старше retention_months месяцев; возвращает [(месяц, смен)]"""
+    if retention_months <= 0:
+        return []
+    cur = conn.cursor()
+    oldest_kept = add_months(month_start(today), -retention_months)
+    months = sorted(month for month in map(partition_month, list_partitions(cur))
+                    if month is not None and month < oldest_kept)
+    cur.close()
+    conn.commit()
+    return [(month, archive_partition(conn, month, archive_dir)) for month in months]
@@ -0,0 +1,177 @@
+"""Выборочное профилирование обработчиков бота (cProfile).
+
+Включается без передеплоя: переменной PROFILE_SAMPLE_EVERY при старте или
+POST /debug/profile во время работы. Профилируется каждый N-й апдейт:
+фильтры в потоке webhook и обработчик в потоке пула telebot. Профили
+суммируются по имени обработчика и сохраняются в PROFILE_DIR.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# Сохранять профили на диск после каждого такого числа выборок
+FLUSH_EVERY = int(os.environ.get('PROFILE_FLUSH_EVERY', '20'))
+
+logger = logging.getLogger('taxi_bot.profiling')
+
+_lock = threading.Lock()
+# cProfile нельзя запускать в нескольких потоках сразу - одновременно профилируем один вызов
+_active = threading.Lock()
+_active_thread = None
+
+_settings = {'sample_every': int(os.environ.get('PROFILE_SAMPLE_EVERY', '0'))}
+_seen = 0
+_stats = {}
+_samples = {}
+_unflushed = 0
+_skipped_busy = 0
+
+
+def configure(sample_every):
+    """Каждый sample_every-й апдейт профилируется; 0 - выключено"""
+    global _seen
+    with _lock:
+        _settings['sample_every'] = max(0, int(sample_every))
+        _seen = 0
+    if sample_every:
+        logger.info("🔬 Профилирование: каждый %s-й апдейт", sample_every)
+    else:
+        logger.info("🔬 Профилирование выключено")
+
+
+def should_sample():
+    """Решает, профилировать ли очередной апдейт (1 из N)"""
+    global _seen
+    every = _settings['sample_every']
+    if not every:
+        return False
+    with _lock:
+        _seen += 1
+        return _seen % every == 0
+
+
+def _add_profile(name, profile):
+    global _unflushed
+    with _lock:
+        if name in _stats:
+            _stats[name].add(profile)
+        else:
+            _stats[name] = pstats.Stats(profile)
+        _samples[name] = _samples.get(name, 0) + 1
+        _unflushed += 1
+        flush_now = _unflushed >= FLUSH_EVERY
+    if flush_now:
+        flush()
+
+
+@contextmanager
+def profile_block(name):
+    """Профилирует блок и добавляет результат к сводному профилю name"""
+    global _skipped_busy, _active_thread
+    if _active_thread == threading.get_ident():
+        # Уже внутри профиля этого потока (синхронный режим: обработчик внутри webhook)
+        yield
+        return
+    if not _active.acquire(blocking=False):
+        with _lock:
+            _skipped_busy += 1
+        yield
+        return
+    _active_thread = threading.get_ident()
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+    finally:
+        _active_thread = None
+        _active.release()
+    _add_profile(name, profile)
+
+
+@contextmanager
+def sample_update(update):
+    """Для выбранного апдейта профилирует блок webhook и помечает сообщение для обработчика"""
+    message = getattr(update, 'message', None)
+    if message is None or not should_sample():
+        yield
+        return
+    message.profile_sample = True
+    with profile_block('webhook'):
+        yield
+
+
+def profile_sampled(func):
+    """Декоратор обработчика: профилирует вызов, если апдейт попал в выборку"""
+    @wraps(func)
+    def wrapper(message, *args, **kwargs):
+        if not getattr(message, 'profile_sample', False):
+            return func(message, *args, **kwargs)
+        with profile_block(func.__name__):
+            return func(message, *args, **kwargs)
+    return wrapper
+
+
+def flush():
+    """Сохраняет сводные профили в PROFILE_DIR/<имя>.prof"""
+    global _unflushed
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with _lock:
+        for name, stats in _stats.items():
+            stats.dump_stats(profile_path(name))
+        _unflushed = 0
+
+
+def reset():
+    """Сбрасывает накопленные профили (в памяти и на диске)"""
+    global _unflushed, _skipped_busy
+    with _lock:
+        for name in _stats:
+            path = profile_path(name)
+            if os.path.exists(path):
+                os.remove(path)
+        _stats.clear()
+        _samples.clear()
+        _unflushed = 0
+        _skipped_busy = 0
+
+
+def profile_path(name):
+    return os.path.join(PROFILE_DIR, f"{name}.prof")
+
+
+def has_profile(name):
+    with _lock:
+        return name in _stats
+
+
+def summary():
+    with _lock:
+        return {
+            'sample_every': _settings['sample_every'],
+            'profiles': dict(_samples),
+            'skipped_busy': _skipped_busy,
+            'directory': os.path.abspath(PROFILE_DIR),
+            'generated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+
+def report_text(name, sort='cumulative', limit=40):
+    """Текстовый отчёт pstats по сводному профилю"""
+    buffer = io.StringIO()
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            return None
+        stats.stream = buffer
+        stats.sort_stats(sort).print_stats(limit)
+    return buffer.getvalue()
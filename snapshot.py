@@ -0,0 +1,247 @@
+"""Колоночный снимок смен для аналитики админки.
+
+Статистика и экспорт админки считаются по снимку, а не по рабочей БД бота.
+Снимок - каталог с колонками в файлах .npy (NumPy), которые читаются через
+memory mapping: страница статистики не копирует данные в память процесса.
+
+Обновление инкрементальное: из БД (лучше с реплики) берутся смены с id больше
+последнего и смены с updated_at не старше последней синхронизации (минус
+UPDATED_OVERLAP - на случай долгих транзакций). Удалённые смены находятся по
+списку id, только если число смен в БД не совпало со снимком. Новое поколение
+колонок пишется в свой подкаталог, затем атомарно подменяется meta.json -
+читатели всегда видят целый снимок.
+
+    python -m snapshot            # одно обновление (для cron)
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import clock
+
+logger = logging.getLogger('taxi_bot.snapshot')
+
+SNAPSHOT_DIR = os.environ.get('ADMIN_SNAPSHOT_DIR', 'snapshot')
+# Перекрытие окна updated_at: транзакция, начатая раньше синхронизации,
+# может закоммититься позже неё
+UPDATED_OVERLAP = timedelta(minutes=5)
+
+# Колонка -> тип NumPy; NULL в числовых колонках хранится как 0
+COLUMNS = {
+    'id': 'int64',
+    'driver_id': 'int64',
+    'start_time': 'datetime64[us]',
+    'end_time': 'datetime64[us]',
+    'duration_seconds': 'int64',
+    'cash': 'int64',
+    'hourly_rate': 'int64',
+    'is_active': 'bool',
+}
+
+
+class Snapshot:
+    """Открытый снимок: колонки - массивы NumPy только для чтения"""
+
+    def __init__(self, directory, meta, columns):
+        self.directory = directory
+        self.meta = meta
+        self.columns = columns
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @property
+    def synced_at(self):
+        return datetime.fromisoformat(self.meta['synced_at'])
+
+    def age_seconds(self, now=None):
+        return ((now or clock.now()) - self.synced_at).total_seconds()
+
+    def frame(self, mask=None):
+        """DataFrame из колонок (с маской - только подходящие строки)"""
+        return pd.DataFrame({name: (values if mask is None else values[mask])
+                             for name, values in self.columns.items()})
+
+
+# --- Чтение ---
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, 'meta.json')) as meta_file:
+            return json.load(meta_file)
+    except FileNotFoundError:
+        return None
+
+
+def load(directory=SNAPSHOT_DIR):
+    """Текущий снимок (None - ещё не создан)"""
+    meta = _read_meta(directory)
+    if meta is None:
+        return None
+    generation = os.path.join(directory, meta['generation'])
+    columns = {name: np.load(os.path.join(generation, f"{name}.npy"), mmap_mode='r')
+               for name in COLUMNS}
+    return Snapshot(directory, meta, columns)
+
+
+# --- Обновление ---
+def _fetch(cur, query, params):
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    arrays = {}
+    for index, (name, dtype) in enumerate(COLUMNS.items()):
+        values = [row[index] for row in rows]
+        if dtype in ('int64', 'bool'):
+            values = [value or 0 for value in values]
+        arrays[name] = np.array(values, dtype=dtype)
+    return arrays, [row[len(COLUMNS)] for row in rows]
+
+
+def _write_generation(directory, arrays):
+    generation = f"g{time.time_ns()}"
+    path = os.path.join(directory, generation)
+    os.makedirs(path)
+    for name, values in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), values)
+    return generation
+
+
+def _swap_meta(directory, meta):
+    partial = os.path.join(directory, 'meta.json.partial')
+    with open(partial, 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(partial, os.path.join(directory, 'meta.json'))
+
+
+def _drop_old_generations(directory, keep):
+    # Предыдущее поколение оставляем: его ещё может читать открытая страница
+    generations = sorted(name for name in os.listdir(directory)
+                         if name.startswith('g') and os.path.isdir(os.path.join(directory, name)))
+    for name in generations[:-keep]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def refresh(conn, directory=SNAPSHOT_DIR):
+    """Дополняет снимок изменениями из БД; возвращает сводку обновления"""
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    previous = load(directory)
+    select = f"SELECT {', '.join(COLUMNS)}, updated_at FROM shifts"
+
+    # Своя транзакция: все запросы обновления видят одно состояние БД
+    conn.rollback()
+    cur = conn.cursor()
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0), NOW()::TIMESTAMP FROM shifts")
+    total, max_id, db_now = cur.fetchone()
+
+    if previous is None:
+        changes, updated = _fetch(cur, select + " WHERE id <= %s ORDER BY id", (max_id,))
+        merged = changes
+        summary = {'mode': 'full', 'fetched': len(changes['id']), 'deleted': 0}
+    else:
+        since = datetime.fromisoformat(previous.meta['updated_at']) - UPDATED_OVERLAP
+        changes, updated = _fetch(
+            cur, select + " WHERE id <= %s AND (id > %s OR updated_at > %s) ORDER BY id",
+            (max_id, previous.meta['max_id'], since)
+        )
+        # Старые версии изменённых смен заменяем новыми
+        keep = ~np.isin(previous['id'], changes['id'])
+        merged = {name: np.concatenate([previous[name][keep], changes[name]]) for name in COLUMNS}
+        order = np.argsort(merged['id'], kind='stable')
+        merged = {name: values[order] for name, values in merged.items()}
+        summary = {'mode': 'incremental', 'fetched': len(changes['id']), 'deleted': 0}
+
+    if len(merged['id']) != total:
+        # Часть смен удалена (или вынесена в архив) - сверяем список id
+        cur.execute("SELECT id FROM shifts WHERE id <= %s", (max_id,))
+        present = np.fromiter((row[0] for row in cur), dtype='int64')
+        alive = np.isin(merged['id'], present)
+        summary['deleted'] = int((~alive).sum())
+        merged = {name: values[alive] for name, values in merged.items()}
+    cur.close()
+    conn.commit()
+
+    watermark = max([value for value in updated if value is not None], default=None)
+    if previous is not None:
+        previous_watermark = datetime.fromisoformat(previous.meta['updated_at'])
+        watermark = max(watermark, previous_watermark) if watermark else previous_watermark
+    meta = {
+        'generation': _write_generation(directory, merged),
+        'rows': len(merged['id']),
+        'max_id': int(max_id),
+        'updated_at': (watermark or db_now).isoformat(),
+        'synced_at': clock.now().isoformat(),
+    }
+    _swap_meta(directory, meta)
+    _drop_old_generations(directory, keep=2)
+
+    summary.update(rows=meta['rows'], seconds=round(time.perf_counter() - started, 3))
+    logger.info("📸 Снимок смен обновлён: %s", summary)
+    return summary
+
+
+# --- Аналитика ---
+def general_stats(snap, now):
+    """Показатели страницы общей статистики, векторно по снимку"""
+    cash = snap['cash']
+    hourly = snap['hourly_rate']
+    start_days = snap['start_time'].astype('datetime64[D]')
+
+    recent = snap['start_time'] >= np.datetime64(now - timedelta(days=7))
+    days, day_index = np.unique(start_days[recent], return_inverse=True)
+    day_counts = np.bincount(day_index, minlength=len(days))
+    day_cash = np.bincount(day_index, weights=cash[recent], minlength=len(days))
+    daily = [(day.astype(object), int(count), int(total))
+             for day, count, total in zip(days[::-1], day_counts[::-1], day_cash[::-1])]
+
+    drivers, driver_index = np.unique(snap['driver_id'], return_inverse=True)
+    driver_counts = np.bincount(driver_index, minlength=len(drivers))
+    driver_cash = np.bincount(driver_index, weights=cash, minlength=len(drivers))
+    top = np.argsort(-driver_cash, kind='stable')[:5]
+
+    paid = hourly > 0
+    return {
+        'total_shifts': len(snap),
+        'active_shifts': int(snap['is_active'].sum()),
+        'total_cash': int(cash.sum()),
+        'avg_hourly': float(hourly[paid].mean()) if paid.any() else None,
+        'daily': daily,
+        'drivers': [(int(drivers[i]), int(driver_counts[i]), int(driver_cash[i])) for i in top],
+    }
+
+
+def filter_mask(snap, driver_id=None, start_date=None, end_date=None):
+    """Маска смен водителя за период [start_date, end_date]"""
+    mask = np.ones(len(snap), dtype=bool)
+    if driver_id:
+        mask &= snap['driver_id'] == driver_id
+    if start_date:
+        mask &= snap['start_time'] >= np.datetime64(start_date, 'D')
+    if end_date:
+        mask &= snap['start_time'] < np.datetime64(end_date, 'D') + np.timedelta64(1, 'D')
+    return mask
+
+
+def main():
+    import psycopg2
+    logging.basicConfig(level=logging.INFO)
+    # Снимок лучше читать с реплики
+    dsn = os.environ.get('READ_DATABASE_URL') or os.environ['DATABASE_URL']
+    conn = psycopg2.connect(dsn)
+    try:
+        print(refresh(conn))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""Хранилище данных бота.
+
+Бэкенд выбирается по DATABASE_URL: sqlite:///путь/к/файлу - встроенный
+SQLite, всё остальное - PostgreSQL. Для PostgreSQL можно указать реплику
+для чтений (READ_DATABASE_URL). Планы и итоги по дням кэшируются
+(CachedStorage, кэш из модуля cache).
+"""
+from storage.base import ShiftStorage
+from storage.cached import CachedStorage
+from storage.postgres import PostgresStorage
+from storage.sqlite import SQLiteStorage
+
+SQLITE_PREFIX = 'sqlite:///'
+
+
+def get_storage(database_url, read_database_url=None, read_after_write_seconds=30, cached=True):
+    """Хранилище для DATABASE_URL (реплика для чтений - только у PostgreSQL)"""
+    if database_url and database_url.startswith(SQLITE_PREFIX):
+        storage = SQLiteStorage(database_url[len(SQLITE_PREFIX):])
+    else:
+        storage = PostgresStorage(database_url, read_database_url, read_after_write_seconds)
+    return CachedStorage(storage) if cached else storage
+
+
+__all__ = ['ShiftStorage', 'CachedStorage', 'PostgresStorage', 'SQLiteStorage', 'get_storage']
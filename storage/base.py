@@ -0,0 +1,183 @@
+"""Интерфейс хранилища смен, правок и планов"""
+import logging
+
+import heatmap
+from daily_index import DailyIndex
+
+logger = logging.getLogger('taxi_bot.storage')
+
+
+class ShiftStorage:
+    """Все операции бота с данными.
+
+    Время передаётся как datetime; с часовым поясом или без - хранилище
+    сохраняет московское "настенное" время без пояса, как колонки TIMESTAMP.
+    Строки возвращаются словарями (ключи - имена колонок).
+    """
+
+    name = 'base'
+
+    # --- Схема и служебное ---
+    def init_schema(self):
+        """Создаёт таблицы и индексы, если их нет"""
+        raise NotImplementedError
+
+    def ping(self):
+        """Проверка доступности (для /ready)"""
+        raise NotImplementedError
+
+    def enable_notifications(self, channel, node_id):
+        """Оповещать другие реплики о записях водителей; по умолчанию не умеет (один узел)"""
+
+    # --- Смены ---
+    def get_active_shift(self, driver_id):
+        """Последняя активная смена водителя или None"""
+        raise NotImplementedError
+
+    def active_driver_ids(self):
+        """ID водителей с активной сменой"""
+        raise NotImplementedError
+
+    def start_shift(self, driver_id, start_time):
+        """Закрывает старые активные смены водителя и создаёт новую; возвращает ID"""
+        raise NotImplementedError
+
+    def update_pause(self, driver_id, is_paused, pause_start_time, now):
+        """Ставит активную смену на паузу или снимает с неё (пауза копится до now)"""
+        raise NotImplementedError
+
+    def paused_shifts(self, paused_before):
+        """Активные смены на паузе, начатой не позже paused_before:
+        driver_id, pause_start_time, last_pause_reminder_minutes"""
+        raise NotImplementedError
+
+    def claim_pause_reminder(self, driver_id, pause_start_time, previous_minutes, minutes):
+        """Отмечает напоминание о паузе (minutes), если его ещё никто не отметил;
+        True - напоминание за этим вызовом"""
+        raise NotImplementedError
+
+    def set_awaiting_cash(self, driver_id, awaiting, end_time=None):
+        """Флаг ожидания кассы у активной смены (при установке - вместе с end_time)"""
+        raise NotImplementedError
+
+    def complete_shift(self, driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate):
+        """Завершает активную смену; возвращает её ID или None, если активной смены нет"""
+        raise NotImplementedError
+
+    def add_shift(self, driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate):
+        """Добавляет завершённую смену; возвращает ID"""
+        raise NotImplementedError
+
+    def cleanup_stale_shifts(self, limit=None, timeout_ms=None):
+        """Закрывает смены, ждущие ввода кассы больше суток (не больше limit за раз,
+        с ограничением времени запроса timeout_ms, где оно поддерживается);
+        возвращает [(id, driver_id)]"""
+        raise NotImplementedError
+
+    def long_running_shifts(self, started_before, limit=100):
+        """Активные смены, начатые раньше started_before: id, driver_id, start_time"""
+        raise NotImplementedError
+
+    def ensure_partitions(self, today):
+        """Создаёт помесячные секции смен наперёд; возвращает имена созданных"""
+        return []
+
+    def archive_old_partitions(self, today):
+        """Выгружает в архив секции старше срока хранения; возвращает [(месяц, смен)]"""
+        return []
+
+    def get_driver_shifts(self, driver_id):
+        """Все смены водителя в порядке создания"""
+        raise NotImplementedError
+
+    def driver_heatmap(self, driver_id):
+        """Карта заработка водителя по часам недели (heatmap.build по всем его сменам)"""
+        return heatmap.build(self.get_driver_shifts(driver_id))
+
+    def shifts_grouped_by_date(self, driver_id, period_start, period_end):
+        """Итоги водителя по дням за [period_start, period_end), новые дни первыми"""
+        raise NotImplementedError
+
+    def delete_driver_data(self, first_driver_id, last_driver_id):
+        """Удаляет смены и планы водителей из диапазона [first, last) (тесты, симуляции)"""
+        raise NotImplementedError
+
+    # --- Итоги по дням (daily_index.py) ---
+    def daily_totals(self, driver_id):
+        """Итоги завершённых смен водителя по дням: [(день, смен, секунд, касса, max id)]"""
+        raise NotImplementedError
+
+    def completed_shifts_version(self, driver_id):
+        """(число, max id) завершённых смен, которые учитывает индекс"""
+        raise NotImplementedError
+
+    def load_daily_index(self, driver_id):
+        """Сохранённый индекс водителя (DailyIndex.to_record) или None"""
+        raise NotImplementedError
+
+    def save_daily_index(self, driver_id, record, previous_last_id=None):
+        """Сохраняет индекс; возвращает, сохранён ли он. С previous_last_id - только поверх
+        той же версии (индекс могли сбросить правкой), без него - только если индекса нет"""
+        raise NotImplementedError
+
+    def drop_daily_index(self, driver_id):
+        """Сбрасывает индекс водителя - следующее чтение его перестроит"""
+        raise NotImplementedError
+
+    def daily_index(self, driver_id):
+        """Индекс водителя; если его нет или он сброшен - перестраивается по сменам"""
+        record = self.load_daily_index(driver_id)
+        if record is not None:
+            return DailyIndex.from_record(record)
+        index = DailyIndex.from_totals(self.daily_totals(driver_id))
+        if self.save_daily_index(driver_id, index.to_record()) and \
+                self.completed_shifts_version(driver_id) != (index.shift_count, index.last_id):
+            # Пока строили, завершилась смена: её дописывание индекса не нашло, и без
+            # сброса она пропала бы из итогов до следующей правки
+            self.drop_daily_index(driver_id)
+        return index
+
+    def index_completed_shift(self, driver_id, shift_id, day, duration_seconds, cash):
+        """Дописывает завершённую смену в индекс водителя (после complete_shift).
+
+        add_shift сюда не обращается: вставку завершённой смены ловит триггер и
+        сбрасывает индекс - следующее чтение его перестроит."""
+        try:
+            record = self.load_daily_index(driver_id)
+            if record is None:
+                # Индекса нет - его построит первое чтение, уже вместе с этой сменой
+                return
+            index = DailyIndex.from_record(record)
+            if index.add(shift_id, day, duration_seconds, cash) and \
+                    not self.save_daily_index(driver_id, index.to_record(), previous_last_id=record['last_id']):
+                # Индекс изменили параллельно - надёжнее перестроить
+                self.drop_daily_index(driver_id)
+        except Exception as e:
+            # Смена уже сохранена - индекс не должен ломать её завершение
+            logger.warning("⚠️ Не удалось дописать смену %s в индекс водителя %s: %s",
+                           shift_id, driver_id, e, exc_info=True)
+
+    # --- Правки смен ---
+    def add_shift_edit(self, shift_id, editor_id, reason, old_values, new_values):
+        """Запись в журнал правок; old_values/new_values - словари
+        start_time/end_time/cash/hourly_rate"""
+        raise NotImplementedError
+
+    def get_shift_edits(self, shift_id):
+        """Журнал правок смены, новые сверху"""
+        raise NotImplementedError
+
+    # --- Планы ---
+    def get_monthly_plan(self, driver_id, year, month):
+        raise NotImplementedError
+
+    def save_monthly_plan(self, driver_id, amount, year, month):
+        """Создаёт или обновляет план; возвращает ID"""
+        raise NotImplementedError
+
+    def get_weekly_plan(self, driver_id, week_year, week_number):
+        raise NotImplementedError
+
+    def save_weekly_plan(self, driver_id, amount, week_year, week_number):
+        """Создаёт или обновляет план; возвращает ID"""
+        raise NotImplementedError
@@ -0,0 +1,211 @@
+"""Кэширующая обёртка над хранилищем: планы, итоги по дням и карта по часам.
+
+Чтения планов и итогов сначала идут в кэш (cache.get_cache()), записи
+сбрасывают ключи водителя (кэш общий для реплик бота, поэтому ключи не
+дописываются на месте, а удаляются). Готовые отчеты бота сбрасываются,
+только если период какого-то из них содержит день смены.
+Остальные операции передаются хранилищу как есть.
+"""
+
+import cache as cache_module
+from storage.base import ShiftStorage
+
+
+def _period(period_start, period_end):
+    return [period_start.replace(tzinfo=None).isoformat(), period_end.replace(tzinfo=None).isoformat()]
+
+
+class CachedStorage(ShiftStorage):
+    """Хранилище inner с кэшем планов и итогов по дням"""
+
+    def __init__(self, inner, cache=None):
+        self.inner = inner
+        self.name = inner.name
+        self._cache = cache
+
+    @property
+    def cache(self):
+        return self._cache or cache_module.get_cache()
+
+    def __getattr__(self, attr):
+        # Всё, что не кэшируется, - напрямую во внутреннее хранилище
+        return getattr(self.inner, attr)
+
+    def invalidate_driver(self, driver_id):
+        self.cache.delete(cache_module.summary_key(driver_id), cache_module.heatmap_key(driver_id),
+                          cache_module.reports_key(driver_id))
+
+    def _drop_reports(self, driver_id, day):
+        """Сбрасывает отчеты водителя, если период хотя бы одного содержит день day
+        (ключ удаляется целиком: перезапись остатка потеряла бы сброс другой реплики)"""
+        key = cache_module.reports_key(driver_id)
+        reports = self.cache.get(key)
+        day = day.isoformat()
+        if reports and any(report['first_day'] <= day <= report['last_day'] for report in reports.values()):
+            self.cache.delete(key)
+
+    def _shift_completed(self, driver_id, shift_id, start_time):
+        self.cache.delete(cache_module.summary_key(driver_id), cache_module.heatmap_key(driver_id))
+        if shift_id is None:
+            # Неизвестно, что записалось - отчеты построим заново
+            self.cache.delete(cache_module.reports_key(driver_id))
+            return
+        # День смены - по началу, как в итогах по дням
+        self._drop_reports(driver_id, start_time.date())
+
+    # --- Схема и служебное ---
+    def init_schema(self):
+        return self.inner.init_schema()
+
+    def ping(self):
+        return self.inner.ping()
+
+    def enable_notifications(self, channel, node_id):
+        return self.inner.enable_notifications(channel, node_id)
+
+    # --- Смены ---
+    def get_active_shift(self, driver_id):
+        return self.inner.get_active_shift(driver_id)
+
+    def active_driver_ids(self):
+        return self.inner.active_driver_ids()
+
+    def start_shift(self, driver_id, start_time):
+        return self.inner.start_shift(driver_id, start_time)
+
+    def update_pause(self, driver_id, is_paused, pause_start_time, now):
+        return self.inner.update_pause(driver_id, is_paused, pause_start_time, now)
+
+    def paused_shifts(self, paused_before):
+        return self.inner.paused_shifts(paused_before)
+
+    def claim_pause_reminder(self, driver_id, pause_start_time, previous_minutes, minutes):
+        return self.inner.claim_pause_reminder(driver_id, pause_start_time, previous_minutes, minutes)
+
+    def set_awaiting_cash(self, driver_id, awaiting, end_time=None):
+        return self.inner.set_awaiting_cash(driver_id, awaiting, end_time)
+
+    def complete_shift(self, driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate):
+        shift_id = None
+        try:
+            shift_id = self.inner.complete_shift(driver_id, start_time, end_time, duration_text,
+                                                 duration_seconds, cash, hourly_rate)
+            return shift_id
+        finally:
+            self._shift_completed(driver_id, shift_id, start_time)
+
+    def add_shift(self, driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate):
+        shift_id = None
+        try:
+            shift_id = self.inner.add_shift(driver_id, start_time, end_time, duration_text,
+                                            duration_seconds, cash, hourly_rate)
+            return shift_id
+        finally:
+            self._shift_completed(driver_id, shift_id, start_time)
+
+    def cleanup_stale_shifts(self, limit=None, timeout_ms=None):
+        cleaned = self.inner.cleanup_stale_shifts(limit, timeout_ms)
+        for _, driver_id in cleaned:
+            self.invalidate_driver(driver_id)
+        return cleaned
+
+    def long_running_shifts(self, started_before, limit=100):
+        return self.inner.long_running_shifts(started_before, limit)
+
+    def ensure_partitions(self, today):
+        return self.inner.ensure_partitions(today)
+
+    def archive_old_partitions(self, today):
+        # Архивируются только прошлые месяцы - закэшированных итогов текущего это не меняет
+        return self.inner.archive_old_partitions(today)
+
+    def get_driver_shifts(self, driver_id):
+        return self.inner.get_driver_shifts(driver_id)
+
+    def driver_heatmap(self, driver_id):
+        key = cache_module.heatmap_key(driver_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.inner.driver_heatmap(driver_id)
+        self.cache.set(key, result, cache_module.HEATMAP_TTL)
+        return result
+
+    def shifts_grouped_by_date(self, driver_id, period_start, period_end):
+        key = cache_module.summary_key(driver_id)
+        period = _period(period_start, period_end)
+        cached = self.cache.get(key)
+        if cached is not None and cached['period'] == period:
+            return cached['rows']
+        rows = [dict(row) for row in self.inner.shifts_grouped_by_date(driver_id, period_start, period_end)]
+        self.cache.set(key, {'period': period, 'rows': rows}, cache_module.SUMMARY_TTL)
+        return rows
+
+    def delete_driver_data(self, first_driver_id, last_driver_id):
+        self.inner.delete_driver_data(first_driver_id, last_driver_id)
+        # Диапазон может быть огромным - сбрасываем весь локальный кэш, если это он
+        if hasattr(self.cache, 'clear'):
+            self.cache.clear()
+
+    # --- Итоги по дням (индекс хранится в БД, в кэш не кладётся) ---
+    def daily_totals(self, driver_id):
+        return self.inner.daily_totals(driver_id)
+
+    def completed_shifts_version(self, driver_id):
+        return self.inner.completed_shifts_version(driver_id)
+
+    def load_daily_index(self, driver_id):
+        return self.inner.load_daily_index(driver_id)
+
+    def save_daily_index(self, driver_id, record, previous_last_id=None):
+        return self.inner.save_daily_index(driver_id, record, previous_last_id)
+
+    def drop_daily_index(self, driver_id):
+        return self.inner.drop_daily_index(driver_id)
+
+    def daily_index(self, driver_id):
+        return self.inner.daily_index(driver_id)
+
+    def index_completed_shift(self, driver_id, shift_id, day, duration_seconds, cash):
+        return self.inner.index_completed_shift(driver_id, shift_id, day, duration_seconds, cash)
+
+    # --- Правки смен ---
+    def add_shift_edit(self, shift_id, editor_id, reason, old_values, new_values):
+        return self.inner.add_shift_edit(shift_id, editor_id, reason, old_values, new_values)
+
+    def get_shift_edits(self, shift_id):
+        return self.inner.get_shift_edits(shift_id)
+
+    # --- Планы ---
+    def get_monthly_plan(self, driver_id, year, month):
+        key = cache_module.monthly_plan_key(driver_id, year, month)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached['plan']
+        plan = self.inner.get_monthly_plan(driver_id, year, month)
+        plan = dict(plan) if plan is not None else None
+        # Отсутствие плана тоже кэшируем - меню плана открывают чаще, чем сохраняют план
+        self.cache.set(key, {'plan': plan}, cache_module.PLAN_TTL)
+        return plan
+
+    def save_monthly_plan(self, driver_id, amount, year, month):
+        try:
+            return self.inner.save_monthly_plan(driver_id, amount, year, month)
+        finally:
+            self.cache.delete(cache_module.monthly_plan_key(driver_id, year, month))
+
+    def get_weekly_plan(self, driver_id, week_year, week_number):
+        key = cache_module.weekly_plan_key(driver_id, week_year, week_number)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached['plan']
+        plan = self.inner.get_weekly_plan(driver_id, week_year, week_number)
+        plan = dict(plan) if plan is not None else None
+        self.cache.set(key, {'plan': plan}, cache_module.PLAN_TTL)
+        return plan
+
+    def save_weekly_plan(self, driver_id, amount, week_year, week_number):
+        try:
+            return self.inner.save_weekly_plan(driver_id, amount, week_year, week_number)
+        finally:
+            self.cache.delete(cache_module.weekly_plan_key(driver_id, week_year, week_number))
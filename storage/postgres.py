@@ -0,0 +1,739 @@
+"""Хранилище в PostgreSQL (основной режим бота).
+
+Если задан read_dsn (READ_DATABASE_URL), отчёты, планы и журнал правок
+читаются с реплики, а смены пишутся и читаются на основной БД. Сразу после
+записи водителя (завершение смены, план) его чтения на время
+read_after_write_seconds идут на основную БД, чтобы он увидел свои данные
+даже при отставании реплики.
+
+После enable_notifications() каждая запись смены или плана водителя
+отправляет в той же транзакции NOTIFY "<узел> <driver_id>" - по нему
+другие реплики бота сбрасывают своё состояние водителя (cluster.py).
+
+Таблица shifts секционирована по месяцам (partitions.py).
+"""
+import logging
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import clock
+import metrics
+import partitions
+from storage.base import ShiftStorage
+
+logger = logging.getLogger('taxi_bot.storage')
+
+
+def naive(dt):
+    """Московское время без пояса - так его хранят колонки TIMESTAMP"""
+    if dt is not None and dt.tzinfo is not None:
+        return dt.replace(tzinfo=None)
+    return dt
+
+
+class PostgresStorage(ShiftStorage):
+    """Каждая операция - отдельное подключение к DATABASE_URL (или к реплике для чтений)"""
+
+    name = 'postgres'
+
+    def __init__(self, dsn, read_dsn=None, read_after_write_seconds=30):
+        self.dsn = dsn
+        self.read_dsn = read_dsn or None
+        self.read_after_write_seconds = read_after_write_seconds
+        # driver_id -> момент (monotonic), до которого его чтения идут на основную БД
+        self._recent_writes = {}
+        self._lock = threading.Lock()
+        self.notify_channel = None
+        self.node_id = ''
+
+    def enable_notifications(self, channel, node_id):
+        """Записи водителей будут сопровождаться NOTIFY channel"""
+        self.notify_channel = channel
+        self.node_id = node_id
+
+    def _notify(self, cur, driver_ids):
+        if self.notify_channel and driver_ids:
+            cur.execute("SELECT pg_notify(%s, %s || ' ' || d) FROM unnest(%s::BIGINT[]) d",
+                        (self.notify_channel, self.node_id, list(driver_ids)))
+
+    def connect(self):
+        """Подключение к PostgreSQL (с записью в метрики)"""
+        return metrics.connect(self.dsn)
+
+    def _mark_written(self, driver_id):
+        if not self.read_dsn:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[driver_id] = now + self.read_after_write_seconds
+            if len(self._recent_writes) > 1000:
+                self._recent_writes = {key: until for key, until in self._recent_writes.items() if until > now}
+
+    def _read_target(self, driver_id=None):
+        if not self.read_dsn:
+            return 'primary'
+        if driver_id is not None:
+            with self._lock:
+                until = self._recent_writes.get(driver_id)
+            if until is not None and until > time.monotonic():
+                return 'primary_after_write'
+        return 'replica'
+
+    def connect_read(self, driver_id=None):
+        """Подключение для чтения: реплика, если она есть и водитель недавно ничего не записывал"""
+        target = self._read_target(driver_id)
+        if target == 'replica':
+            try:
+                conn = metrics.connect(self.read_dsn)
+                metrics.record_read(target)
+                return conn
+            except psycopg2.OperationalError as e:
+                # Реплика недоступна - читаем с основной БД
+                logger.warning("⚠️ Реплика недоступна, читаем с основной БД: %s", e)
+                target = 'primary_fallback'
+        metrics.record_read(target)
+        return self.connect()
+
+    def _fetchone(self, query, params=(), dict_rows=True, commit=False, conn=None, notify=()):
+        conn = conn or self.connect()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor) if dict_rows else conn.cursor()
+            cur.execute(query, params)
+            row = cur.fetchone() if cur.description else None
+            self._notify(cur, notify)
+            if commit:
+                conn.commit()
+            cur.close()
+            return row
+        finally:
+            conn.close()
+
+    def _fetchall(self, query, params=(), dict_rows=True, commit=False, conn=None, notify=()):
+        conn = conn or self.connect()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor) if dict_rows else conn.cursor()
+            cur.execute(query, params)
+            rows = cur.fetchall() if cur.description else []
+            if notify == 'returned':
+                # Водители из RETURNING (второй столбец)
+                notify = [row[1] for row in rows]
+            self._notify(cur, notify)
+            if commit:
+                conn.commit()
+            cur.close()
+            return rows
+        finally:
+            conn.close()
+
+    # --- Схема и служебное ---
+    def init_schema(self):
+        """Создаёт таблицы если их нет"""
+        conn = self.connect()
+        cur = conn.cursor()
+
+        # Создаем базовую таблицу (без новых полей для обратной совместимости)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS shifts (
+                id SERIAL PRIMARY KEY,
+                driver_id BIGINT NOT NULL,
+                start_time TIMESTAMP NOT NULL,
+                end_time TIMESTAMP NOT NULL,
+                duration_text VARCHAR(50),
+                duration_seconds INTEGER,
+                cash INTEGER NOT NULL CHECK (cash >= 0),
+                hourly_rate INTEGER CHECK (hourly_rate >= 0),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # СОЗДАЕМ ТАБЛИЦУ ДЛЯ АДМИНКИ (ДОБАВЬ ЭТОТ БЛОК)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS shift_edits (
+                id SERIAL PRIMARY KEY,
+                shift_id INTEGER NOT NULL REFERENCES shifts(id) ON DELETE CASCADE,
+                editor_id BIGINT NOT NULL,
+                edited_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reason TEXT,
+                old_start_time TIMESTAMP,
+                new_start_time TIMESTAMP,
+                old_end_time TIMESTAMP,
+                new_end_time TIMESTAMP,
+                old_cash INTEGER,
+                new_cash INTEGER,
+                old_hourly_rate INTEGER,
+                new_hourly_rate INTEGER
+            )
+        ''')
+
+            # Создаем таблицу месячных планов
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS monthly_plans (
+                id SERIAL PRIMARY KEY,
+                driver_id BIGINT NOT NULL,
+                target_amount INTEGER NOT NULL CHECK (target_amount >= 0),
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL CHECK (month >= 1 AND month <= 12),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(driver_id, year, month)
+            )
+        ''')
+        # Накопленные итоги водителей по дням (daily_index.py)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS driver_day_index (
+                driver_id BIGINT PRIMARY KEY,
+                first_day DATE,
+                last_id BIGINT NOT NULL DEFAULT 0,
+                sums BYTEA NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Создаем таблицу недельных планов
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS weekly_plans (
+                id SERIAL PRIMARY KEY,
+                driver_id BIGINT NOT NULL,
+                target_amount INTEGER NOT NULL CHECK (target_amount >= 0),
+                week_year INTEGER NOT NULL,  -- Год недели по ISO
+                week_number INTEGER NOT NULL CHECK (week_number >= 1 AND week_number <= 53),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(driver_id, week_year, week_number)
+            )
+        ''')
+
+        conn.commit()
+        logger.info("✅ База данных инициализирована (базовая структура)")
+
+        # Теперь добавляем новые поля если их нет
+        logger.debug("🔧 Проверяем наличие новых полей...")
+
+        # Список полей для добавления
+        new_columns = [
+            ('is_active', 'BOOLEAN DEFAULT FALSE'),
+            ('is_paused', 'BOOLEAN DEFAULT FALSE'),
+            ('pause_start_time', 'TIMESTAMP'),
+            ('pause_duration_seconds', 'INTEGER DEFAULT 0'),
+            ('awaiting_cash_input', 'BOOLEAN DEFAULT FALSE'),
+            ('last_pause_reminder_minutes', 'INTEGER DEFAULT 0'),
+            ('updated_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+        ]
+
+        for column_name, column_type in new_columns:
+            try:
+                cur.execute(f'''
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name='shifts' AND column_name='{column_name}'
+                ''')
+
+                if not cur.fetchone():
+                    logger.info("Добавляем поле %s...", column_name)
+                    cur.execute(f'ALTER TABLE shifts ADD COLUMN {column_name} {column_type}')
+                    conn.commit()
+                    logger.info("✅ Поле %s добавлено", column_name)
+                else:
+                    logger.debug("✅ Поле %s уже существует", column_name)
+
+            except Exception as e:
+                logger.warning("⚠️ Ошибка при добавлении поля %s: %s", column_name, e, exc_info=True)
+                conn.rollback()
+
+        # Помесячные секции shifts (индексы ниже создаются на всю секционированную таблицу)
+        if partitions.ENABLED:
+            try:
+                partitions.prepare(conn, clock.now().date())
+            except Exception as e:
+                logger.warning("⚠️ Ошибка при секционировании shifts: %s", e, exc_info=True)
+                conn.rollback()
+
+        # Создаем индексы (после добавления всех полей)
+        logger.debug("🔧 Создаем индексы...")
+
+        try:
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_shifts_driver_id 
+                ON shifts(driver_id)
+            ''')
+            logger.debug("✅ Индекс idx_shifts_driver_id создан")
+        except Exception as e:
+            logger.warning("⚠️ Ошибка при создании idx_shifts_driver_id: %s", e, exc_info=True)
+
+        try:
+            # Проверяем есть ли уже поле is_active перед созданием индекса
+            cur.execute('''
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name='shifts' AND column_name='is_active'
+            ''')
+
+            if cur.fetchone():
+                cur.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_shifts_active 
+                    ON shifts(driver_id, is_active) 
+                    WHERE is_active = TRUE
+                ''')
+                logger.debug("✅ Индекс idx_shifts_active создан")
+            else:
+                logger.info("⏭️ Поле is_active отсутствует, индекс не создан")
+        except Exception as e:
+            logger.warning("⚠️ Ошибка при создании idx_shifts_active: %s", e, exc_info=True)
+
+        # ДОБАВЛЯЕМ ИНДЕКС ДЛЯ shift_edits (ВАЖНО!)
+        try:
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_shift_edits_shift_id 
+                ON shift_edits(shift_id)
+            ''')
+            logger.debug("✅ Индекс idx_shift_edits_shift_id создан")
+        except Exception as e:
+            logger.warning("⚠️ Ошибка при создании idx_shift_edits_shift_id: %s", e, exc_info=True)
+
+        # updated_at - время последнего изменения смены: по нему снимок для
+        # аналитики админки (snapshot.py) забирает только изменённые смены
+        try:
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_shifts_updated_at 
+                ON shifts(updated_at)
+            ''')
+            cur.execute('''
+                CREATE OR REPLACE FUNCTION shifts_touch_updated_at() RETURNS trigger AS $$
+                BEGIN
+                    NEW.updated_at := CURRENT_TIMESTAMP;
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql
+            ''')
+            cur.execute('''
+                SELECT 1 FROM pg_trigger 
+                WHERE tgrelid = 'shifts'::regclass AND tgname = 'shifts_touch_updated_at'
+            ''')
+            if not cur.fetchone():
+                cur.execute('''
+                    CREATE TRIGGER shifts_touch_updated_at 
+                    BEFORE UPDATE ON shifts 
+                    FOR EACH ROW EXECUTE FUNCTION shifts_touch_updated_at()
+                ''')
+            logger.debug("✅ Триггер shifts_touch_updated_at создан")
+        except Exception as e:
+            logger.warning("⚠️ Ошибка при создании триггера updated_at: %s", e, exc_info=True)
+            conn.rollback()
+
+        # Уникальные индексы планов: на них опирается ON CONFLICT в save_*_plan. Таблицы,
+        # созданные вручную без UNIQUE, получают индекс с тем же именем, что дал бы UNIQUE
+        for table, index, columns in (
+            ('monthly_plans', 'monthly_plans_driver_id_year_month_key', 'driver_id, year, month'),
+            ('weekly_plans', 'weekly_plans_driver_id_week_year_week_number_key',
+             'driver_id, week_year, week_number'),
+        ):
+            try:
+                cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table}({columns})")
+                conn.commit()
+                logger.debug("✅ Индекс %s создан", index)
+            except Exception as e:
+                logger.warning("⚠️ Ошибка при создании %s: %s", index, e, exc_info=True)
+                conn.rollback()
+
+        # Вставки и правки завершённых смен (add_shift, админка, импорт, удаление) сбрасывают
+        # индекс итогов водителя; завершение смены ботом (активная -> завершённая) дописывает его само
+        try:
+            cur.execute('''
+                CREATE OR REPLACE FUNCTION shifts_drop_day_index() RETURNS trigger AS $$
+                BEGIN
+                    DELETE FROM driver_day_index
+                    WHERE driver_id IN (SELECT driver_id FROM changed_rows WHERE NOT is_active);
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+            ''')
+            for event, transition in (('INSERT', 'NEW'), ('UPDATE', 'OLD'), ('DELETE', 'OLD')):
+                trigger = f"shifts_drop_day_index_{event.lower()}"
+                cur.execute('''
+                    SELECT 1 FROM pg_trigger 
+                    WHERE tgrelid = 'shifts'::regclass AND tgname = %s
+                ''', (trigger,))
+                if not cur.fetchone():
+                    cur.execute(f'''
+                        CREATE TRIGGER {trigger} 
+                        AFTER {event} ON shifts 
+                        REFERENCING {transition} TABLE AS changed_rows 
+                        FOR EACH STATEMENT EXECUTE FUNCTION shifts_drop_day_index()
+                    ''')
+            logger.debug("✅ Триггеры shifts_drop_day_index созданы")
+        except Exception as e:
+            logger.warning("⚠️ Ошибка при создании триггеров индекса итогов: %s", e, exc_info=True)
+            conn.rollback()
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    def ping(self):
+        self._fetchone("SELECT 1", dict_rows=False)
+
+    # --- Смены ---
+    def get_active_shift(self, driver_id):
+        conn = self.connect()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+
+            # Сначала проверяем есть ли поле is_active в таблице
+            cur.execute('''
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name='shifts' AND column_name='is_active'
+            ''')
+            if not cur.fetchone():
+                logger.warning("⚠️ Поле is_active отсутствует в таблице для пользователя %s", driver_id)
+                cur.close()
+                return None
+
+            cur.execute('''
+                SELECT * FROM shifts 
+                WHERE driver_id = %s 
+                  AND is_active = TRUE 
+                ORDER BY start_time DESC 
+                LIMIT 1
+            ''', (driver_id,))
+            shift = cur.fetchone()
+            cur.close()
+            return shift
+        finally:
+            conn.close()
+
+    def active_driver_ids(self):
+        rows = self._fetchall("SELECT DISTINCT driver_id FROM shifts WHERE is_active = TRUE", dict_rows=False)
+        return [row[0] for row in rows]
+
+    def start_shift(self, driver_id, start_time):
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            # Сначала завершаем старые активные смены (на всякий случай)
+            cur.execute('''
+                UPDATE shifts 
+                SET is_active = FALSE 
+                WHERE driver_id = %s AND is_active = TRUE
+            ''', (driver_id,))
+
+            cur.execute('''
+                INSERT INTO shifts 
+                (driver_id, start_time, end_time, cash, hourly_rate, is_active)
+                VALUES (%s, %s, %s, 0, 0, TRUE)
+                RETURNING id
+            ''', (driver_id, naive(start_time), naive(start_time)))
+            shift_id = cur.fetchone()[0]
+            self._notify(cur, [driver_id])
+
+            conn.commit()
+            return shift_id
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def update_pause(self, driver_id, is_paused, pause_start_time, now):
+        if is_paused:
+            self._fetchone('''
+                UPDATE shifts 
+                SET is_paused = TRUE, 
+                    pause_start_time = %s,
+                    last_pause_reminder_minutes = 0
+                WHERE driver_id = %s 
+                  AND is_active = TRUE
+            ''', (naive(pause_start_time), driver_id), commit=True, notify=[driver_id])
+        else:
+            # Снимаем паузу и обновляем общее время пауз
+            self._fetchone('''
+                UPDATE shifts 
+                SET is_paused = FALSE,
+                    pause_duration_seconds = pause_duration_seconds + 
+                        EXTRACT(EPOCH FROM (%s - pause_start_time))
+                WHERE driver_id = %s 
+                  AND is_active = TRUE
+            ''', (naive(now), driver_id), commit=True, notify=[driver_id])
+
+    def paused_shifts(self, paused_before):
+        return self._fetchall('''
+            SELECT driver_id, pause_start_time, 
+                   COALESCE(last_pause_reminder_minutes, 0) AS last_pause_reminder_minutes
+            FROM shifts 
+            WHERE is_active = TRUE 
+              AND is_paused = TRUE 
+              AND pause_start_time <= %s
+        ''', (naive(paused_before),))
+
+    def claim_pause_reminder(self, driver_id, pause_start_time, previous_minutes, minutes):
+        # Сравнение с прежним значением: две реплики не отправят одно напоминание дважды
+        row = self._fetchone('''
+            UPDATE shifts 
+            SET last_pause_reminder_minutes = %s
+            WHERE driver_id = %s 
+              AND is_active = TRUE 
+              AND is_paused = TRUE 
+              AND pause_start_time = %s
+              AND COALESCE(last_pause_reminder_minutes, 0) = %s
+            RETURNING id
+        ''', (minutes, driver_id, naive(pause_start_time), previous_minutes), dict_rows=False, commit=True)
+        return row is not None
+
+    def set_awaiting_cash(self, driver_id, awaiting, end_time=None):
+        if awaiting:
+            self._fetchone('''
+                UPDATE shifts 
+                SET awaiting_cash_input = TRUE,
+                    end_time = %s
+                WHERE driver_id = %s AND is_active = TRUE
+            ''', (naive(end_time), driver_id), commit=True, notify=[driver_id])
+        else:
+            self._fetchone('''
+                UPDATE shifts 
+                SET awaiting_cash_input = FALSE
+                WHERE driver_id = %s AND is_active = TRUE
+            ''', (driver_id,), commit=True, notify=[driver_id])
+
+    def complete_shift(self, driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate):
+        row = self._fetchone('''
+            UPDATE shifts 
+            SET start_time = %s,
+                end_time = %s,
+                duration_text = %s,
+                duration_seconds = %s,
+                cash = %s,
+                hourly_rate = %s,
+                is_active = FALSE,
+                is_paused = FALSE,
+                awaiting_cash_input = FALSE
+            WHERE driver_id = %s 
+              AND is_active = TRUE
+            RETURNING id
+        ''', (naive(start_time), naive(end_time), duration_text, duration_seconds, cash, hourly_rate, driver_id),
+            dict_rows=False, commit=True, notify=[driver_id])
+        self._mark_written(driver_id)
+        if row:
+            self.index_completed_shift(driver_id, row[0], naive(start_time), duration_seconds, cash)
+        return row[0] if row else None
+
+    def add_shift(self, driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate):
+        row = self._fetchone('''
+            INSERT INTO shifts 
+            (driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        ''', (driver_id, naive(start_time), naive(end_time), duration_text, duration_seconds, cash, hourly_rate),
+            dict_rows=False, commit=True, notify=[driver_id])
+        self._mark_written(driver_id)
+        return row[0]
+
+    def cleanup_stale_shifts(self, limit=None, timeout_ms=None):
+        # Находим смены, которые ожидают ввода кассы больше 24 часов.
+        # Пачкой (limit) и без ожидания строк, занятых водителями (SKIP LOCKED)
+        query = '''
+            UPDATE shifts 
+            SET is_active = FALSE,
+                awaiting_cash_input = FALSE,
+                end_time = start_time + INTERVAL '1 hour'
+            WHERE id IN (
+                SELECT id FROM shifts
+                WHERE is_active = TRUE 
+                  AND awaiting_cash_input = TRUE
+                  AND created_at < NOW() - INTERVAL '24 hours'
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, driver_id
+        '''
+        params = (limit,)
+        if timeout_ms:
+            # SET LOCAL действует до конца транзакции - только на этот UPDATE
+            query = "SET LOCAL statement_timeout = %s;" + query
+            params = (int(timeout_ms), limit)
+        rows = self._fetchall(query, params, dict_rows=False, commit=True, notify='returned')
+        return [tuple(row) for row in rows]
+
+    def long_running_shifts(self, started_before, limit=100):
+        return self._fetchall('''
+            SELECT id, driver_id, start_time
+            FROM shifts
+            WHERE is_active = TRUE 
+              AND start_time < %s
+            ORDER BY start_time
+            LIMIT %s
+        ''', (naive(started_before), limit))
+
+    def ensure_partitions(self, today):
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            if not partitions.is_partitioned(cur):
+                return []
+            created = partitions.ensure_partitions(cur, today)
+            conn.commit()
+            cur.close()
+            return created
+        finally:
+            conn.close()
+
+    def archive_old_partitions(self, today):
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            partitioned = partitions.is_partitioned(cur)
+            cur.close()
+            conn.commit()
+            return partitions.archive_old_partitions(conn, today) if partitioned else []
+        finally:
+            conn.close()
+
+    def get_driver_shifts(self, driver_id):
+        return self._fetchall("SELECT * FROM shifts WHERE driver_id = %s ORDER BY id", (driver_id,),
+                              conn=self.connect_read(driver_id))
+
+    def shifts_grouped_by_date(self, driver_id, period_start, period_end):
+        # start_time хранится по Москве без пояса, поэтому день - просто DATE(start_time)
+        return self._fetchall('''
+            SELECT 
+                DATE(start_time) as shift_date,
+                COUNT(*) as shifts_count,
+                SUM(duration_seconds) as total_seconds,
+                SUM(cash) as total_cash,
+                CASE 
+                    WHEN SUM(duration_seconds) > 0 
+                    THEN (SUM(cash) / (SUM(duration_seconds) / 3600.0))::INTEGER
+                    ELSE 0
+                END as avg_hourly_rate
+            FROM shifts 
+            WHERE driver_id = %s 
+              AND start_time >= %s
+              AND start_time < %s
+            GROUP BY DATE(start_time)
+            ORDER BY shift_date DESC
+        ''', (driver_id, naive(period_start), naive(period_end)), conn=self.connect_read(driver_id))
+
+    def delete_driver_data(self, first_driver_id, last_driver_id):
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            for table in ('shifts', 'monthly_plans', 'weekly_plans', 'driver_day_index'):
+                cur.execute("SELECT to_regclass(%s)", (table,))
+                if cur.fetchone()[0]:
+                    cur.execute(f"DELETE FROM {table} WHERE driver_id >= %s AND driver_id < %s",
+                                (first_driver_id, last_driver_id))
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+    # --- Итоги по дням ---
+    def daily_totals(self, driver_id):
+        # С основной БД: по этим итогам индекс сохраняется, реплика может отставать
+        rows = self._fetchall('''
+            SELECT DATE(start_time), COUNT(*), SUM(duration_seconds), SUM(cash), MAX(id)
+            FROM shifts
+            WHERE driver_id = %s AND is_active = FALSE AND duration_seconds IS NOT NULL
+            GROUP BY DATE(start_time)
+        ''', (driver_id,), dict_rows=False)
+        return [tuple(row) for row in rows]
+
+    def completed_shifts_version(self, driver_id):
+        row = self._fetchone('''
+            SELECT COUNT(*), COALESCE(MAX(id), 0)
+            FROM shifts
+            WHERE driver_id = %s AND is_active = FALSE AND duration_seconds IS NOT NULL
+        ''', (driver_id,), dict_rows=False)
+        return int(row[0]), int(row[1])
+
+    def load_daily_index(self, driver_id):
+        return self._fetchone(
+            "SELECT first_day, last_id, sums FROM driver_day_index WHERE driver_id = %s", (driver_id,)
+        )
+
+    def save_daily_index(self, driver_id, record, previous_last_id=None):
+        params = (record['first_day'], record['last_id'], psycopg2.Binary(record['sums']), driver_id)
+        if previous_last_id is None:
+            query = '''
+                INSERT INTO driver_day_index (first_day, last_id, sums, driver_id)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (driver_id) DO NOTHING
+                RETURNING driver_id
+            '''
+        else:
+            query = '''
+                UPDATE driver_day_index
+                SET first_day = %s, last_id = %s, sums = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE driver_id = %s AND last_id = %s
+                RETURNING driver_id
+            '''
+            params += (previous_last_id,)
+        return self._fetchone(query, params, dict_rows=False, commit=True) is not None
+
+    def drop_daily_index(self, driver_id):
+        self._fetchone("DELETE FROM driver_day_index WHERE driver_id = %s", (driver_id,), commit=True)
+
+    # --- Правки смен ---
+    def add_shift_edit(self, shift_id, editor_id, reason, old_values, new_values):
+        row = self._fetchone('''
+            INSERT INTO shift_edits 
+            (shift_id, editor_id, reason,
+             old_start_time, new_start_time, old_end_time, new_end_time,
+             old_cash, new_cash, old_hourly_rate, new_hourly_rate)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        ''', (shift_id, editor_id, reason,
+              naive(old_values.get('start_time')), naive(new_values.get('start_time')),
+              naive(old_values.get('end_time')), naive(new_values.get('end_time')),
+              old_values.get('cash'), new_values.get('cash'),
+              old_values.get('hourly_rate'), new_values.get('hourly_rate')),
+            dict_rows=False, commit=True)
+        return row[0]
+
+    def get_shift_edits(self, shift_id):
+        return self._fetchall('''
+            SELECT * FROM shift_edits 
+            WHERE shift_id = %s 
+            ORDER BY edited_at DESC, id DESC
+        ''', (shift_id,), conn=self.connect_read())
+
+    # --- Планы ---
+    def get_monthly_plan(self, driver_id, year, month):
+        return self._fetchone('''
+            SELECT * FROM monthly_plans 
+            WHERE driver_id = %s AND year = %s AND month = %s
+        ''', (driver_id, year, month), conn=self.connect_read(driver_id))
+
+    def save_monthly_plan(self, driver_id, amount, year, month):
+        # INSERT ON CONFLICT обновляет план при повторе
+        row = self._fetchone('''
+            INSERT INTO monthly_plans (driver_id, target_amount, year, month)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (driver_id, year, month) 
+            DO UPDATE SET target_amount = EXCLUDED.target_amount,
+                         created_at = CURRENT_TIMESTAMP
+            RETURNING id
+        ''', (driver_id, amount, year, month), dict_rows=False, commit=True,
+            notify=[driver_id])
+        self._mark_written(driver_id)
+        return row[0]
+
+    def get_weekly_plan(self, driver_id, week_year, week_number):
+        return self._fetchone('''
+            SELECT * FROM weekly_plans 
+            WHERE driver_id = %s AND week_year = %s AND week_number = %s
+        ''', (driver_id, week_year, week_number), conn=self.connect_read(driver_id))
+
+    def save_weekly_plan(self, driver_id, amount, week_year, week_number):
+        row = self._fetchone('''
+            INSERT INTO weekly_plans (driver_id, target_amount, week_year, week_number)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (driver_id, week_year, week_number) 
+            DO UPDATE SET target_amount = EXCLUDED.target_amount,
+                         created_at = CURRENT_TIMESTAMP
+            RETURNING id
+        ''', (driver_id, amount, week_year, week_number), dict_rows=False, commit=True,
+            notify=[driver_id])
+        self._mark_written(driver_id)
+        return row[0]
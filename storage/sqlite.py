@@ -0,0 +1,451 @@
+"""Встроенное хранилище в SQLite (WAL) - для небольших автопарков и тестов.
+
+База - один файл рядом с ботом, без сетевых обращений:
+
+    DATABASE_URL=sqlite:///taxi_bot.sqlite3
+"""
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+from storage.base import ShiftStorage
+from storage.postgres import naive
+
+logger = logging.getLogger('taxi_bot.storage')
+
+
+def _adapt_datetime(value):
+    return naive(value).isoformat(' ')
+
+
+def _convert_timestamp(value):
+    return datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+sqlite3.register_converter('BOOLEAN', lambda value: bool(int(value)))
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS shifts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        driver_id INTEGER NOT NULL,
+        start_time TIMESTAMP NOT NULL,
+        end_time TIMESTAMP NOT NULL,
+        duration_text VARCHAR(50),
+        duration_seconds INTEGER,
+        cash INTEGER NOT NULL CHECK (cash >= 0),
+        hourly_rate INTEGER CHECK (hourly_rate >= 0),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 0,
+        is_paused BOOLEAN DEFAULT 0,
+        pause_start_time TIMESTAMP,
+        pause_duration_seconds INTEGER DEFAULT 0,
+        awaiting_cash_input BOOLEAN DEFAULT 0,
+        last_pause_reminder_minutes INTEGER DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS shift_edits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        shift_id INTEGER NOT NULL REFERENCES shifts(id) ON DELETE CASCADE,
+        editor_id INTEGER NOT NULL,
+        edited_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        reason TEXT,
+        old_start_time TIMESTAMP,
+        new_start_time TIMESTAMP,
+        old_end_time TIMESTAMP,
+        new_end_time TIMESTAMP,
+        old_cash INTEGER,
+        new_cash INTEGER,
+        old_hourly_rate INTEGER,
+        new_hourly_rate INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS monthly_plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        driver_id INTEGER NOT NULL,
+        target_amount INTEGER NOT NULL CHECK (target_amount >= 0),
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL CHECK (month >= 1 AND month <= 12),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(driver_id, year, month)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS weekly_plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        driver_id INTEGER NOT NULL,
+        target_amount INTEGER NOT NULL CHECK (target_amount >= 0),
+        week_year INTEGER NOT NULL,
+        week_number INTEGER NOT NULL CHECK (week_number >= 1 AND week_number <= 53),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(driver_id, week_year, week_number)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS driver_day_index (
+        driver_id INTEGER PRIMARY KEY,
+        first_day TEXT,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        sums BLOB NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Индексы - после добавления колонок (NEW_COLUMNS)
+    'CREATE INDEX IF NOT EXISTS idx_shifts_driver_id ON shifts(driver_id, start_time)',
+    'CREATE INDEX IF NOT EXISTS idx_shifts_active ON shifts(driver_id) WHERE is_active = 1',
+    'CREATE INDEX IF NOT EXISTS idx_shift_edits_shift_id ON shift_edits(shift_id)',
+    # Вставки и правки завершённых смен сбрасывают индекс итогов водителя (daily_index.py)
+    '''
+    CREATE TRIGGER IF NOT EXISTS shifts_drop_day_index_insert AFTER INSERT ON shifts
+    WHEN NEW.is_active = 0
+    BEGIN DELETE FROM driver_day_index WHERE driver_id = NEW.driver_id; END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS shifts_drop_day_index_update AFTER UPDATE ON shifts
+    WHEN OLD.is_active = 0
+    BEGIN DELETE FROM driver_day_index WHERE driver_id = OLD.driver_id; END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS shifts_drop_day_index_delete AFTER DELETE ON shifts
+    WHEN OLD.is_active = 0
+    BEGIN DELETE FROM driver_day_index WHERE driver_id = OLD.driver_id; END
+    ''',
+]
+
+# Колонки, добавленные после первой версии схемы: (таблица, колонка, тип)
+NEW_COLUMNS = [
+    ('shifts', 'last_pause_reminder_minutes', 'INTEGER DEFAULT 0'),
+]
+
+
+class SQLiteStorage(ShiftStorage):
+    """Одно подключение на поток; запись сериализует сам SQLite (WAL, busy_timeout)"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES,
+                                   timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            # В WAL-режиме NORMAL не теряет целостность, но не ждёт fsync на каждый коммит
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def _fetchone(self, query, params=()):
+        row = self.connect().execute(query, params).fetchone()
+        return dict(row) if row is not None else None
+
+    def _fetchall(self, query, params=()):
+        return [dict(row) for row in self.connect().execute(query, params).fetchall()]
+
+    def _write(self, query, params=()):
+        """Запрос с изменением данных в своей транзакции; возвращает все строки RETURNING"""
+        conn = self.connect()
+        with conn:
+            rows = conn.execute(query, params).fetchall()
+        return rows
+
+    # --- Схема и служебное ---
+    def init_schema(self):
+        conn = self.connect()
+        with conn:
+            tables = [statement for statement in SCHEMA if 'CREATE TABLE' in statement]
+            for statement in tables:
+                conn.execute(statement)
+            for table, column, column_type in NEW_COLUMNS:
+                existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                    logger.info("✅ Поле %s.%s добавлено", table, column)
+            for statement in SCHEMA:
+                if statement not in tables:
+                    conn.execute(statement)
+        logger.info("✅ База данных SQLite инициализирована: %s", self.path)
+
+    def ping(self):
+        self.connect().execute('SELECT 1').fetchone()
+
+    # --- Смены ---
+    def get_active_shift(self, driver_id):
+        return self._fetchone('''
+            SELECT * FROM shifts
+            WHERE driver_id = ? AND is_active = 1
+            ORDER BY start_time DESC
+            LIMIT 1
+        ''', (driver_id,))
+
+    def active_driver_ids(self):
+        rows = self.connect().execute("SELECT DISTINCT driver_id FROM shifts WHERE is_active = 1").fetchall()
+        return [row[0] for row in rows]
+
+    def start_shift(self, driver_id, start_time):
+        conn = self.connect()
+        with conn:
+            conn.execute("UPDATE shifts SET is_active = 0 WHERE driver_id = ? AND is_active = 1", (driver_id,))
+            cur = conn.execute('''
+                INSERT INTO shifts
+                (driver_id, start_time, end_time, cash, hourly_rate, is_active)
+                VALUES (?, ?, ?, 0, 0, 1)
+            ''', (driver_id, start_time, start_time))
+        return cur.lastrowid
+
+    def update_pause(self, driver_id, is_paused, pause_start_time, now):
+        if is_paused:
+            self._write('''
+                UPDATE shifts
+                SET is_paused = 1, pause_start_time = ?, last_pause_reminder_minutes = 0
+                WHERE driver_id = ? AND is_active = 1
+            ''', (pause_start_time, driver_id))
+        else:
+            # Разница julianday в сутках -> секунды
+            self._write('''
+                UPDATE shifts
+                SET is_paused = 0,
+                    pause_duration_seconds = COALESCE(pause_duration_seconds, 0) +
+                        CAST(ROUND((julianday(?) - julianday(pause_start_time)) * 86400) AS INTEGER)
+                WHERE driver_id = ? AND is_active = 1
+            ''', (naive(now), driver_id))
+
+    def paused_shifts(self, paused_before):
+        return self._fetchall('''
+            SELECT driver_id, pause_start_time,
+                   COALESCE(last_pause_reminder_minutes, 0) AS last_pause_reminder_minutes
+            FROM shifts
+            WHERE is_active = 1 AND is_paused = 1 AND pause_start_time <= ?
+        ''', (naive(paused_before),))
+
+    def claim_pause_reminder(self, driver_id, pause_start_time, previous_minutes, minutes):
+        rows = self._write('''
+            UPDATE shifts
+            SET last_pause_reminder_minutes = ?
+            WHERE driver_id = ? AND is_active = 1 AND is_paused = 1
+              AND pause_start_time = ?
+              AND COALESCE(last_pause_reminder_minutes, 0) = ?
+            RETURNING id
+        ''', (minutes, driver_id, naive(pause_start_time), previous_minutes))
+        return bool(rows)
+
+    def set_awaiting_cash(self, driver_id, awaiting, end_time=None):
+        if awaiting:
+            self._write('''
+                UPDATE shifts
+                SET awaiting_cash_input = 1, end_time = ?
+                WHERE driver_id = ? AND is_active = 1
+            ''', (end_time, driver_id))
+        else:
+            self._write('''
+                UPDATE shifts
+                SET awaiting_cash_input = 0
+                WHERE driver_id = ? AND is_active = 1
+            ''', (driver_id,))
+
+    def complete_shift(self, driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate):
+        rows = self._write('''
+            UPDATE shifts
+            SET start_time = ?,
+                end_time = ?,
+                duration_text = ?,
+                duration_seconds = ?,
+                cash = ?,
+                hourly_rate = ?,
+                is_active = 0,
+                is_paused = 0,
+                awaiting_cash_input = 0
+            WHERE driver_id = ? AND is_active = 1
+            RETURNING id
+        ''', (start_time, end_time, duration_text, duration_seconds, cash, hourly_rate, driver_id))
+        if rows:
+            self.index_completed_shift(driver_id, rows[0][0], naive(start_time), duration_seconds, cash)
+        return rows[0][0] if rows else None
+
+    def add_shift(self, driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate):
+        conn = self.connect()
+        with conn:
+            cur = conn.execute('''
+                INSERT INTO shifts
+                (driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (driver_id, start_time, end_time, duration_text, duration_seconds, cash, hourly_rate))
+        return cur.lastrowid
+
+    def cleanup_stale_shifts(self, limit=None, timeout_ms=None):
+        # created_at заполняет SQLite в UTC - сравниваем с UTC.
+        # timeout_ms не нужен: пишет один процесс, запрос ждёт только busy_timeout
+        rows = self._write('''
+            UPDATE shifts
+            SET is_active = 0,
+                awaiting_cash_input = 0,
+                end_time = datetime(start_time, '+1 hour')
+            WHERE id IN (
+                SELECT id FROM shifts
+                WHERE is_active = 1
+                  AND awaiting_cash_input = 1
+                  AND created_at < datetime('now', '-24 hours')
+                ORDER BY id
+                LIMIT ?
+            )
+            RETURNING id, driver_id
+        ''', (-1 if limit is None else limit,))
+        return [tuple(row) for row in rows]
+
+    def long_running_shifts(self, started_before, limit=100):
+        return self._fetchall('''
+            SELECT id, driver_id, start_time
+            FROM shifts
+            WHERE is_active = 1 AND start_time < ?
+            ORDER BY start_time
+            LIMIT ?
+        ''', (naive(started_before), limit))
+
+    def get_driver_shifts(self, driver_id):
+        return self._fetchall("SELECT * FROM shifts WHERE driver_id = ? ORDER BY id", (driver_id,))
+
+    def shifts_grouped_by_date(self, driver_id, period_start, period_end):
+        rows = self._fetchall('''
+            SELECT
+                date(start_time) as shift_date,
+                COUNT(*) as shifts_count,
+                SUM(duration_seconds) as total_seconds,
+                SUM(cash) as total_cash,
+                CASE
+                    WHEN SUM(duration_seconds) > 0
+                    THEN CAST(ROUND(SUM(cash) / (SUM(duration_seconds) / 3600.0)) AS INTEGER)
+                    ELSE 0
+                END as avg_hourly_rate
+            FROM shifts
+            WHERE driver_id = ?
+              AND start_time >= ?
+              AND start_time < ?
+            GROUP BY date(start_time)
+            ORDER BY shift_date DESC
+        ''', (driver_id, period_start, period_end))
+        for row in rows:
+            # Как DATE в PostgreSQL - объект date, а не строка
+            row['shift_date'] = datetime.strptime(row['shift_date'], '%Y-%m-%d').date()
+        return rows
+
+    def delete_driver_data(self, first_driver_id, last_driver_id):
+        conn = self.connect()
+        with conn:
+            for table in ('shifts', 'monthly_plans', 'weekly_plans', 'driver_day_index'):
+                conn.execute(f"DELETE FROM {table} WHERE driver_id >= ? AND driver_id < ?",
+                             (first_driver_id, last_driver_id))
+
+    # --- Итоги по дням ---
+    def daily_totals(self, driver_id):
+        rows = self.connect().execute('''
+            SELECT date(start_time), COUNT(*), SUM(duration_seconds), SUM(cash), MAX(id)
+            FROM shifts
+            WHERE driver_id = ? AND is_active = 0 AND duration_seconds IS NOT NULL
+            GROUP BY date(start_time)
+        ''', (driver_id,)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def completed_shifts_version(self, driver_id):
+        row = self.connect().execute('''
+            SELECT COUNT(*), COALESCE(MAX(id), 0)
+            FROM shifts
+            WHERE driver_id = ? AND is_active = 0 AND duration_seconds IS NOT NULL
+        ''', (driver_id,)).fetchone()
+        return int(row[0]), int(row[1])
+
+    def load_daily_index(self, driver_id):
+        return self._fetchone(
+            "SELECT first_day, last_id, sums FROM driver_day_index WHERE driver_id = ?", (driver_id,)
+        )
+
+    def save_daily_index(self, driver_id, record, previous_last_id=None):
+        first_day = record['first_day'].isoformat() if record['first_day'] else None
+        params = (first_day, record['last_id'], record['sums'], driver_id)
+        if previous_last_id is None:
+            query = '''
+                INSERT INTO driver_day_index (first_day, last_id, sums, driver_id)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (driver_id) DO NOTHING
+                RETURNING driver_id
+            '''
+        else:
+            query = '''
+                UPDATE driver_day_index
+                SET first_day = ?, last_id = ?, sums = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE driver_id = ? AND last_id = ?
+                RETURNING driver_id
+            '''
+            params += (previous_last_id,)
+        return bool(self._write(query, params))
+
+    def drop_daily_index(self, driver_id):
+        self._write("DELETE FROM driver_day_index WHERE driver_id = ?", (driver_id,))
+
+    # --- Правки смен ---
+    def add_shift_edit(self, shift_id, editor_id, reason, old_values, new_values):
+        conn = self.connect()
+        with conn:
+            cur = conn.execute('''
+                INSERT INTO shift_edits
+                (shift_id, editor_id, reason,
+                 old_start_time, new_start_time, old_end_time, new_end_time,
+                 old_cash, new_cash, old_hourly_rate, new_hourly_rate)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (shift_id, editor_id, reason,
+                  old_values.get('start_time'), new_values.get('start_time'),
+                  old_values.get('end_time'), new_values.get('end_time'),
+                  old_values.get('cash'), new_values.get('cash'),
+                  old_values.get('hourly_rate'), new_values.get('hourly_rate')))
+        return cur.lastrowid
+
+    def get_shift_edits(self, shift_id):
+        return self._fetchall('''
+            SELECT * FROM shift_edits
+            WHERE shift_id = ?
+            ORDER BY edited_at DESC, id DESC
+        ''', (shift_id,))
+
+    # --- Планы ---
+    def get_monthly_plan(self, driver_id, year, month):
+        return self._fetchone('''
+            SELECT * FROM monthly_plans
+            WHERE driver_id = ? AND year = ? AND month = ?
+        ''', (driver_id, year, month))
+
+    def save_monthly_plan(self, driver_id, amount, year, month):
+        rows = self._write('''
+            INSERT INTO monthly_plans (driver_id, target_amount, year, month)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (driver_id, year, month)
+            DO UPDATE SET target_amount = excluded.target_amount,
+                          created_at = CURRENT_TIMESTAMP
+            RETURNING id
+        ''', (driver_id, amount, year, month))
+        return rows[0][0]
+
+    def get_weekly_plan(self, driver_id, week_year, week_number):
+        return self._fetchone('''
+            SELECT * FROM weekly_plans
+            WHERE driver_id = ? AND week_year = ? AND week_number = ?
+        ''', (driver_id, week_year, week_number))
+
+    def save_weekly_plan(self, driver_id, amount, week_year, week_number):
+        rows = self._write('''
+            INSERT INTO weekly_plans (driver_id, target_amount, week_year, week_number)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (driver_id, week_year, week_number)
+            DO UPDATE SET target_amount = excluded.target_amount,
+                          created_at = CURRENT_TIMESTAMP
+            RETURNING id
+        ''', (driver_id, amount, week_year, week_number))
+        return rows[0][0]